@@ -1,5 +1,47 @@
 import pygame
 
+#scaled animation frames shared by every fighter, keyed by (sprite sheet, size, scale, animation steps, flip)
+_frame_cache = {}
+
+
+def load_frames(sprite_sheet, size, image_scale, animation_steps, flip=False):
+  #extract images from spritesheet once per process and hand out the same read-only frames afterwards
+  key = (sprite_sheet, size, image_scale, tuple(animation_steps), flip)
+  frames = _frame_cache.get(key)
+  if frames is None and flip:
+    #mirrored frames are derived from the already scaled ones
+    frames = tuple(tuple(pygame.transform.flip(img, True, False) for img in animation) for animation in load_frames(sprite_sheet, size, image_scale, animation_steps))
+    _frame_cache[key] = frames
+  elif frames is None:
+    animation_list = []
+    for y, animation in enumerate(animation_steps):
+      temp_img_list = []
+      for x in range(animation):
+        temp_img = sprite_sheet.subsurface(x * size, y * size, size, size)
+        temp_img_list.append(pygame.transform.scale(temp_img, (size * image_scale, size * image_scale)))
+      animation_list.append(tuple(temp_img_list))
+    frames = tuple(animation_list)
+    _frame_cache[key] = frames
+  return frames
+
+
+#opaque area of each cached frame, so drawing only touches pixels that can change
+_visible_rects = {}
+
+
+def get_visible_rect(img):
+  rect = _visible_rects.get(img)
+  if rect is None:
+    rect = img.get_bounding_rect()
+    _visible_rects[img] = rect
+  return rect
+
+
+def clear_frame_cache():
+  _frame_cache.clear()
+  _visible_rects.clear()
+
+
 class Fighter():
   def __init__(self, player, x, y, flip, data, sprite_sheet, animation_steps):
     self.player = player
@@ -7,10 +49,13 @@ class Fighter():
     self.image_scale = data[1]
     self.offset = data[2]
     self.flip = flip
+    self.sprite_sheet = sprite_sheet
+    self.animation_steps = animation_steps
     self.animation_list = self.load_images(sprite_sheet, animation_steps)
+    self.flipped_list = None
     self.action = 0#0:idle #1:run #2:jump #3:attack1 #4: attack2 #5:hit #6:death
     self.frame_index = 0
-    self.image = self.animation_list[self.action][self.frame_index]
+    self.image = self.get_frames()[self.action][self.frame_index]
     self.update_time = pygame.time.get_ticks()
     self.rect = pygame.Rect((x, y, 80, 180))
     self.vel_y = 0
@@ -25,15 +70,17 @@ class Fighter():
 
 
   def load_images(self, sprite_sheet, animation_steps):
-    #extract images from spritesheet
-    animation_list = []
-    for y, animation in enumerate(animation_steps):
-      temp_img_list = []
-      for x in range(animation):
-        temp_img = sprite_sheet.subsurface(x * self.size, y * self.size, self.size, self.size)
-        temp_img_list.append(pygame.transform.scale(temp_img, (self.size * self.image_scale, self.size * self.image_scale)))
-      animation_list.append(temp_img_list)
-    return animation_list
+    #frames come from the shared cache, so they must never be drawn on
+    return load_frames(sprite_sheet, self.size, self.image_scale, animation_steps)
+
+
+  def get_frames(self):
+    #mirrored frames are only built the first time a fighter faces left
+    if not self.flip:
+      return self.animation_list
+    if self.flipped_list is None:
+      self.flipped_list = load_frames(self.sprite_sheet, self.size, self.image_scale, self.animation_steps, True)
+    return self.flipped_list
 
 
   def move(self, screen_width, screen_height, surface, target, round_over):
@@ -147,7 +194,7 @@ class Fighter():
 
     animation_cooldown = 50
     #update image
-    self.image = self.animation_list[self.action][self.frame_index]
+    self.image = self.get_frames()[self.action][self.frame_index]
     #check if enough time has passed since the last update
     if pygame.time.get_ticks() - self.update_time > animation_cooldown:
       self.frame_index += 1
@@ -190,5 +237,8 @@ class Fighter():
       self.update_time = pygame.time.get_ticks()
 
   def draw(self, surface):
-    img = pygame.transform.flip(self.image, self.flip, False)
-    surface.blit(img, (self.rect.x - (self.offset[0] * self.image_scale), self.rect.y - (self.offset[1] * self.image_scale)))
\ No newline at end of file
+    #image already faces the right way, so drawing is a plain blit of its opaque area
+    visible = get_visible_rect(self.image)
+    x = self.rect.x - (self.offset[0] * self.image_scale) + visible.x
+    y = self.rect.y - (self.offset[1] * self.image_scale) + visible.y
+    return surface.blit(self.image, (x, y), visible)
\ No newline at end of file
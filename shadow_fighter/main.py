@@ -36,8 +36,9 @@ WIZARD_SCALE = 3
 WIZARD_OFFSET = [112, 107]
 WIZARD_DATA = [WIZARD_SIZE, WIZARD_SCALE, WIZARD_OFFSET]
 
-# load background image
+# load background image and scale it to the window once
 bg_image = pygame.image.load("assets/images/background/background.jpg").convert_alpha()
+scaled_bg = pygame.transform.scale(bg_image, (SCREEN_WIDTH, SCREEN_HEIGHT)).convert()
 
 # load spritesheets
 warrior_sheet = pygame.image.load("assets/images/warrior/Sprites/warrior.png").convert_alpha()
@@ -55,20 +56,31 @@ count_font = pygame.font.Font("assets/fonts/turok.ttf", 80)
 score_font = pygame.font.Font("assets/fonts/turok.ttf", 30)
 menu_font = pygame.font.Font("assets/fonts/turok.ttf", 40)
 
+# dirty rect rendering: while fighting, only the regions drawn this frame and last frame
+# are restored from the background and pushed to the display
+DIRTY_RECTS = True
+dirty_rects = []
+previous_dirty_rects = []
+last_drawn_state = None
+
 # function for drawing text
 def draw_text(text, font, text_col, x, y):
     img = font.render(text, True, text_col)
-    screen.blit(img, (x, y))
+    dirty_rects.append(screen.blit(img, (x, y)))
 
 # function for drawing background
 def draw_bg():
-    scaled_bg = pygame.transform.scale(bg_image, (SCREEN_WIDTH, SCREEN_HEIGHT))
     screen.blit(scaled_bg, (0, 0))
 
+# function for restoring the background under last frame's drawing
+def restore_bg(rects):
+    for rect in rects:
+        screen.blit(scaled_bg, rect, rect)
+
 # function for drawing fighter health bars
 def draw_health_bar(health, x, y):
     ratio = health / 100
-    pygame.draw.rect(screen, WHITE, (x - 2, y - 2, 404, 34))
+    dirty_rects.append(pygame.draw.rect(screen, WHITE, (x - 2, y - 2, 404, 34)))
     pygame.draw.rect(screen, BLACK, (x, y, 400, 30))
     pygame.draw.rect(screen, WHITE, (x, y, 400 * ratio, 30))
 
@@ -115,13 +127,33 @@ def update_leaderboard():
     if len(leaderboard) > 10:
         leaderboard = leaderboard[:10]
 
+def settle_match():
+    # runs once when a match ends, the GAME_OVER screen only displays the outcome
+    global personal_score, result_text, leaderboard
+    if score[0] > score[1]:
+        personal_score += 12
+        result_text = "You Win!"
+    else:
+        personal_score -= 6
+        result_text = "You Lose!"
+
+    leaderboard = [entry for entry in leaderboard if entry[0] != username]
+    leaderboard.append((username, personal_score))
+    update_leaderboard()
+
 # game loop
 run = True
 while run:
     clock.tick(FPS)
 
-    # draw background
-    draw_bg()
+    # draw background, or only patch it up when the fight was already on screen last frame
+    frame_state = current_state
+    partial_redraw = DIRTY_RECTS and frame_state == PLAYING and last_drawn_state == PLAYING
+    if partial_redraw:
+        restore_bg(previous_dirty_rects)
+    else:
+        draw_bg()
+    dirty_rects.clear()
 
     if current_state == MAIN_MENU:
         # draw menu options
@@ -166,8 +198,8 @@ while run:
         fighter_2.update()
 
         # draw fighters
-        fighter_1.draw(screen)
-        fighter_2.draw(screen)
+        dirty_rects.append(fighter_1.draw(screen))
+        dirty_rects.append(fighter_2.draw(screen))
 
         # check for player defeat
         if round_over == False:
@@ -181,10 +213,11 @@ while run:
                 round_over_time = pygame.time.get_ticks()
         else:
             # display victory image
-            screen.blit(victory_img, (360, 150))
+            dirty_rects.append(screen.blit(victory_img, (360, 150)))
             if pygame.time.get_ticks() - round_over_time > ROUND_OVER_COOLDOWN:
                 if score[0] == 3 or score[1] == 3:
                     current_state = GAME_OVER
+                    settle_match()
                 else:
                     round_over = False
                     intro_count = 3
@@ -201,22 +234,9 @@ while run:
         draw_text("Final Score", menu_font, WHITE, 400, 200)
         draw_text(f"P1: {score[0]}  P2: {score[1]}", menu_font, WHITE, 400, 250)
 
-        # update personal score
-        if score[0] > score[1]:
-            personal_score += 12
-            result_text = "You Win!"
-        else:
-            personal_score -= 6
-            result_text = "You Lose!"
-
         draw_text(result_text, menu_font, WHITE, 400, 300)
         draw_text(f"Personal Score: {personal_score}", menu_font, WHITE, 400, 350)
 
-        # update leaderboard
-        leaderboard = [entry for entry in leaderboard if entry[0] != username]
-        leaderboard.append((username, personal_score))
-        update_leaderboard()
-
         # draw back to menu button
         back_button = draw_button("Back to Menu", menu_font, BLACK, 400, 400, 200, 50)
 
@@ -242,7 +262,12 @@ while run:
                     current_state = MAIN_MENU
 
     # update display
-    pygame.display.update()
+    if partial_redraw:
+        pygame.display.update(previous_dirty_rects + dirty_rects)
+    else:
+        pygame.display.update()
+    previous_dirty_rects = dirty_rects.copy()
+    last_drawn_state = frame_state
 
 # exit pygame
 pygame.quit()
\ No newline at end of file
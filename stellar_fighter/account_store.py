@@ -0,0 +1,188 @@
+import argparse
+import glob
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+# Player and guild Stellar accounts in one SQLite file instead of a
+# {name}_stellar_data.json file per account. Lookups go through an in-process
+# LRU cache, and bulk lookups fetch every miss in a handful of queries.
+
+ACCOUNT_DB = "accounts.db"
+JSON_SUFFIX = "_stellar_data.json"
+CACHE_SIZE = 10000
+# SQLite allows at most 999 parameters in a statement on older builds
+QUERY_CHUNK = 500
+
+PLAYER = "player"
+GUILD = "guild"
+# the key holding the account's name in its data, as the JSON files had it
+NAME_KEY = {PLAYER: "username", GUILD: "name"}
+
+
+class AccountStore:
+    """Accounts keyed by kind (PLAYER or GUILD) and name, returned as the dicts the JSON files held."""
+
+    def __init__(self, path=ACCOUNT_DB, cache_size=CACHE_SIZE):
+        self.path = path
+        self.cache_size = cache_size
+        # (kind, name) -> data, or None for an account known not to exist
+        self.cache = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS accounts (
+            kind TEXT NOT NULL,
+            name TEXT NOT NULL,
+            public_key TEXT NOT NULL,
+            secret_key TEXT NOT NULL,
+            PRIMARY KEY (kind, name)) WITHOUT ROWID""")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.commit()
+
+    def _remember(self, key, data):
+        self.cache[key] = data
+        self.cache.move_to_end(key)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+    def get(self, kind, name):
+        """The account's data, or None if there is no such account."""
+        key = (kind, name)
+        with self._lock:
+            if key in self.cache:
+                self.hits += 1
+                self.cache.move_to_end(key)
+                data = self.cache[key]
+                return dict(data) if data else None
+            self.misses += 1
+            row = self.db.execute("SELECT public_key, secret_key FROM accounts WHERE kind = ? AND name = ?", key).fetchone()
+            data = self._data(kind, name, row) if row else None
+            self._remember(key, data)
+            return dict(data) if data else None
+
+    def get_many(self, kind, names):
+        """{name: data} for every name that has an account; names without one are left out."""
+        found = {}
+        missing = []
+        with self._lock:
+            for name in dict.fromkeys(names):
+                key = (kind, name)
+                if key in self.cache:
+                    self.hits += 1
+                    self.cache.move_to_end(key)
+                    if self.cache[key]:
+                        found[name] = dict(self.cache[key])
+                else:
+                    missing.append(name)
+            self.misses += len(missing)
+            for start in range(0, len(missing), QUERY_CHUNK):
+                chunk = missing[start:start + QUERY_CHUNK]
+                rows = self.db.execute(
+                    f"SELECT name, public_key, secret_key FROM accounts WHERE kind = ? AND name IN ({','.join('?' * len(chunk))})",
+                    [kind] + chunk).fetchall()
+                loaded = {name: self._data(kind, name, (public_key, secret_key)) for name, public_key, secret_key in rows}
+                for name in chunk:
+                    data = loaded.get(name)
+                    self._remember((kind, name), data)
+                    if data:
+                        found[name] = dict(data)
+        return found
+
+    def put(self, kind, data):
+        self.put_many(kind, [data])
+
+    def put_many(self, kind, items):
+        """Insert or replace accounts in one transaction."""
+        name_key = NAME_KEY[kind]
+        rows = [(kind, data[name_key], data["public_key"], data["secret_key"]) for data in items]
+        with self._lock:
+            with self.db:
+                self.db.executemany("INSERT OR REPLACE INTO accounts VALUES (?, ?, ?, ?)", rows)
+            for kind, name, public_key, secret_key in rows:
+                self._remember((kind, name), self._data(kind, name, (public_key, secret_key)))
+
+    def count(self, kind=None):
+        with self._lock:
+            if kind is None:
+                return self.db.execute("SELECT COUNT(*) FROM accounts").fetchone()[0]
+            return self.db.execute("SELECT COUNT(*) FROM accounts WHERE kind = ?", (kind,)).fetchone()[0]
+
+    def _data(self, kind, name, row):
+        return {NAME_KEY[kind]: name, "public_key": row[0], "secret_key": row[1]}
+
+    def migrated(self):
+        with self._lock:
+            return self.db.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone() is not None
+
+    def migrate_json(self, directory="."):
+        """Import every {name}_stellar_data.json file in directory; returns (players, guilds) imported.
+
+        Accounts already in the store are kept, so running it again is harmless.
+        The files are left in place, they hold the only other copy of the secret keys.
+        """
+        players, guilds = [], []
+        for path in glob.glob(os.path.join(glob.escape(directory), "*" + JSON_SUFFIX)):
+            try:
+                with open(path, "r") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"Skipping {path} in account migration: {str(e)}")
+                continue
+            if "username" in data:
+                players.append((PLAYER, data["username"], data["public_key"], data["secret_key"]))
+            elif "name" in data:
+                guilds.append((GUILD, data["name"], data["public_key"], data["secret_key"]))
+            else:
+                logger.error(f"Skipping {path} in account migration: neither a player nor a guild")
+        with self._lock:
+            with self.db:
+                self.db.executemany("INSERT OR IGNORE INTO accounts VALUES (?, ?, ?, ?)", players + guilds)
+                self.db.execute("INSERT OR REPLACE INTO meta VALUES ('json_migrated', ?)", (time.strftime("%Y-%m-%d %H:%M:%S"),))
+            # lookups cached as missing before the import may exist now
+            self.cache.clear()
+        logger.info(f"Imported {len(players)} player and {len(guilds)} guild accounts from {directory}")
+        return len(players), len(guilds)
+
+    def close(self):
+        with self._lock:
+            self.db.close()
+
+
+_store = None
+_store_lock = threading.Lock()
+
+
+def get_store():
+    """The shared store in the working directory, importing the old JSON files the first time it is opened."""
+    global _store
+    with _store_lock:
+        if _store is None:
+            _store = AccountStore()
+            if not _store.migrated():
+                _store.migrate_json()
+        return _store
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Player and guild account store")
+    parser.add_argument("command", choices=["migrate", "info"])
+    parser.add_argument("--db", default=ACCOUNT_DB)
+    parser.add_argument("--dir", default=".", help="directory holding the *_stellar_data.json files to import")
+    args = parser.parse_args()
+
+    store = AccountStore(args.db)
+    if args.command == "migrate":
+        players, guilds = store.migrate_json(args.dir)
+        print(f"imported {players} players and {guilds} guilds into {args.db}")
+    print(f"{args.db}: {store.count(PLAYER)} players, {store.count(GUILD)} guilds")
+    store.close()
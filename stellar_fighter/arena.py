@@ -0,0 +1,299 @@
+import argparse
+import random
+import time
+from simulation import FighterSim, SCREEN_WIDTH, SCREEN_HEIGHT, FPS, WARRIOR_DATA, WIZARD_DATA, WARRIOR_ANIMATION_STEPS, WIZARD_ANIMATION_STEPS
+from bots import make_bot
+
+# Free-for-all or team fights between any number of fighters on the
+# FighterSim rules. Each tick the fighters are bucketed into a uniform grid,
+# so an attack only tests the fighters in the cells its box overlaps and the
+# nearest opponent (who a fighter turns to face) is found by searching
+# outwards from the fighter's own cell, instead of every fighter testing
+# every other one.
+
+# a fighter is 80 px wide and its attack box reaches 160 px out, so two cells cover any attack
+CELL_SIZE = 160
+# fighters are filed by their centre, so a query reaches this far past a rect for their edges
+FIGHTER_HALF_WIDTH = 40
+FIGHTER_HALF_HEIGHT = 90
+START_Y = 310
+
+
+class SpatialHash:
+    """Uniform grid of the living fighters, keyed by the cell their centre is in and rebuilt every tick."""
+
+    def __init__(self, cell_size=CELL_SIZE):
+        self.cell_size = cell_size
+        self.cells = {}
+        self.rows = (0, 0)
+
+    def rebuild(self, fighters):
+        cells = {}
+        size = self.cell_size
+        top = bottom = None
+        for fighter in fighters:
+            cx, cy = fighter.rect.centerx // size, fighter.rect.centery // size
+            cell = cells.get((cx, cy))
+            if cell is None:
+                cells[(cx, cy)] = [fighter]
+            else:
+                cell.append(fighter)
+            if top is None or cy < top:
+                top = cy
+            if bottom is None or cy > bottom:
+                bottom = cy
+        self.cells = cells
+        # fighters stay near the ground, so rings are only searched across the rows in use
+        self.rows = (top or 0, bottom or 0)
+
+    def query(self, rect):
+        """Fighters whose rect may overlap rect."""
+        size = self.cell_size
+        found = []
+        for cx in range((rect.left - FIGHTER_HALF_WIDTH) // size, (rect.right + FIGHTER_HALF_WIDTH) // size + 1):
+            for cy in range((rect.top - FIGHTER_HALF_HEIGHT) // size, (rect.bottom + FIGHTER_HALF_HEIGHT) // size + 1):
+                cell = self.cells.get((cx, cy))
+                if cell:
+                    found.extend(cell)
+        return found
+
+    def nearest_opponent(self, fighter, max_cells):
+        """The closest fighter of another team, searching rings of cells outwards."""
+        size = self.cell_size
+        cells = self.cells
+        x0, y0 = fighter.rect.center
+        cx, cy = x0 // size, y0 // size
+        team = fighter.team
+        top, bottom = self.rows
+        best = None
+        best_distance = None
+        for ring in range(max_cells + 1):
+            if ring == 0:
+                keys = [(cx, cy)]
+            else:
+                rows = range(max(top, cy - ring), min(bottom, cy + ring) + 1)
+                keys = [(cx - ring, y) for y in rows] + [(cx + ring, y) for y in rows]
+                for y in (cy - ring, cy + ring):
+                    if top <= y <= bottom:
+                        keys.extend((x, y) for x in range(cx - ring + 1, cx + ring))
+            for key in keys:
+                for other in cells.get(key, ()):
+                    if other.team == team:
+                        continue
+                    other_x, other_y = other.rect.center
+                    distance = abs(other_x - x0) + abs(other_y - y0)
+                    if best is None or distance < best_distance or (distance == best_distance and other.index < best.index):
+                        best, best_distance = other, distance
+            # an unsearched fighter's centre is more than ring cells away
+            if best is not None and best_distance <= ring * size:
+                break
+        return best
+
+
+class AllPairs:
+    """The same interface as SpatialHash without a grid, to measure and check it against."""
+
+    def rebuild(self, fighters):
+        self.fighters = fighters
+
+    def query(self, rect):
+        return self.fighters
+
+    def nearest_opponent(self, fighter, max_cells):
+        x0, y0 = fighter.rect.center
+        best = None
+        best_distance = None
+        for other in self.fighters:
+            if other.team == fighter.team:
+                continue
+            other_x, other_y = other.rect.center
+            distance = abs(other_x - x0) + abs(other_y - y0)
+            if best is None or distance < best_distance or (distance == best_distance and other.index < best.index):
+                best, best_distance = other, distance
+        return best
+
+
+class ArenaRules:
+    """Mixin for FighterSim and Fighter: attacks land on every opponent in the box, not just the target."""
+
+    def attack(self, target):
+        if self.attack_cooldown == 0:
+            self.attacking = True
+            attack_rect = self.attack_rect()
+            # the grid holds start of tick positions and fighters move at most speed px a tick
+            for other in self.grid.query(attack_rect.inflate(2 * self.speed, 2 * abs(self.jump_velocity))):
+                if other.team != self.team and other.alive and attack_rect.colliderect(other.rect):
+                    other.health -= self.attack_damage
+                    other.hit = True
+
+
+class ArenaFighter(ArenaRules, FighterSim):
+    pass
+
+
+class Heading:
+    """Stands in for a target straight ahead, so a fighter with nobody to face keeps its facing."""
+
+    def __init__(self, fighter):
+        self.rect = fighter.rect.move(-1 if fighter.flip else 1, 0)
+
+
+class ArenaView:
+    """Looks like a Match to a bot: its fighter against the nearest opponent."""
+
+    def __init__(self, me, opponent):
+        self.fighter_1 = me
+        self.fighter_2 = opponent
+
+
+class Arena:
+    """Any number of fighters; teams=0 is a free-for-all, otherwise fighter i is on team i % teams."""
+
+    def __init__(self, fighters, teams=0, width=SCREEN_WIDTH, height=SCREEN_HEIGHT, grid=None):
+        self.fighters = fighters
+        self.width = width
+        self.height = height
+        self.grid = grid if grid is not None else SpatialHash()
+        self.tick = 0
+        self.over = False
+        self.winner = None
+        self.max_cells = width // CELL_SIZE + 2
+        for index, fighter in enumerate(fighters):
+            fighter.index = index
+            fighter.team = index % teams if teams else index
+            fighter.grid = self.grid
+            fighter.target = None
+
+    def opponent(self, fighter):
+        """The nearest living opponent, or None once there are none left."""
+        return self.grid.nearest_opponent(fighter, self.max_cells)
+
+    def step(self, inputs):
+        """Advance one tick; inputs holds the input bits of every fighter."""
+        if self.over:
+            return
+        self.tick += 1
+        # the fallen can neither be hit nor faced, so they stay out of the grid
+        self.grid.rebuild([fighter for fighter in self.fighters if fighter.alive])
+        for fighter, bits in zip(self.fighters, inputs):
+            # the fallen and the last ones standing keep looking the way they were
+            fighter.target = self.opponent(fighter) if fighter.alive else None
+            fighter.step(bits, self.width, self.height, fighter.target or Heading(fighter), False)
+        for fighter in self.fighters:
+            fighter.update()
+        teams = {fighter.team for fighter in self.fighters if fighter.alive}
+        if len(teams) <= 1:
+            self.over = True
+            self.winner = teams.pop() if teams else None
+
+    def checksum(self):
+        # snapshots rather than packed state, the arena can be wider than the 16 bit positions it packs
+        return hash(tuple(fighter.snapshot() for fighter in self.fighters))
+
+
+def spread(count, width):
+    """Evenly spaced starting x positions across the arena."""
+    if count == 1:
+        return [width // 2]
+    return [40 + i * (width - 160) // (count - 1) for i in range(count)]
+
+
+def make_arena_fighters(count, width, fighter_class=ArenaFighter, sheets=None):
+    """Alternate warriors and wizards across the arena; sheets (warrior, wizard) adds sprites."""
+    fighters = []
+    for i, x in enumerate(spread(count, width)):
+        data, steps = (WARRIOR_DATA, WARRIOR_ANIMATION_STEPS) if i % 2 == 0 else (WIZARD_DATA, WIZARD_ANIMATION_STEPS)
+        flip = x > width // 2
+        if sheets is None:
+            fighters.append(fighter_class(i + 1, x, START_Y, flip, data, steps))
+        else:
+            fighters.append(fighter_class(i + 1, x, START_Y, flip, data, sheets[i % 2], steps))
+    return fighters
+
+
+def bot_inputs(arena, bots):
+    """Each bot plays against the opponent its fighter faced last tick."""
+    inputs = []
+    for fighter, bot in zip(arena.fighters, bots):
+        inputs.append(bot(ArenaView(fighter, fighter.target), 1) if fighter.target else 0)
+    return inputs
+
+
+def run_headless(count, teams, ticks, seed=0, width=None, grid=None):
+    """Bots fight it out without a window; returns the arena and the time spent stepping it."""
+    width = width or max(SCREEN_WIDTH, count * 60)
+    arena = Arena(make_arena_fighters(count, width), teams, width, grid=grid)
+    rng = random.Random(seed)
+    bots = [make_bot(rng.choice(("aggressive", "counter")), rng.getrandbits(31)) for _ in range(count)]
+    elapsed = 0
+    while not arena.over and arena.tick < ticks:
+        inputs = bot_inputs(arena, bots)
+        start = time.perf_counter()
+        arena.step(inputs)
+        elapsed += time.perf_counter() - start
+    return arena, elapsed
+
+
+def run_window(count, teams, seed=0):
+    """Fight in a window: player 1's keys steer the first fighter, bots play the rest."""
+    import pygame
+    from fighter import Fighter, read_input
+
+    class ArenaSpriteFighter(ArenaRules, Fighter):
+        pass
+
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("Stellar Fighter arena")
+    bg_image = pygame.image.load("assets/images/background/background.jpg").convert_alpha()
+    bg_image = pygame.transform.scale(bg_image, (SCREEN_WIDTH, SCREEN_HEIGHT)).convert()
+    sheets = (pygame.image.load("assets/images/warrior/Sprites/warrior.png").convert_alpha(),
+              pygame.image.load("assets/images/wizard/Sprites/wizard.png").convert_alpha())
+    font = pygame.font.Font("assets/fonts/turok.ttf", 30)
+
+    arena = Arena(make_arena_fighters(count, SCREEN_WIDTH, ArenaSpriteFighter, sheets), teams)
+    rng = random.Random(seed)
+    bots = [make_bot(rng.choice(("aggressive", "counter")), rng.getrandbits(31)) for _ in range(count)]
+    clock = pygame.time.Clock()
+    run = True
+    while run:
+        clock.tick(FPS)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT or (event.type == pygame.KEYDOWN and event.key == pygame.K_ESCAPE):
+                run = False
+        inputs = bot_inputs(arena, bots)
+        inputs[0] = read_input(1)
+        arena.step(inputs)
+
+        screen.blit(bg_image, (0, 0))
+        for fighter in arena.fighters:
+            fighter.draw(screen)
+        for fighter in arena.fighters:
+            if fighter.alive:
+                bar = pygame.Rect(fighter.rect.x, fighter.rect.y - 12, fighter.rect.width, 6)
+                pygame.draw.rect(screen, (255, 0, 0), bar)
+                pygame.draw.rect(screen, (255, 255, 0), (bar.x, bar.y, bar.width * fighter.health / 100, bar.height))
+        alive = sum(fighter.alive for fighter in arena.fighters)
+        status = f"{alive} standing  {clock.get_fps():.0f} FPS"
+        if arena.over:
+            status = "Draw" if arena.winner is None else f"{'Team' if teams else 'Fighter'} {arena.winner + 1} wins"
+        screen.blit(font.render(status, True, (255, 255, 255)), (20, 20))
+        pygame.display.update()
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Free-for-all and team fights with many fighters")
+    parser.add_argument("--fighters", type=int, default=64)
+    parser.add_argument("--teams", type=int, default=0, help="number of teams, 0 for a free-for-all")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--headless", action="store_true", help="bots only, as fast as possible")
+    parser.add_argument("--ticks", type=int, default=60 * FPS, help="headless tick limit")
+    args = parser.parse_args()
+
+    if args.headless:
+        arena, elapsed = run_headless(args.fighters, args.teams, args.ticks, args.seed)
+        result = "draw" if arena.winner is None else f"winner {'team' if args.teams else 'fighter'} {arena.winner + 1}"
+        print(f"{args.fighters} fighters, {arena.tick} ticks, {result}, {elapsed * 1000 / max(1, arena.tick):.3f} ms/tick")
+    else:
+        run_window(args.fighters, args.teams, args.seed)
@@ -0,0 +1,107 @@
+import threading
+import time
+import logging
+from blockchain import get_balance
+
+logger = logging.getLogger(__name__)
+
+# seconds before a cached balance is considered stale and fetched again
+BALANCE_TTL = 15.0
+
+
+class BalanceCache:
+    """Latest known balance of one account, refreshed by a background thread.
+
+    The game loop only ever reads the cached value; Horizon is queried on a TTL
+    and whenever refresh() is called after one of our own payments.
+    """
+
+    def __init__(self, account_id, ttl=BALANCE_TTL, fetch=get_balance):
+        self.account_id = account_id
+        self.ttl = ttl
+        self.fetch = fetch
+        self.value = None
+        self.updated_at = None
+        self.error = None
+        self._refresh_requested = False
+        self._refreshing = False
+        self._next_fetch = 0.0
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._running = False
+        self._thread = None
+
+    def start(self):
+        """Start refreshing in the background."""
+        if self._thread is None:
+            if self.updated_at is not None:
+                self._next_fetch = self.updated_at + self.ttl
+            self._running = True
+            self._thread = threading.Thread(target=self._run, name="balance-cache", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=1)
+            self._thread = None
+
+    def get(self, default=0):
+        """Return the cached balance without touching the network."""
+        with self._lock:
+            return default if self.value is None else self.value
+
+    def set(self, value):
+        """Store a balance we already know, e.g. one returned by update_player_coins."""
+        with self._lock:
+            self.value = value
+            self.updated_at = time.monotonic()
+            self.error = None
+
+    def refresh(self):
+        """Ask the background thread to fetch the balance as soon as possible."""
+        with self._lock:
+            self._refresh_requested = True
+        self._wake.set()
+
+    def refresh_now(self):
+        """Fetch the balance on the calling thread and return it."""
+        with self._lock:
+            self._refreshing = True
+        try:
+            value = self.fetch(self.account_id)
+        except Exception as e:
+            logger.warning(f"Failed to refresh balance for {self.account_id}: {str(e)}")
+            with self._lock:
+                self.error = e
+                return self.value
+        finally:
+            with self._lock:
+                self._refreshing = False
+        self.set(value)
+        return value
+
+    def is_stale(self):
+        """True while the cached value is missing, older than the TTL or a refresh is pending."""
+        with self._lock:
+            if self.value is None or self._refresh_requested or self._refreshing:
+                return True
+            return time.monotonic() - self.updated_at > self.ttl
+
+    def age(self):
+        """Seconds since the balance was last updated, or None if it never was."""
+        with self._lock:
+            return None if self.updated_at is None else time.monotonic() - self.updated_at
+
+    def _run(self):
+        while self._running:
+            with self._lock:
+                requested = self._refresh_requested
+                self._refresh_requested = False
+            if requested or time.monotonic() >= self._next_fetch:
+                self.refresh_now()
+                # failed fetches are retried on the same schedule instead of hammering Horizon
+                self._next_fetch = time.monotonic() + self.ttl
+            self._wake.wait(timeout=max(0.0, self._next_fetch - time.monotonic()))
+            self._wake.clear()
@@ -0,0 +1,236 @@
+import numpy as np
+from simulation import SPEED, GRAVITY, JUMP_VELOCITY, ATTACK_DAMAGE, ATTACK_COOLDOWN_TICKS, SCREEN_WIDTH, SCREEN_HEIGHT, WARRIOR_ANIMATION_STEPS, WIZARD_ANIMATION_STEPS, INPUT_LEFT, INPUT_RIGHT, INPUT_JUMP, INPUT_ATTACK1, INPUT_ATTACK2, ANIMATION_TICKS, INTRO_TICKS, ROUND_OVER_TICKS, INTRO_COUNT, ROUNDS_TO_WIN
+
+#many independent matches stepped at once: every piece of fighter state is a (2, N) array,
+#row 0 for player 1 and row 1 for player 2, and each tick applies the rules of
+#simulation.FighterSim and simulation.Match to all N matches with array operations
+
+#fighter hurtbox, the same constant rect FighterSim uses
+FIGHTER_WIDTH = 80
+FIGHTER_HEIGHT = 180
+START_X = (200, 700)
+START_Y = 310
+
+
+class BatchMatch():
+  def __init__(self, count, speed=SPEED, attack_damage=ATTACK_DAMAGE, attack_cooldown_ticks=ATTACK_COOLDOWN_TICKS,
+               animation_steps=(WARRIOR_ANIMATION_STEPS, WIZARD_ANIMATION_STEPS), screen_width=SCREEN_WIDTH, screen_height=SCREEN_HEIGHT, intro_count=INTRO_COUNT):
+    #speed, attack_damage and attack_cooldown_ticks may be scalars or arrays of shape (N,) or (2, N) for balance sweeps
+    self.count = count
+    self.speed = np.broadcast_to(np.asarray(speed, dtype=np.int32), (2, count))
+    self.attack_damage = np.broadcast_to(np.asarray(attack_damage, dtype=np.int32), (2, count))
+    self.attack_cooldown_ticks = np.broadcast_to(np.asarray(attack_cooldown_ticks, dtype=np.int32), (2, count))
+    self.gravity = GRAVITY
+    self.jump_velocity = JUMP_VELOCITY
+    self.animation_steps = np.asarray(animation_steps, dtype=np.int32)
+    self.screen_width = screen_width
+    self.screen_height = screen_height
+    self.start_count = intro_count
+
+    shape = (2, count)
+    self.x = np.zeros(shape, np.int32)
+    self.y = np.zeros(shape, np.int32)
+    self.vel_y = np.zeros(shape, np.int32)
+    self.flip = np.zeros(shape, bool)
+    self.running = np.zeros(shape, bool)
+    self.jump = np.zeros(shape, bool)
+    self.attacking = np.zeros(shape, bool)
+    self.attack_type = np.zeros(shape, np.int8)
+    self.attack_cooldown = np.zeros(shape, np.int32)
+    self.hit = np.zeros(shape, bool)
+    self.health = np.zeros(shape, np.int32)
+    self.alive = np.zeros(shape, bool)
+    self.action = np.zeros(shape, np.int8)
+    self.frame_index = np.zeros(shape, np.int32)
+    self.display_frame = np.zeros(shape, np.int32)
+    self.ticks = np.zeros(shape, np.int32)
+    self.update_tick = np.zeros(shape, np.int32)
+
+    self.score = np.zeros(shape, np.int32)
+    self.tick = np.zeros(count, np.int32)
+    self.intro_count = np.zeros(count, np.int32)
+    self.intro_ticks = np.zeros(count, np.int32)
+    self.round_over = np.zeros(count, bool)
+    self.round_over_ticks = np.zeros(count, np.int32)
+    self.finished = np.zeros(count, bool)
+    self.new_round(np.ones(count, bool))
+
+
+  def new_round(self, mask):
+    #put the fighters of the masked matches back at their starting positions
+    for side in (0, 1):
+      self.x[side, mask] = START_X[side]
+      self.y[side, mask] = START_Y
+      self.flip[side, mask] = side == 1
+      self.health[side, mask] = 100
+      self.alive[side, mask] = True
+      for name in ("vel_y", "attack_type", "attack_cooldown", "action", "frame_index", "display_frame", "ticks", "update_tick"):
+        getattr(self, name)[side, mask] = 0
+      for name in ("running", "jump", "attacking", "hit"):
+        getattr(self, name)[side, mask] = False
+    self.intro_count[mask] = self.start_count
+    self.intro_ticks[mask] = 0
+    self.round_over[mask] = False
+    self.round_over_ticks[mask] = 0
+
+
+  def reset(self, mask):
+    #start fresh matches in the masked slots
+    self.score[:, mask] = 0
+    self.tick[mask] = 0
+    self.finished[mask] = False
+    self.new_round(mask)
+
+
+  def step(self, inputs):
+    #inputs: (N, 2) array of input bits for player 1 and player 2
+    inputs = np.asarray(inputs)
+    live = ~self.finished
+    self.tick += live
+    #fighters only move once the countdown is over
+    fighting = live & (self.intro_count <= 0)
+    counting = live & ~fighting
+    self.intro_ticks += counting
+    counted = counting & (self.intro_ticks >= INTRO_TICKS)
+    self.intro_count -= counted
+    self.intro_ticks[counted] = 0
+
+    self._move(0, 1, inputs[:, 0], fighting)
+    self._move(1, 0, inputs[:, 1], fighting)
+    self._update(0, live)
+    self._update(1, live)
+
+    #check for player defeat
+    was_over = self.round_over.copy()
+    ko_1 = live & ~was_over & ~self.alive[0]
+    ko_2 = live & ~was_over & ~ko_1 & ~self.alive[1]
+    self.score[1] += ko_1
+    self.score[0] += ko_2
+    self.round_over |= ko_1 | ko_2
+    pausing = live & was_over
+    self.round_over_ticks += pausing
+    ended = pausing & (self.round_over_ticks > ROUND_OVER_TICKS)
+    won = ended & ((self.score[0] == ROUNDS_TO_WIN) | (self.score[1] == ROUNDS_TO_WIN))
+    self.finished |= won
+    next_round = ended & ~won
+    if next_round.any():
+      self.new_round(next_round)
+
+
+  def _move(self, side, other, inputs, active):
+    x = self.x[side]
+    y = self.y[side]
+    self.running[side] &= ~active
+    self.attack_type[side][active] = 0
+
+    #can only perform other actions if not currently attacking
+    can_act = active & ~self.attacking[side] & self.alive[side] & ~self.round_over
+    speed = self.speed[side]
+    left = can_act & ((inputs & INPUT_LEFT) != 0)
+    right = can_act & ((inputs & INPUT_RIGHT) != 0)
+    dx = np.where(right, speed, np.where(left, -speed, 0))
+    self.running[side] |= left | right
+    jumping = can_act & ((inputs & INPUT_JUMP) != 0) & ~self.jump[side]
+    self.vel_y[side][jumping] = self.jump_velocity
+    self.jump[side] |= jumping
+
+    #attack
+    attack_1 = can_act & ((inputs & INPUT_ATTACK1) != 0)
+    attack_2 = can_act & ((inputs & INPUT_ATTACK2) != 0)
+    attacks = (attack_1 | attack_2) & (self.attack_cooldown[side] == 0)
+    self.attacking[side] |= attacks
+    attack_x = x + FIGHTER_WIDTH // 2 - 2 * FIGHTER_WIDTH * self.flip[side]
+    target_x = self.x[other]
+    target_y = self.y[other]
+    hits = attacks & (attack_x < target_x + FIGHTER_WIDTH) & (target_x < attack_x + 2 * FIGHTER_WIDTH) & (y < target_y + FIGHTER_HEIGHT) & (target_y < y + FIGHTER_HEIGHT)
+    self.health[other] -= np.where(hits, self.attack_damage[side], 0)
+    self.hit[other] |= hits
+    self.attack_type[side][attack_1] = 1
+    self.attack_type[side][attack_2] = 2
+
+    #apply gravity
+    vel_y = self.vel_y[side]
+    vel_y += np.where(active, self.gravity, 0).astype(np.int32)
+    dy = np.where(active, vel_y, 0)
+
+    #ensure player stays on screen
+    dx = np.where(x + dx < 0, -x, dx)
+    dx = np.where(x + FIGHTER_WIDTH + dx > self.screen_width, self.screen_width - (x + FIGHTER_WIDTH), dx)
+    floor = self.screen_height - 110
+    landed = active & (y + FIGHTER_HEIGHT + dy > floor)
+    vel_y[landed] = 0
+    self.jump[side] &= ~landed
+    dy = np.where(landed, floor - (y + FIGHTER_HEIGHT), dy)
+
+    #ensure players face each other
+    faces_left = ~(target_x + FIGHTER_WIDTH // 2 > x + FIGHTER_WIDTH // 2)
+    self.flip[side] = np.where(active, faces_left, self.flip[side])
+
+    #apply attack cooldown
+    self.attack_cooldown[side] -= active & (self.attack_cooldown[side] > 0)
+
+    #update player position
+    x += np.where(active, dx, 0).astype(np.int32)
+    y += dy.astype(np.int32)
+
+
+  def _update(self, side, live):
+    action = self.action[side]
+    self.ticks[side] += live
+    ticks = self.ticks[side]
+    #check what action the player is performing
+    dead = live & (self.health[side] <= 0)
+    self.health[side][dead] = 0
+    self.alive[side] &= ~dead
+    hit = live & ~dead & self.hit[side]
+    attacking = live & ~dead & ~hit & self.attacking[side]
+    jumping = live & ~dead & ~hit & ~attacking & self.jump[side]
+    running = live & ~dead & ~hit & ~attacking & ~jumping & self.running[side]
+    idle = live & ~dead & ~hit & ~attacking & ~jumping & ~running
+    new_action = action.copy()
+    new_action[dead] = 6
+    new_action[hit] = 5
+    attack_type = self.attack_type[side]
+    new_action[attacking & (attack_type == 1)] = 3
+    new_action[attacking & (attack_type == 2)] = 4
+    new_action[jumping] = 2
+    new_action[running] = 1
+    new_action[idle] = 0
+    changed = new_action != action
+    action[:] = new_action
+    frame_index = self.frame_index[side]
+    frame_index[changed] = 0
+    self.update_tick[side][changed] = ticks[changed]
+
+    #frame to show for this tick
+    self.display_frame[side] = np.where(live, frame_index, self.display_frame[side])
+    advance = live & (ticks - self.update_tick[side] >= ANIMATION_TICKS)
+    frame_index += advance
+    self.update_tick[side][advance] = ticks[advance]
+
+    #check if the animation has finished
+    steps = self.animation_steps[side][action]
+    done = live & (frame_index >= steps)
+    dead_done = done & ~self.alive[side]
+    frame_index[dead_done] = steps[dead_done] - 1
+    looped = done & self.alive[side]
+    frame_index[looped] = 0
+    attack_done = looped & ((action == 3) | (action == 4))
+    hit_done = looped & (action == 5)
+    self.hit[side] &= ~hit_done
+    self.attacking[side] &= ~(attack_done | hit_done)
+    cooled = attack_done | hit_done
+    self.attack_cooldown[side][cooled] = self.attack_cooldown_ticks[side][cooled]
+
+
+  def winners(self):
+    #1 or 2 for finished matches, 0 while a match is still running
+    return np.where(self.finished, np.where(self.score[0] > self.score[1], 1, 2), 0)
+
+
+def run_batch(count, policy, max_ticks=60 * 60 * 60, **rules):
+  #play count matches to the end; policy(batch) returns the (N, 2) input bits for the tick
+  batch = BatchMatch(count, **rules)
+  while not batch.finished.all() and batch.tick.max() < max_ticks:
+    batch.step(policy(batch))
+  return batch
@@ -0,0 +1,412 @@
+import argparse
+import os
+import sys
+import time
+import random
+import pygame
+from fighter import Fighter
+from simulation import Match, run_match, FPS, SCREEN_WIDTH, SCREEN_HEIGHT, WARRIOR_DATA, WIZARD_DATA, WARRIOR_ANIMATION_STEPS, WIZARD_ANIMATION_STEPS
+
+# run without opening a window unless asked to
+if "--window" not in sys.argv:
+    os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+
+
+def setup_screen():
+    pygame.init()
+    return pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+
+
+def load_fighters():
+    warrior_sheet = pygame.image.load("assets/images/warrior/Sprites/warrior.png").convert_alpha()
+    wizard_sheet = pygame.image.load("assets/images/wizard/Sprites/wizard.png").convert_alpha()
+    fighter_1 = Fighter(1, 200, 310, False, WARRIOR_DATA, warrior_sheet, WARRIOR_ANIMATION_STEPS)
+    fighter_2 = Fighter(2, 700, 310, True, WIZARD_DATA, wizard_sheet, WIZARD_ANIMATION_STEPS)
+    return fighter_1, fighter_2
+
+
+def report(name, seconds, frames):
+    print(f"{name:<32} {seconds * 1000 / frames:8.3f} ms/frame  ({frames} frames)")
+
+
+def bench_draw(frames):
+    """Compare drawing with a per-frame transform.flip against the pre-flipped frames."""
+    screen = setup_screen()
+    fighters = load_fighters()
+
+    # what Fighter.draw used to do: flip (and allocate) a new surface every frame
+    start = time.perf_counter()
+    for _ in range(frames):
+        for fighter in fighters:
+            fighter.update()
+            img = pygame.transform.flip(fighter.image, fighter.flip, False)
+            screen.blit(img, (fighter.rect.x - (fighter.offset[0] * fighter.image_scale), fighter.rect.y - (fighter.offset[1] * fighter.image_scale)))
+    report("draw with transform.flip", time.perf_counter() - start, frames)
+
+    start = time.perf_counter()
+    for _ in range(frames):
+        for fighter in fighters:
+            fighter.update()
+            fighter.draw(screen)
+    report("draw with pre-flipped frames", time.perf_counter() - start, frames)
+
+
+def bench_headless(frames):
+    """Play whole matches between random input policies without a window."""
+    rng = random.Random(1)
+
+    def random_policy(match, player):
+        return rng.getrandbits(5)
+
+    matches = max(1, frames // 60)
+    ticks = 0
+    start = time.perf_counter()
+    for _ in range(matches):
+        ticks += run_match(random_policy, random_policy).tick
+    elapsed = time.perf_counter() - start
+    print(f"{'headless matches':<32} {matches / elapsed:8.1f} matches/s  {ticks / elapsed:10.0f} ticks/s  ({matches} matches)")
+
+
+def bench_batch(frames):
+    """Step 10k matches at once with the NumPy batch simulator."""
+    import numpy as np
+    from batch_simulation import BatchMatch
+
+    count = 10000
+    rng = np.random.default_rng(1)
+    batch = BatchMatch(count, intro_count=0)
+    inputs = rng.integers(0, 32, size=(64, count, 2), dtype=np.int32)
+    start = time.perf_counter()
+    for tick in range(frames):
+        batch.step(inputs[tick % 64])
+        batch.reset(batch.finished)
+    elapsed = time.perf_counter() - start
+    print(f"{'batch simulation':<32} {elapsed * 1000 / frames:8.3f} ms/tick  {count * frames / elapsed:10.0f} match-ticks/s  ({count} matches)")
+
+
+def bench_env(frames):
+    """Self-play env steps with a policy choosing both sides' actions, as training would run."""
+    import numpy as np
+    from env import FighterVecEnv, NumpyPolicy, OBSERVATION_SIZE, ACTION_COUNT
+
+    count = 4096
+    rng = np.random.default_rng(1)
+    policy = NumpyPolicy([(rng.standard_normal((OBSERVATION_SIZE, 32), np.float32), np.zeros(32, np.float32)),
+                          (rng.standard_normal((32, ACTION_COUNT), np.float32), np.zeros(ACTION_COUNT, np.float32))])
+    env = FighterVecEnv(count, None, seed=1)
+    observations, _ = env.reset()
+    start = time.perf_counter()
+    for _ in range(frames):
+        observations, _, _, _, _ = env.step(policy.act(observations))
+    elapsed = time.perf_counter() - start
+    # each match is two agents' steps
+    steps = 2 * count * frames / elapsed
+    print(f"{'self-play env':<32} {elapsed * 1000 / frames:8.3f} ms/step  {steps:10.0f} agent-steps/s  ({steps * 3600 / 1e6:,.0f} million/hour, {count} matches)")
+
+
+def check_parity(frames):
+    """Run the batch simulator next to per-object Matches on the same inputs and compare every tick."""
+    import numpy as np
+    from batch_simulation import BatchMatch
+
+    count = 64
+    rng = np.random.default_rng(7)
+    batch = BatchMatch(count)
+    matches = [Match() for _ in range(count)]
+    fields = ("health", "action", "frame_index", "display_frame", "attack_cooldown", "vel_y", "flip", "attacking", "hit", "alive", "jump", "running")
+    for tick in range(frames * 10):
+        # bias towards attacking and walking towards each other so rounds actually end
+        inputs = rng.integers(0, 32, size=(count, 2)) & rng.choice([31, 27, 9, 18], size=(count, 2))
+        batch.step(inputs)
+        for i, match in enumerate(matches):
+            match.step(int(inputs[i, 0]), int(inputs[i, 1]))
+            for side, fighter in enumerate((match.fighter_1, match.fighter_2)):
+                expected = [fighter.rect.x, fighter.rect.y] + [getattr(fighter, name) for name in fields]
+                actual = [batch.x[side, i], batch.y[side, i]] + [getattr(batch, name)[side, i] for name in fields]
+                if [int(v) for v in expected] != [int(v) for v in actual]:
+                    raise SystemExit(f"parity mismatch at tick {tick}, match {i}, player {side + 1}:\n  object {expected}\n  batch  {actual}")
+            if list(match.score) != list(batch.score[:, i]) or match.finished != batch.finished[i] or match.intro_count != batch.intro_count[i]:
+                raise SystemExit(f"parity mismatch at tick {tick}, match {i}: score {match.score} vs {batch.score[:, i]}")
+    print(f"parity ok: {count} matches, {frames * 10} ticks, {int(batch.finished.sum())} finished, scores {batch.score.sum()} rounds")
+
+
+# replay files given with --replay; without any a few bot matches are recorded to use instead
+REPLAYS = []
+
+
+def bench_replay(frames):
+    """Re-simulate replays headless from start to end, then seek to random ticks."""
+    import tempfile
+    from bots import make_bot
+    from replay import ReplayPlayer, record_match
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = list(REPLAYS)
+        if not paths:
+            for seed in range(max(1, frames // 200)):
+                path = os.path.join(directory, f"bots-{seed}.sfr")
+                record_match(path, make_bot("aggressive", seed), make_bot("counter", seed + 1))
+                paths.append(path)
+        players = [ReplayPlayer(path) for path in paths]
+
+        ticks = 0
+        start = time.perf_counter()
+        for path, player in zip(paths, players):
+            if player.verify() is not None:
+                raise SystemExit(f"{path} does not play back as recorded")
+            player.seek(player.ticks)
+            ticks += player.ticks
+        elapsed = time.perf_counter() - start
+        print(f"{'replay re-simulation':<32} {ticks / elapsed:10.0f} ticks/s  ({len(players)} replays, {ticks} ticks)")
+
+        rng = random.Random(3)
+        start = time.perf_counter()
+        for _ in range(frames):
+            player = rng.choice(players)
+            player.seek(rng.randrange(player.ticks + 1))
+        report("replay seek", time.perf_counter() - start, frames)
+
+
+def bench_server(frames):
+    """Step 500 bot rooms on the match server without sockets; report tick time and state bytes sent."""
+    from bots import make_bot
+    from match_server import MatchServer
+    from simulation import STATE_SIZE
+
+    class CountingTransport:
+        def __init__(self):
+            self.packets = 0
+            self.bytes = 0
+
+        def sendto(self, data, address):
+            self.packets += 1
+            self.bytes += len(data)
+
+    count = 500
+    server = MatchServer()
+    server.transport = CountingTransport()
+    bots = {}
+    for i in range(count * 2):
+        room, player = server.join(f"room-{i // 2}", ("127.0.0.1", 10000 + i))
+        bots[room.room_id, player] = make_bot("aggressive" if player == 1 else "counter", i)
+    elapsed = 0
+    for _ in range(frames):
+        for room in server.rooms.values():
+            room.last_heard = [time.monotonic(), time.monotonic()]
+            for player in (1, 2):
+                room.inputs[player - 1] = bots[room.room_id, player](room.match, player)
+                # pretend every client got the previous state
+                room.acks[player - 1] = room.match.tick
+        # only the server's own work is timed, not the bots standing in for clients
+        start = time.perf_counter()
+        server.tick()
+        elapsed += time.perf_counter() - start
+    transport = server.transport
+    print(f"{'match server':<32} {elapsed * 1000 / frames:8.3f} ms/tick  ({count} rooms, {elapsed / frames * FPS * 100:.0f}% of one core at {FPS} ticks/s)")
+    print(f"{'state packets':<32} {transport.bytes / max(1, transport.packets):8.1f} bytes/packet  ({transport.packets} packets, full state {STATE_SIZE} bytes)")
+
+
+def bench_snapshot(frames):
+    """Cost of the state operations rollback, replays and desync checks lean on."""
+    from bots import make_bot
+
+    # a match in the middle of a fight rather than a fresh one
+    match = Match()
+    bot_1, bot_2 = make_bot("aggressive", 1), make_bot("counter", 2)
+    for _ in range(600):
+        match.step(bot_1(match, 1), bot_2(match, 2))
+    data = match.pack()
+    count = frames * 100
+    for name, operation in (("snapshot", match.snapshot), ("pack", match.pack), ("unpack", lambda: match.unpack(data)),
+                            ("checksum", match.checksum), ("copy", match.copy), ("hash snapshot", lambda: hash(match.snapshot()))):
+        start = time.perf_counter()
+        for _ in range(count):
+            operation()
+        elapsed = time.perf_counter() - start
+        print(f"{'state ' + name:<32} {elapsed * 1e6 / count:8.3f} us  ({count} times)")
+    print(f"{'packed state size':<32} {len(data):8} bytes")
+
+
+def bench_accounts(frames):
+    """Player lookups in the account store against the one JSON file per player it replaced."""
+    import json
+    import tempfile
+    from account_store import AccountStore, PLAYER
+
+    count = 20000
+    rng = random.Random(1)
+    players = [{"username": f"player{i}", "public_key": f"G{i:055d}", "secret_key": f"S{i:055d}"} for i in range(count)]
+    names = [rng.choice(players)["username"] for _ in range(frames * 10)]
+    with tempfile.TemporaryDirectory() as directory:
+        for data in players:
+            with open(os.path.join(directory, f"{data['username']}_stellar_data.json"), "w") as f:
+                json.dump(data, f)
+        start = time.perf_counter()
+        for name in names:
+            with open(os.path.join(directory, f"{name}_stellar_data.json"), "r") as f:
+                json.load(f)
+        elapsed = time.perf_counter() - start
+        print(f"{'json file lookup':<32} {elapsed * 1e6 / len(names):8.3f} us  ({count} players)")
+
+        store = AccountStore(os.path.join(directory, "accounts.db"))
+        start = time.perf_counter()
+        store.migrate_json(directory)
+        print(f"{'migrate json files':<32} {(time.perf_counter() - start) * 1000:8.1f} ms")
+        for name, cache_size in (("store lookup, cold", 0), ("store lookup, cached", count)):
+            store.cache_size = cache_size
+            store.cache.clear()
+            for warm in names if cache_size else ():
+                store.get(PLAYER, warm)
+            start = time.perf_counter()
+            for lookup in names:
+                store.get(PLAYER, lookup)
+            elapsed = time.perf_counter() - start
+            print(f"{name:<32} {elapsed * 1e6 / len(names):8.3f} us")
+        store.cache_size = 0
+        store.cache.clear()
+        batches = [names[i:i + 1000] for i in range(0, len(names), 1000)]
+        start = time.perf_counter()
+        for batch in batches:
+            store.get_many(PLAYER, batch)
+        elapsed = time.perf_counter() - start
+        print(f"{'store bulk lookup, cold':<32} {elapsed * 1e6 / len(names):8.3f} us/player  (1000 per call)")
+        store.close()
+
+
+def bench_profiles(frames):
+    """Saving one player's stats among 100k profiles, against rewriting them all as one JSON document."""
+    import json
+    import tempfile
+    from persistence import atomic_write
+    from profiles import ProfileStore, DEFAULT_STATS
+
+    count = 100000
+    rng = random.Random(1)
+    with tempfile.TemporaryDirectory() as directory:
+        store = ProfileStore(os.path.join(directory, "profiles.db"))
+        for i in range(count):
+            store.save(f"player{i}", DEFAULT_STATS)
+        store.flush()
+        document = {f"player{i}": dict(DEFAULT_STATS) for i in range(count)}
+        saves = max(10, frames // 10)
+        start = time.perf_counter()
+        for _ in range(saves):
+            atomic_write(os.path.join(directory, "game_data.json"), json.dumps(document))
+        print(f"{'json rewrite of every profile':<32} {(time.perf_counter() - start) * 1000 / saves:8.3f} ms  ({count} profiles)")
+        start = time.perf_counter()
+        for _ in range(saves):
+            store.save(f"player{rng.randrange(count)}", DEFAULT_STATS)
+        print(f"{'profile save, game thread':<32} {(time.perf_counter() - start) * 1000 / saves:8.3f} ms")
+        start = time.perf_counter()
+        for _ in range(saves):
+            store.save(f"player{rng.randrange(count)}", DEFAULT_STATS)
+            store.flush()
+        print(f"{'profile save, committed':<32} {(time.perf_counter() - start) * 1000 / saves:8.3f} ms")
+        store.cache.clear()
+        start = time.perf_counter()
+        for _ in range(saves):
+            store.load(f"player{rng.randrange(count)}")
+        print(f"{'profile switch, uncached':<32} {(time.perf_counter() - start) * 1000 / saves:8.3f} ms")
+        store.close()
+
+
+def bench_leaderboard(frames):
+    """Leaderboard of a million synthetic players: bulk load, score updates, rank, around-me and page reads."""
+    from leaderboard import bench
+
+    bench(1000000, frames * 10)
+
+
+def bench_arena(frames):
+    """Arena ticks with the spatial hash against checking all pairs, which must end the same."""
+    from arena import run_headless, AllPairs
+
+    for count in (64, 256, 1024):
+        arena, grid_time = run_headless(count, 0, frames, seed=1)
+        brute, brute_time = run_headless(count, 0, frames, seed=1, grid=AllPairs())
+        if arena.checksum() != brute.checksum():
+            raise SystemExit(f"arena with {count} fighters differs between the spatial hash and all pairs")
+        print(f"{f'arena {count} fighters':<32} {grid_time * 1000 / arena.tick:8.3f} ms/tick grid  {brute_time * 1000 / brute.tick:8.3f} ms/tick all pairs  ({arena.tick} ticks)")
+
+
+# a tick may do at most two attack tests (one per fighter); keep both well inside a 60 FPS frame
+MASK_TICK_BUDGET_MS = 0.25
+
+
+def bench_masks(frames):
+    """Pixel hit tests with bounding box culling, against the attack box and a per-tick budget."""
+    setup_screen()
+    fighter_1, fighter_2 = load_fighters()
+    start = time.perf_counter()
+    for fighter in (fighter_1, fighter_2):
+        for flip in (False, True):
+            fighter.flip = flip
+            fighter.get_masks()
+    report("build masks (once per sheet)", time.perf_counter() - start, 4)
+
+    # every distance, facing, attack and target pose around the attacker
+    cases = []
+    for dx in range(-400, 401, 20):
+        for flip in (False, True):
+            for attack_type in (1, 2):
+                for action, steps in enumerate(fighter_2.animation_steps):
+                    cases.append((dx, flip, attack_type, action, frames % steps))
+    fighter_1.rect.x = 400
+    worst = 0
+    total = 0
+    mask_hits = box_hits = 0
+    for dx, flip, attack_type, action, frame in cases:
+        fighter_1.flip = flip
+        fighter_1.attack_type = attack_type
+        fighter_2.rect.x = 400 + dx
+        fighter_2.flip = dx < 0
+        fighter_2.action = action
+        fighter_2.display_frame = frame
+        # best of a few runs, so a context switch is not mistaken for the cost of a test
+        elapsed = None
+        for _ in range(5):
+            start = time.perf_counter()
+            hit = fighter_1.attack_hits(fighter_2)
+            run = time.perf_counter() - start
+            elapsed = run if elapsed is None else min(elapsed, run)
+        total += elapsed
+        worst = max(worst, elapsed)
+        mask_hits += hit
+        box_hits += fighter_1.attack_rect().colliderect(fighter_2.rect)
+    print(f"{'mask hit test':<32} {total * 1e6 / len(cases):8.3f} us mean  {worst * 1e6:8.3f} us worst  ({len(cases)} tests)")
+    print(f"{'hits mask / box':<32} {mask_hits:8} / {box_hits}")
+    if 2 * worst * 1000 > MASK_TICK_BUDGET_MS:
+        raise SystemExit(f"two worst case mask tests take {2 * worst * 1000:.3f} ms, over the {MASK_TICK_BUDGET_MS} ms tick budget")
+    print(f"{'worst tick':<32} {2 * worst * 1000:8.3f} ms  (budget {MASK_TICK_BUDGET_MS} ms)")
+
+
+BENCHMARKS = {
+    "accounts": bench_accounts,
+    "arena": bench_arena,
+    "draw": bench_draw,
+    "env": bench_env,
+    "headless": bench_headless,
+    "leaderboard": bench_leaderboard,
+    "masks": bench_masks,
+    "batch": bench_batch,
+    "parity": check_parity,
+    "profiles": bench_profiles,
+    "replay": bench_replay,
+    "server": bench_server,
+    "snapshot": bench_snapshot,
+}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Stellar Fight micro benchmarks")
+    parser.add_argument("benchmark", choices=sorted(BENCHMARKS) + ["all"])
+    parser.add_argument("--frames", type=int, default=600)
+    parser.add_argument("--window", action="store_true", help="use a real window instead of the dummy video driver")
+    parser.add_argument("--replay", action="append", default=[], help="replay file to use as the replay workload (repeatable)")
+    args = parser.parse_args()
+    REPLAYS.extend(args.replay)
+
+    names = sorted(BENCHMARKS) if args.benchmark == "all" else [args.benchmark]
+    for name in names:
+        BENCHMARKS[name](args.frames)
+    pygame.quit()
@@ -0,0 +1,77 @@
+import sys
+
+# The game's way to the Stellar network. Importing stellar_sdk and requests
+# takes most of a second and a fight never touches the network, so
+# stellar_integration (and channels) are only imported the first time one of
+# these functions is called. Each call looks the function up on the module,
+# so it always reaches what stellar_integration currently has.
+
+
+def _integration():
+    import stellar_integration
+    return stellar_integration
+
+
+def loaded():
+    """Whether the Stellar layer has been imported yet."""
+    return "stellar_integration" in sys.modules
+
+
+def keypair(secret):
+    return _integration().Keypair.from_secret(secret)
+
+
+def initialize_game_stellar_setup():
+    return _integration().initialize_game_stellar_setup()
+
+
+def load_channel_pool():
+    import channels
+    return channels.load_channel_pool()
+
+
+def set_channel_pool(pool):
+    return _integration().set_channel_pool(pool)
+
+
+def create_and_fund_account():
+    return _integration().create_and_fund_account()
+
+
+def initialize_player_account(username, account=None):
+    return _integration().initialize_player_account(username, account)
+
+
+def load_or_create_player_data(username):
+    return _integration().load_or_create_player_data(username)
+
+
+def load_players(usernames):
+    return _integration().load_players(usernames)
+
+
+def load_or_create_guild_account(guild_name):
+    return _integration().load_or_create_guild_account(guild_name)
+
+
+def get_balance(account_id):
+    return _integration().get_balance(account_id)
+
+
+def update_player_coins(public_key, amount):
+    return _integration().update_player_coins(public_key, amount)
+
+
+def setup_smart_contract(player_account, guild_account, daily_amount):
+    return _integration().setup_smart_contract(player_account, guild_account, daily_amount)
+
+
+def collect_daily_transfers(player_accounts, guild_account, daily_amount):
+    return _integration().collect_daily_transfers(player_accounts, guild_account, daily_amount)
+
+
+def latency_stats():
+    """Horizon call latencies, empty when nothing has talked to the network."""
+    if not loaded():
+        return {}
+    return _integration().horizon.latency_stats()
@@ -0,0 +1,109 @@
+import random
+from simulation import INPUT_LEFT, INPUT_RIGHT, INPUT_JUMP, INPUT_ATTACK1, INPUT_ATTACK2
+
+# computer opponents: a bot is called as bot(match, player) once per tick and returns input bits
+
+# distance between fighter centres at which the attack box reaches the opponent
+ATTACK_RANGE = 150
+
+
+def fighters(match, player):
+    """Return (me, opponent) for the given player number."""
+    if player == 1:
+        return match.fighter_1, match.fighter_2
+    return match.fighter_2, match.fighter_1
+
+
+def towards(me, opponent):
+    return INPUT_RIGHT if opponent.rect.centerx > me.rect.centerx else INPUT_LEFT
+
+
+def away(me, opponent):
+    return INPUT_LEFT if opponent.rect.centerx > me.rect.centerx else INPUT_RIGHT
+
+
+class IdleBot:
+    """Never presses anything; a baseline for the others."""
+
+    def __call__(self, match, player):
+        return 0
+
+
+class RandomBot:
+    """Presses random buttons, reproducibly for a given seed."""
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+
+    def __call__(self, match, player):
+        return self.rng.getrandbits(5)
+
+
+class AggressiveBot:
+    """Walks straight at the opponent and attacks as soon as it is in range."""
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+
+    def __call__(self, match, player):
+        me, opponent = fighters(match, player)
+        if abs(opponent.rect.centerx - me.rect.centerx) > ATTACK_RANGE:
+            return towards(me, opponent)
+        if me.attack_cooldown == 0:
+            return self.rng.choice((INPUT_ATTACK1, INPUT_ATTACK2))
+        return 0
+
+
+class CounterBot:
+    """Keeps its distance while the opponent can attack and punishes it during its cooldown."""
+
+    def __init__(self, seed=0):
+        self.rng = random.Random(seed)
+
+    def __call__(self, match, player):
+        me, opponent = fighters(match, player)
+        distance = abs(opponent.rect.centerx - me.rect.centerx)
+        if opponent.attacking and distance < ATTACK_RANGE * 1.5:
+            return away(me, opponent) | INPUT_JUMP
+        if opponent.attack_cooldown > 0 or opponent.hit:
+            if distance > ATTACK_RANGE:
+                return towards(me, opponent)
+            return INPUT_ATTACK1 if me.attack_cooldown == 0 else 0
+        if distance < ATTACK_RANGE:
+            return away(me, opponent)
+        if distance > ATTACK_RANGE * 2:
+            return towards(me, opponent)
+        return INPUT_JUMP if self.rng.random() < 0.02 else 0
+
+
+class PolicyBot:
+    """Plays a policy trained on the vectorized environment (env.py) from the same observations."""
+
+    def __init__(self, policy):
+        self.policy = policy
+
+    def __call__(self, match, player):
+        from env import observe_match
+        return int(self.policy.act(observe_match(match, player)[None])[0])
+
+
+def load_policy_bot(path):
+    """A PolicyBot for a policy file written by env.py train; needs numpy, unlike the other bots."""
+    from env import load_policy
+    return PolicyBot(load_policy(path))
+
+
+BOTS = {
+    "idle": IdleBot,
+    "random": RandomBot,
+    "aggressive": AggressiveBot,
+    "counter": CounterBot
+}
+
+
+def make_bot(name, seed=0):
+    """Create a bot by name; every bot but 'idle' takes a seed for reproducible matches."""
+    bot_class = BOTS[name]
+    if bot_class is IdleBot:
+        return bot_class()
+    return bot_class(seed)
@@ -0,0 +1,129 @@
+import argparse
+import json
+import logging
+import queue
+from contextlib import contextmanager
+from stellar_sdk import Keypair, Asset
+from stellar_sdk.exceptions import NotFoundError, BadResponseError, BadRequestError
+from stellar_integration import STELLAR_CONFIG, horizon, create_and_fund_account, initialize_game_stellar_setup
+
+logger = logging.getLogger(__name__)
+
+# keys of the channel accounts used as transaction sources for reward issuance
+CHANNEL_KEYS_FILE = "stellar_channel_keys.json"
+
+# channels are topped up with XLM from the distributor when they drop below this
+CHANNEL_MIN_XLM = 50
+CHANNEL_TOP_UP_XLM = 200
+
+
+class ChannelPool:
+    """Pre-funded accounts that act as transaction sources so issuance is not serialized on the issuer.
+
+    Each channel pays the fee and provides the sequence number, while the issuer
+    only signs the payment operation itself, so N channels allow N transactions in flight.
+    """
+
+    def __init__(self, keypairs):
+        self.keypairs = list(keypairs)
+        self._free = queue.Queue()
+        for keypair in self.keypairs:
+            self._free.put(keypair)
+
+    def __len__(self):
+        return len(self.keypairs)
+
+    @contextmanager
+    def channel(self, timeout=None):
+        """Borrow a channel for one transaction, waiting for a free one if all are busy."""
+        keypair = self._free.get(timeout=timeout)
+        try:
+            yield keypair
+        finally:
+            self._free.put(keypair)
+
+
+def load_channel_keys(path=CHANNEL_KEYS_FILE):
+    try:
+        with open(path, "r") as f:
+            return [Keypair.from_secret(secret) for secret in json.load(f)["channel_secret_keys"]]
+    except FileNotFoundError:
+        return []
+
+
+def save_channel_keys(keypairs, path=CHANNEL_KEYS_FILE):
+    with open(path, "w") as f:
+        json.dump({"channel_secret_keys": [keypair.secret for keypair in keypairs]}, f)
+    logger.info(f"{len(keypairs)} channel account keys saved to {path}")
+
+
+def load_channel_pool(path=CHANNEL_KEYS_FILE):
+    """Return a pool of the provisioned channels, or None if there are none."""
+    keypairs = load_channel_keys(path)
+    if not keypairs:
+        return None
+    logger.info(f"Using {len(keypairs)} channel accounts for issuance.")
+    return ChannelPool(keypairs)
+
+
+def provision_channels(count, path=CHANNEL_KEYS_FILE):
+    """Create and fund channel accounts until there are count of them."""
+    keypairs = load_channel_keys(path)
+    while len(keypairs) < count:
+        account = create_and_fund_account()
+        if not account:
+            logger.error("Failed to create channel account. Stopping provisioning.")
+            break
+        keypairs.append(account)
+        save_channel_keys(keypairs, path)
+    return keypairs
+
+
+def native_balance(public_key):
+    account = horizon.account_info(public_key)
+    for balance in account["balances"]:
+        if balance["asset_type"] == "native":
+            return float(balance["balance"])
+    return 0.0
+
+
+def top_up_channels(keypairs, min_balance=CHANNEL_MIN_XLM, amount=CHANNEL_TOP_UP_XLM):
+    """Send XLM from the distributor to every channel whose balance fell below min_balance."""
+    distributor = Keypair.from_secret(STELLAR_CONFIG["distribution_account_secret"])
+    topped_up = 0
+    for keypair in keypairs:
+        try:
+            balance = native_balance(keypair.public_key)
+            if balance >= min_balance:
+                continue
+            horizon.submit(distributor, lambda builder: builder.append_payment_op(
+                destination=keypair.public_key,
+                asset=Asset.native(),
+                amount=str(amount),
+            ))
+            topped_up += 1
+            logger.info(f"Topped up channel {keypair.public_key} from {balance} XLM.")
+        except (NotFoundError, BadResponseError, BadRequestError) as e:
+            logger.error(f"Error topping up channel {keypair.public_key}: {str(e)}")
+    return topped_up
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Provision and maintain the channel accounts used for reward issuance")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    provision_parser = subparsers.add_parser("provision", help="create channel accounts until there are COUNT of them")
+    provision_parser.add_argument("count", type=int)
+    top_up_parser = subparsers.add_parser("topup", help="refill channels that are low on XLM")
+    top_up_parser.add_argument("--min", type=float, default=CHANNEL_MIN_XLM)
+    top_up_parser.add_argument("--amount", type=float, default=CHANNEL_TOP_UP_XLM)
+    subparsers.add_parser("status", help="show the XLM balance of every channel")
+    args = parser.parse_args()
+
+    if args.command == "provision":
+        print(f"{len(provision_channels(args.count))} channel accounts provisioned.")
+    elif args.command == "topup":
+        initialize_game_stellar_setup()
+        print(f"{top_up_channels(load_channel_keys(), args.min, args.amount)} channel accounts topped up.")
+    elif args.command == "status":
+        for keypair in load_channel_keys():
+            print(f"{keypair.public_key}: {native_balance(keypair.public_key)} XLM")
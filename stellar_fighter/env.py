@@ -0,0 +1,276 @@
+import argparse
+import time
+import numpy as np
+from batch_simulation import BatchMatch
+from simulation import SCREEN_WIDTH, SCREEN_HEIGHT, ATTACK_COOLDOWN_TICKS, JUMP_VELOCITY, INPUT_LEFT, INPUT_RIGHT, INPUT_ATTACK1, INPUT_ATTACK2
+
+# Gym style vectorized environment on the batch simulator: many matches step
+# together, observations and actions are NumPy arrays and finished matches
+# start over on their own. An action is the input bits of one tick (0-31).
+# Observations are from the acting player's point of view, so one policy can
+# play either side, and against itself.
+
+ACTION_COUNT = 32
+ACTIONS = 7# 0:idle 1:run 2:jump 3:attack1 4:attack2 5:hit 6:death
+# distance between fighters at which the attack box reaches, as in bots.py
+ATTACK_RANGE = 150
+
+
+def observe(state, side):
+    """Observations of one side, shape (N, OBSERVATION_SIZE), from (2, N) fighter arrays."""
+    other = 1 - side
+    x, y = state.x, state.y
+    columns = [
+        x[side] / SCREEN_WIDTH, y[side] / SCREEN_HEIGHT,
+        x[other] / SCREEN_WIDTH, y[other] / SCREEN_HEIGHT,
+        (x[other] - x[side]) / SCREEN_WIDTH,
+        state.vel_y[side] / -JUMP_VELOCITY, state.vel_y[other] / -JUMP_VELOCITY,
+        state.health[side] / 100, state.health[other] / 100,
+        state.attack_cooldown[side] / ATTACK_COOLDOWN_TICKS, state.attack_cooldown[other] / ATTACK_COOLDOWN_TICKS,
+        state.attacking[side], state.attacking[other],
+        state.jump[side], state.jump[other],
+        state.hit[side], state.hit[other],
+        state.flip[side], state.flip[other],
+        state.round_over, state.intro_count > 0
+    ]
+    columns += [state.action[other] == action for action in range(ACTIONS)]
+    return np.stack(columns, axis=1).astype(np.float32)
+
+
+OBSERVATION_SIZE = 21 + ACTIONS
+
+
+class _MatchArrays:
+    """A single Match laid out like BatchMatch, so observe() works on it unchanged."""
+
+    def __init__(self, match):
+        fighters = (match.fighter_1, match.fighter_2)
+        for name in ("vel_y", "health", "attack_cooldown", "attacking", "jump", "hit", "flip", "action"):
+            setattr(self, name, np.array([[getattr(fighter, name)] for fighter in fighters]))
+        self.x = np.array([[fighter.rect.x] for fighter in fighters])
+        self.y = np.array([[fighter.rect.y] for fighter in fighters])
+        self.round_over = np.array([match.round_over])
+        self.intro_count = np.array([match.intro_count])
+
+
+def observe_match(match, player):
+    """The observation of player 1 or 2 in a simulation.Match, the same as the environment gives."""
+    return observe(_MatchArrays(match), player - 1)[0]
+
+
+def random_opponent(rng):
+    def act(batch, side):
+        return rng.integers(0, ACTION_COUNT, size=batch.count)
+    return act
+
+
+def aggressive_opponent(rng):
+    """The AggressiveBot from bots.py for every match at once."""
+    def act(batch, side):
+        other = 1 - side
+        dx = batch.x[other] - batch.x[side]
+        towards = np.where(dx > 0, INPUT_RIGHT, INPUT_LEFT)
+        attack = np.where(rng.random(batch.count) < 0.5, INPUT_ATTACK1, INPUT_ATTACK2) * (batch.attack_cooldown[side] == 0)
+        return np.where(np.abs(dx) > ATTACK_RANGE, towards, attack)
+    return act
+
+
+def idle_opponent(batch, side):
+    return np.zeros(batch.count, np.int32)
+
+
+OPPONENTS = {
+    "random": random_opponent,
+    "aggressive": aggressive_opponent,
+    "idle": lambda rng: idle_opponent
+}
+
+
+class FighterVecEnv:
+    """num_envs matches in one process.
+
+    With an opponent ("random", "aggressive", "idle", or a function of
+    (batch, side) returning player 2's actions) the agent plays player 1:
+    actions have shape (N,), observations (N, OBSERVATION_SIZE) and rewards (N,).
+    With opponent=None it is self-play: actions (N, 2), observations (N, 2, OBSERVATION_SIZE)
+    and rewards (N, 2), one column per player.
+
+    The reward is the damage dealt minus the damage taken, as a fraction of full
+    health, plus 1 for each round won and -1 for each round lost. A match ends
+    (terminated) when a side has won or is cut short (truncated) after max_ticks;
+    either way it is reset at once and the last observation of the finished
+    match is in info["final_observation"].
+    """
+
+    def __init__(self, num_envs, opponent="random", max_ticks=60 * 60 * 2, action_repeat=1, intro_count=0, seed=None, **rules):
+        self.num_envs = num_envs
+        self.max_ticks = max_ticks
+        self.action_repeat = action_repeat
+        self.rng = np.random.default_rng(seed)
+        self.self_play = opponent is None
+        if isinstance(opponent, str):
+            opponent = OPPONENTS[opponent](self.rng)
+        self.opponent = opponent
+        self.batch = BatchMatch(num_envs, intro_count=intro_count, **rules)
+        self.episode_returns = np.zeros((num_envs, 2), np.float32)
+
+    def _observation(self):
+        if self.self_play:
+            return np.stack([observe(self.batch, 0), observe(self.batch, 1)], axis=1)
+        return observe(self.batch, 0)
+
+    def reset(self, seed=None):
+        if seed is not None:
+            self.rng = np.random.default_rng(seed)
+        self.batch.reset(np.ones(self.num_envs, bool))
+        self.episode_returns[:] = 0
+        return self._observation(), {}
+
+    def step(self, actions):
+        batch = self.batch
+        actions = np.asarray(actions, dtype=np.int32) & (ACTION_COUNT - 1)
+        rewards = np.zeros((self.num_envs, 2), np.float32)
+        for _ in range(self.action_repeat):
+            if self.self_play:
+                inputs = actions
+            else:
+                inputs = np.stack([actions, np.asarray(self.opponent(batch, 1), dtype=np.int32)], axis=1)
+            health = batch.health.copy()
+            score = batch.score.copy()
+            live = ~batch.finished
+            batch.step(inputs)
+            # a new round puts health back up, which is not damage
+            lost = np.maximum(health - batch.health, 0) / 100
+            rounds = batch.score - score
+            rewards[:, 0] += np.where(live, lost[1] - lost[0] + rounds[0] - rounds[1], 0)
+            rewards[:, 1] += np.where(live, lost[0] - lost[1] + rounds[1] - rounds[0], 0)
+        self.episode_returns += rewards
+
+        terminated = batch.finished.copy()
+        truncated = ~terminated & (batch.tick >= self.max_ticks)
+        info = {}
+        done = terminated | truncated
+        if done.any():
+            info["final_observation"] = self._observation()
+            info["episode_return"] = self.episode_returns[:, 0 if not self.self_play else slice(None)].copy()
+            info["done"] = done
+            batch.reset(done)
+            self.episode_returns[done] = 0
+        if self.self_play:
+            return self._observation(), rewards, terminated, truncated, info
+        return self._observation(), rewards[:, 0], terminated, truncated, info
+
+
+class NumpyPolicy:
+    """A small MLP over observations: tanh hidden layers, greedy choice of the action with the highest score."""
+
+    def __init__(self, layers):
+        self.layers = layers# [(weights, bias), ...]
+
+    def scores(self, observations):
+        out = observations
+        for i, (weights, bias) in enumerate(self.layers):
+            out = out @ weights + bias
+            if i < len(self.layers) - 1:
+                out = np.tanh(out)
+        return out
+
+    def act(self, observations):
+        return np.argmax(self.scores(observations), axis=-1)
+
+    def save(self, path):
+        arrays = {}
+        for i, (weights, bias) in enumerate(self.layers):
+            arrays[f"w{i}"] = weights
+            arrays[f"b{i}"] = bias
+        np.savez(path, **arrays)
+
+
+def load_policy(path):
+    with np.load(path) as data:
+        layers = []
+        while f"w{len(layers)}" in data:
+            i = len(layers)
+            layers.append((data[f"w{i}"], data[f"b{i}"]))
+    if not layers or layers[0][0].shape[0] != OBSERVATION_SIZE:
+        raise ValueError(f"{path} is not a policy for {OBSERVATION_SIZE} observation features")
+    return NumpyPolicy(layers)
+
+
+def train(opponent="random", generations=30, population=32, envs_per_candidate=16, ticks=1200, hidden=32, seed=0):
+    """Cross-entropy method on a one hidden layer policy; returns the mean of the final elite."""
+    rng = np.random.default_rng(seed)
+    shapes = [(OBSERVATION_SIZE, hidden), (hidden,), (hidden, ACTION_COUNT), (ACTION_COUNT,)]
+    sizes = [int(np.prod(shape)) for shape in shapes]
+    mean = np.zeros(sum(sizes), np.float32)
+    std = np.full(sum(sizes), 0.5, np.float32)
+    elite_count = max(2, population // 4)
+
+    def unpack(params):
+        arrays = []
+        position = 0
+        for shape, size in zip(shapes, sizes):
+            arrays.append(params[..., position:position + size].reshape(params.shape[:-1] + shape))
+            position += size
+        return arrays
+
+    for generation in range(generations):
+        candidates = mean + std * rng.standard_normal((population, mean.size)).astype(np.float32)
+        w0, b0, w1, b1 = unpack(candidates)
+        env = FighterVecEnv(population * envs_per_candidate, opponent, seed=rng.integers(1 << 31))
+        observations, _ = env.reset()
+        totals = np.zeros(population * envs_per_candidate, np.float32)
+        for _ in range(ticks):
+            per_candidate = observations.reshape(population, envs_per_candidate, OBSERVATION_SIZE)
+            hidden_out = np.tanh(np.einsum("pno,poh->pnh", per_candidate, w0) + b0[:, None, :])
+            scores = np.einsum("pnh,pha->pna", hidden_out, w1) + b1[:, None, :]
+            observations, rewards, _, _, _ = env.step(np.argmax(scores, axis=-1).reshape(-1))
+            totals += rewards
+        fitness = totals.reshape(population, envs_per_candidate).mean(axis=1)
+        elite = np.argsort(fitness)[-elite_count:]
+        mean = candidates[elite].mean(axis=0)
+        # a floor on the spread keeps the search from collapsing on a lucky few matches
+        std = candidates[elite].std(axis=0) + 0.1
+        print(f"generation {generation + 1}: best {fitness[elite[-1]]:.2f}, elite {fitness[elite].mean():.2f}, mean {fitness.mean():.2f}")
+    w0, b0, w1, b1 = unpack(mean)
+    return NumpyPolicy([(w0, b0), (w1, b1)])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Train and test computer opponents on the vectorized environment")
+    parser.add_argument("command", choices=["train", "evaluate", "speed"])
+    parser.add_argument("--policy", default="policy.npz", help="policy file to write (train) or read (evaluate)")
+    parser.add_argument("--opponent", choices=sorted(OPPONENTS), default="random", help="player 2; aggressive is much harder to learn against")
+    parser.add_argument("--generations", type=int, default=30)
+    parser.add_argument("--envs", type=int, default=1024, help="matches to evaluate or time at once")
+    parser.add_argument("--ticks", type=int, default=3600)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.command == "train":
+        policy = train(args.opponent, args.generations, seed=args.seed)
+        policy.save(args.policy)
+        print(f"saved {args.policy}")
+    elif args.command == "evaluate":
+        policy = load_policy(args.policy)
+        env = FighterVecEnv(args.envs, args.opponent, seed=args.seed)
+        observations, _ = env.reset()
+        wins = losses = 0
+        for _ in range(args.ticks):
+            observations, _, terminated, _, info = env.step(policy.act(observations))
+            if terminated.any():
+                final = info["final_observation"][terminated]
+                # health of each side at the knockout that ended the match
+                wins += int((final[:, 7] > final[:, 8]).sum())
+                losses += int((final[:, 7] < final[:, 8]).sum())
+        print(f"{args.policy} against {args.opponent}: {wins} matches won, {losses} lost in {args.ticks} ticks of {args.envs} matches")
+    else:
+        env = FighterVecEnv(args.envs, args.opponent, seed=args.seed)
+        env.reset()
+        actions = np.random.default_rng(args.seed).integers(0, ACTION_COUNT, size=(64, args.envs))
+        start = time.perf_counter()
+        for tick in range(args.ticks):
+            env.step(actions[tick % 64])
+        elapsed = time.perf_counter() - start
+        steps = args.envs * args.ticks
+        print(f"{steps / elapsed:,.0f} env steps/s, {steps / elapsed * 3600 / 1e6:,.0f} million per hour ({args.envs} envs)")
@@ -1,194 +1,206 @@
 import pygame
+from simulation import FighterSim, INPUT_LEFT, INPUT_RIGHT, INPUT_JUMP, INPUT_ATTACK1, INPUT_ATTACK2
 
-class Fighter():
-  def __init__(self, player, x, y, flip, data, sprite_sheet, animation_steps):
-    self.player = player
-    self.size = data[0]
-    self.image_scale = data[1]
-    self.offset = data[2]
-    self.flip = flip
-    self.animation_list = self.load_images(sprite_sheet, animation_steps)
-    self.action = 0#0:idle #1:run #2:jump #3:attack1 #4: attack2 #5:hit #6:death
-    self.frame_index = 0
-    self.image = self.animation_list[self.action][self.frame_index]
-    self.update_time = pygame.time.get_ticks()
-    self.rect = pygame.Rect((x, y, 80, 180))
-    self.vel_y = 0
-    self.running = False
-    self.jump = False
-    self.attacking = False
-    self.attack_type = 0
-    self.attack_cooldown = 0
-    self.hit = False
-    self.health = 100
-    self.alive = True
+#scaled animation frames shared by every fighter, keyed by (sprite sheet, size, scale, animation steps, flip)
+_frame_cache = {}
 
 
-  def load_images(self, sprite_sheet, animation_steps):
-    #extract images from spritesheet
+def load_frames(sprite_sheet, size, image_scale, animation_steps, flip=False):
+  #extract images from spritesheet once per process and hand out the same read-only frames afterwards
+  key = (sprite_sheet, size, image_scale, tuple(animation_steps), flip)
+  frames = _frame_cache.get(key)
+  if frames is None and flip:
+    #mirrored frames are derived from the already scaled ones
+    frames = tuple(tuple(pygame.transform.flip(img, True, False) for img in animation) for animation in load_frames(sprite_sheet, size, image_scale, animation_steps))
+    _frame_cache[key] = frames
+  elif frames is None:
     animation_list = []
     for y, animation in enumerate(animation_steps):
       temp_img_list = []
       for x in range(animation):
-        temp_img = sprite_sheet.subsurface(x * self.size, y * self.size, self.size, self.size)
-        temp_img_list.append(pygame.transform.scale(temp_img, (self.size * self.image_scale, self.size * self.image_scale)))
-      animation_list.append(temp_img_list)
-    return animation_list
+        temp_img = sprite_sheet.subsurface(x * size, y * size, size, size)
+        temp_img_list.append(pygame.transform.scale(temp_img, (size * image_scale, size * image_scale)))
+      animation_list.append(tuple(temp_img_list))
+    frames = tuple(animation_list)
+    _frame_cache[key] = frames
+  return frames
+
+
+#opaque area of each cached frame, so drawing only touches pixels that can change
+_visible_rects = {}
+
+
+def get_visible_rect(img):
+  rect = _visible_rects.get(img)
+  if rect is None:
+    rect = img.get_bounding_rect()
+    _visible_rects[img] = rect
+  return rect
+
+
+class FrameMasks():
+  #collision masks for one set of cached frames, built once from the frames' alpha
+  #hitbox: what an attack animation reaches in front of the fighter beyond its idle body, one per attack
+  #hurtbox: the opaque pixels of each frame, less the reach of the attack being played
+  def __init__(self, frames, centre_x, flip):
+    silhouettes = [[pygame.mask.from_surface(img) for img in animation] for animation in frames]
+    width, height = silhouettes[0][0].get_size()
+    #the idle pose grown by a few pixels, so small body movements during an attack do not count as reach
+    body = silhouettes[0][0].convolve(pygame.mask.Mask((9, 9), fill=True))
+    #wind ups swing behind the fighter, only what is in front of its centre can hit
+    if flip:
+      behind, behind_x = pygame.mask.Mask((width - centre_x, height), fill=True), centre_x
+    else:
+      behind, behind_x = pygame.mask.Mask((centre_x, height), fill=True), 0
+    self.hitboxes = {}
+    for action in (3, 4):#3:attack1 #4:attack2
+      reach = pygame.mask.Mask((width, height))
+      for mask in silhouettes[action]:
+        reach.draw(mask, (0, 0))
+      reach.erase(body, (-4, -4))
+      reach.erase(behind, (behind_x, 0))
+      self.hitboxes[action] = (reach, bounds(reach))
+      for mask in silhouettes[action]:
+        mask.erase(reach, (0, 0))
+    self.hurtboxes = tuple(tuple(animation) for animation in silhouettes)
+    self.hurtbox_bounds = tuple(tuple(bounds(mask) for mask in animation) for animation in self.hurtboxes)
+
+
+def bounds(mask):
+  #smallest rect around every set bit of a mask
+  rects = mask.get_bounding_rects()
+  return rects[0].unionall(rects[1:]) if rects else pygame.Rect(0, 0, 0, 0)
+
+
+#masks of each cached frame set, keyed like _frame_cache
+_mask_cache = {}
+
+
+def load_masks(sprite_sheet, size, image_scale, animation_steps, centre_x, flip=False):
+  #centre_x: x of the fighter's centre in the unflipped frame
+  key = (sprite_sheet, size, image_scale, tuple(animation_steps), centre_x, flip)
+  masks = _mask_cache.get(key)
+  if masks is None:
+    if flip:
+      centre_x = size * image_scale - centre_x
+    masks = FrameMasks(load_frames(sprite_sheet, size, image_scale, animation_steps, flip), centre_x, flip)
+    _mask_cache[key] = masks
+  return masks
+
+
+def clear_frame_cache():
+  _frame_cache.clear()
+  _visible_rects.clear()
+  _mask_cache.clear()
+
+
+#keyboard controls of each player
+KEY_BINDINGS = {
+  1: ((pygame.K_a, INPUT_LEFT), (pygame.K_d, INPUT_RIGHT), (pygame.K_w, INPUT_JUMP), (pygame.K_r, INPUT_ATTACK1), (pygame.K_t, INPUT_ATTACK2)),
+  2: ((pygame.K_LEFT, INPUT_LEFT), (pygame.K_RIGHT, INPUT_RIGHT), (pygame.K_UP, INPUT_JUMP), (pygame.K_o, INPUT_ATTACK1), (pygame.K_p, INPUT_ATTACK2))
+}
+
+
+def read_input(player):
+  #turn the player's pressed keys into the input bits the simulation expects
+  key = pygame.key.get_pressed()
+  inputs = 0
+  for key_code, bit in KEY_BINDINGS[player]:
+    if key[key_code]:
+      inputs |= bit
+  return inputs
+
+
+class Fighter(FighterSim):
+  #a simulated fighter plus its sprites
+  #with precise_hits attacks test the attack's hitbox mask against the target's current frame
+  #instead of the fixed attack box; outcomes then depend on the sprites, so headless
+  #simulations and replays of such matches no longer agree with what was played
+  precise_hits = False
 
+  def __init__(self, player, x, y, flip, data, sprite_sheet, animation_steps):
+    super().__init__(player, x, y, flip, data, animation_steps)
+    self.sprite_sheet = sprite_sheet
+    self.animation_list = self.load_images(sprite_sheet, animation_steps)
+    self.flipped_list = None
+    self.image = self.get_frames()[self.action][self.frame_index]
 
-  def move(self, screen_width, screen_height, surface, target, round_over):
-    SPEED = 10
-    GRAVITY = 2
-    dx = 0
-    dy = 0
-    self.running = False
-    self.attack_type = 0
-
-    #get keypresses
-    key = pygame.key.get_pressed()
-
-    #can only perform other actions if not currently attacking
-    if self.attacking == False and self.alive == True and round_over == False:
-      #check player 1 controls
-      if self.player == 1:
-        #movement
-        if key[pygame.K_a]:
-          dx = -SPEED
-          self.running = True
-        if key[pygame.K_d]:
-          dx = SPEED
-          self.running = True
-        #jump
-        if key[pygame.K_w] and self.jump == False:
-          self.vel_y = -30
-          self.jump = True
-        #attack
-        if key[pygame.K_r] or key[pygame.K_t]:
-          self.attack(target)
-          #determine which attack type was used
-          if key[pygame.K_r]:
-            self.attack_type = 1
-          if key[pygame.K_t]:
-            self.attack_type = 2
-
-
-      #check player 2 controls
-      if self.player == 2:
-        #movement
-        if key[pygame.K_LEFT]:
-          dx = -SPEED
-          self.running = True
-        if key[pygame.K_RIGHT]:
-          dx = SPEED
-          self.running = True
-        #jump
-        if key[pygame.K_UP] and self.jump == False:
-          self.vel_y = -30
-          self.jump = True
-        #attack
-        if key[pygame.K_o] or key[pygame.K_p]:
-          self.attack(target)
-          #determine which attack type was used
-          if key[pygame.K_o]:
-            self.attack_type = 1
-          if key[pygame.K_p]:
-            self.attack_type = 2
-
-
-    #apply gravity
-    self.vel_y += GRAVITY
-    dy += self.vel_y
-
-    #ensure player stays on screen
-    if self.rect.left + dx < 0:
-      dx = -self.rect.left
-    if self.rect.right + dx > screen_width:
-      dx = screen_width - self.rect.right
-    if self.rect.bottom + dy > screen_height - 110:
-      self.vel_y = 0
-      self.jump = False
-      dy = screen_height - 110 - self.rect.bottom
-
-    #ensure players face each other
-    if target.rect.centerx > self.rect.centerx:
-      self.flip = False
-    else:
-      self.flip = True
 
-    #apply attack cooldown
-    if self.attack_cooldown > 0:
-      self.attack_cooldown -= 1
+  def load_images(self, sprite_sheet, animation_steps):
+    #frames come from the shared cache, so they must never be drawn on
+    return load_frames(sprite_sheet, self.size, self.image_scale, animation_steps)
 
-    #update player position
-    self.rect.x += dx
-    self.rect.y += dy
 
+  def get_frames(self):
+    #mirrored frames are only built the first time a fighter faces left
+    if not self.flip:
+      return self.animation_list
+    if self.flipped_list is None:
+      self.flipped_list = load_frames(self.sprite_sheet, self.size, self.image_scale, self.animation_steps, True)
+    return self.flipped_list
 
-  #handle animation updates
-  def update(self):
-    #check what action the player is performing
-    if self.health <= 0:
-      self.health = 0
-      self.alive = False
-      self.update_action(6)#6:death
-    elif self.hit == True:
-      self.update_action(5)#5:hit
-    elif self.attacking == True:
-      if self.attack_type == 1:
-        self.update_action(3)#3:attack1
-      elif self.attack_type == 2:
-        self.update_action(4)#4:attack2
-    elif self.jump == True:
-      self.update_action(2)#2:jump
-    elif self.running == True:
-      self.update_action(1)#1:run
-    else:
-      self.update_action(0)#0:idle
 
-    animation_cooldown = 50
-    #update image
-    self.image = self.animation_list[self.action][self.frame_index]
-    #check if enough time has passed since the last update
-    if pygame.time.get_ticks() - self.update_time > animation_cooldown:
-      self.frame_index += 1
-      self.update_time = pygame.time.get_ticks()
-    #check if the animation has finished
-    if self.frame_index >= len(self.animation_list[self.action]):
-      #if the player is dead then end the animation
-      if self.alive == False:
-        self.frame_index = len(self.animation_list[self.action]) - 1
-      else:
-        self.frame_index = 0
-        #check if an attack was executed
-        if self.action == 3 or self.action == 4:
-          self.attacking = False
-          self.attack_cooldown = 20
-        #check if damage was taken
-        if self.action == 5:
-          self.hit = False
-          #if the player was in the middle of an attack, then the attack is stopped
-          self.attacking = False
-          self.attack_cooldown = 20
+  def get_masks(self):
+    centre_x = self.offset[0] * self.image_scale + self.rect.width // 2
+    return load_masks(self.sprite_sheet, self.size, self.image_scale, self.animation_steps, centre_x, self.flip)
+
+
+  def prepare_masks(self):
+    #building masks takes a moment, do it while loading rather than at the first attack
+    flip = self.flip
+    for self.flip in (False, True):
+      self.get_masks()
+    self.flip = flip
+
+
+  def image_origin(self):
+    #where the top left of the current frame is drawn
+    return (self.rect.x - (self.offset[0] * self.image_scale), self.rect.y - (self.offset[1] * self.image_scale))
 
 
   def attack(self, target):
-    if self.attack_cooldown == 0:
+    if not self.precise_hits or not isinstance(target, Fighter):
+      super().attack(target)
+    elif self.attack_cooldown == 0:
       #execute attack
       self.attacking = True
-      attacking_rect = pygame.Rect(self.rect.centerx - (2 * self.rect.width * self.flip), self.rect.y, 2 * self.rect.width, self.rect.height)
-      if attacking_rect.colliderect(target.rect):
-        target.health -= 10
+      if self.attack_hits(target):
+        target.health -= self.attack_damage
         target.hit = True
 
 
-  def update_action(self, new_action):
-    #check if the new action is different to the previous one
-    if new_action != self.action:
-      self.action = new_action
-      #update the animation settings
-      self.frame_index = 0
-      self.update_time = pygame.time.get_ticks()
+  def attack_hits(self, target):
+    hitbox, hit_bounds = self.get_masks().hitboxes[4 if self.attack_type == 2 else 3]
+    target_masks = target.get_masks()
+    hurtbox = target_masks.hurtboxes[target.action][target.display_frame]
+    hurt_bounds = target_masks.hurtbox_bounds[target.action][target.display_frame]
+    x, y = self.image_origin()
+    target_x, target_y = target.image_origin()
+    #bounding boxes first, the masks are only compared when those overlap
+    if not hit_bounds.move(x, y).colliderect(hurt_bounds.move(target_x, target_y)):
+      return False
+    return hitbox.overlap(hurtbox, (target_x - x, target_y - y)) is not None
+
+
+  def move(self, screen_width, screen_height, surface, target, round_over):
+    #step the simulation with the keyboard as input
+    self.step(read_input(self.player), screen_width, screen_height, target, round_over)
+
+
+  #handle animation updates
+  def update(self):
+    super().update()
+    #update image
+    self.image = self.get_frames()[self.action][self.display_frame]
+
+
+  def restore(self, state):
+    super().restore(state)
+    self.image = self.get_frames()[self.action][self.display_frame]
 
   def draw(self, surface):
-    img = pygame.transform.flip(self.image, self.flip, False)
-    surface.blit(img, (self.rect.x - (self.offset[0] * self.image_scale), self.rect.y - (self.offset[1] * self.image_scale)))
\ No newline at end of file
+    #image already faces the right way, so drawing is a plain blit of its opaque area
+    visible = get_visible_rect(self.image)
+    x = self.rect.x - (self.offset[0] * self.image_scale) + visible.x
+    y = self.rect.y - (self.offset[1] * self.image_scale) + visible.y
+    return surface.blit(self.image, (x, y), visible)
\ No newline at end of file
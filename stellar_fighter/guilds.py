@@ -1,8 +1,10 @@
 import pygame
 import json
+import threading
 from datetime import datetime, timedelta
-from stellar_sdk import Keypair
-from stellar_integration import load_or_create_guild_account, setup_smart_contract, execute_daily_transfer, load_or_create_player_data
+from blockchain import load_or_create_guild_account, setup_smart_contract, collect_daily_transfers, load_or_create_player_data, load_players, keypair
+from account_store import get_store, PLAYER
+from text_cache import render_text
 
 class Guild:
     def __init__(self, name, icon_path):
@@ -11,31 +13,62 @@ class Guild:
         self.members = []
         self.total_collected = 0
         self.last_collection_date = datetime.now().date()
-        self.account = load_or_create_guild_account(name)
+        self._account = None
+        self._account_lock = threading.Lock()
+        self.member_keys = {}
+
+    @property
+    def account(self):
+        # the Stellar account is only loaded, or created, when it is first needed
+        with self._account_lock:
+            if self._account is None:
+                self._account = load_or_create_guild_account(self.name)
+            return self._account
 
     def add_member(self, player):
         if player not in self.members:
             self.members.append(player)
             self.total_collected += 10  # Initial fee
-            player_data = load_or_create_player_data(player)
-            player_account = Keypair.from_secret(player_data["secret_key"])
+            player_account = self.member_keypair(player)
             setup_smart_contract(player_account, self.account, 10)
 
     def remove_member(self, player):
         if player in self.members:
             self.members.remove(player)
 
+    def collection_due(self):
+        return datetime.now().date() > self.last_collection_date
+
+    def member_keypair(self, player):
+        # keypairs are loaded once per member instead of on every collection
+        if player not in self.member_keys:
+            player_data = load_or_create_player_data(player)
+            self.member_keys[player] = keypair(player_data["secret_key"]) if player_data else None
+        return self.member_keys[player]
+
+    def load_member_keys(self, players):
+        # one bulk lookup for the members not loaded yet; any still missing are created one by one
+        missing = [player for player in players if player not in self.member_keys]
+        for player, player_data in load_players(missing).items():
+            self.member_keys[player] = keypair(player_data["secret_key"])
+
     def daily_collection(self):
+        """Collect the fees due from all members; returns whether each member paid."""
         today = datetime.now().date()
+        results = {}
         if today > self.last_collection_date:
             days_passed = (today - self.last_collection_date).days
-            for member in self.members:
-                amount_to_collect = 10 * days_passed
-                player_data = load_or_create_player_data(member)
-                player_account = Keypair.from_secret(player_data["secret_key"])
-                if execute_daily_transfer(player_account, self.account, amount_to_collect):
+            amount_to_collect = 10 * days_passed
+            self.load_member_keys(self.members)
+            members = [member for member in self.members if self.member_keypair(member)]
+            paid = collect_daily_transfers([self.member_keypair(member) for member in members], self.account, amount_to_collect)
+            results = {member: False for member in self.members}
+            for member, ok in zip(members, paid):
+                results[member] = ok
+                if ok:
                     self.total_collected += amount_to_collect
             self.last_collection_date = today
+        return results
 
     def render(self, screen, font):
         # Render guild information
@@ -71,7 +104,7 @@ def load_guild_data():
         return []
 
 def draw_text(text, font, color, x, y, center=False):
-    text_surface = font.render(text, True, color)
+    text_surface = render_text(font, text, color)
     text_rect = text_surface.get_rect()
     if center:
         text_rect.center = (x, y)
@@ -86,8 +119,4 @@ def draw_checkbox(screen, x, y, checked):
         pygame.draw.line(screen, (255, 255, 255), (x, y + 20), (x + 20, y), 2)
 
 def load_player_data(username):
-    try:
-        with open(f"{username}_stellar_data.json", "r") as f:
-            return json.load(f)
-    except FileNotFoundError:
-        return None
\ No newline at end of file
+    return get_store().get(PLAYER, username)
\ No newline at end of file
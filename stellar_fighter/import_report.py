@@ -0,0 +1,55 @@
+import builtins
+import sys
+import threading
+import time
+
+# Times the first import of every module from the moment it is installed, the
+# way python -X importtime does, so main.py --startup-report can show where
+# the time before the first frame goes.
+
+
+class ImportTimer:
+    """Wraps __import__ and records (cumulative, self) seconds for each module's first import."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.times = {}
+        self._original = builtins.__import__
+        # per thread stack of the time spent in nested imports, the startup pipeline imports too
+        self._local = threading.local()
+
+    def install(self):
+        builtins.__import__ = self._import
+
+    def uninstall(self):
+        builtins.__import__ = self._original
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        if level or name in sys.modules:
+            return self._original(name, globals, locals, fromlist, level)
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        stack.append(0.0)
+        start = time.perf_counter()
+        try:
+            return self._original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - start
+            nested = stack.pop()
+            if stack:
+                stack[-1] += elapsed
+            if name not in self.times:
+                self.times[name] = (elapsed, elapsed - nested)
+
+    def report(self, top=12):
+        """Lines describing the slowest imports, by cumulative time."""
+        total = sum(own for _, own in self.times.values())
+        lines = [f"imports: {total * 1000:.0f} ms in {len(self.times)} modules",
+                 f"{'cumulative':>12} {'self':>8}  module"]
+        slowest = sorted(self.times.items(), key=lambda item: item[1][0], reverse=True)[:top]
+        for name, (cumulative, own) in slowest:
+            lines.append(f"{cumulative * 1000:9.1f} ms {own * 1000:5.1f} ms  {name}")
+        for package in ("stellar_sdk", "requests"):
+            lines.append(f"{package} loaded: {'yes' if package in sys.modules else 'no'}")
+        return lines
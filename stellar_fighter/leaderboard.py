@@ -0,0 +1,318 @@
+import argparse
+import gc
+import random
+import sqlite3
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Ranked scores of every player. The order lives in an indexable skip list:
+# each link records how many entries it jumps over, so inserts, removals,
+# "what is my rank" and "entry number i" all take O(log n). The scores are
+# persisted to SQLite and the list is rebuilt in one sorted pass on load.
+
+LEADERBOARD_DB = "leaderboard.db"
+PAGE_SIZE = 8
+MAX_LEVELS = 16
+# chance a node also appears on the next level up; with 16 levels this stays O(log n) to about 4 billion entries
+LEVEL_UP = 0.25
+
+
+class _Node:
+    __slots__ = ("key", "next", "width")
+
+    def __init__(self, key, levels):
+        self.key = key
+        self.next = [None] * levels
+        # width[level] is how many positions next[level] is ahead of this node
+        self.width = [1] * levels
+
+
+# sorts after every (negated score, name) key
+_END = _Node((float("inf"),), 0)
+
+
+class IndexableSkipList:
+    """Sorted keys with positional access; positions start at 0."""
+
+    def __init__(self, seed=None):
+        self.rng = random.Random(seed)
+        self.clear()
+
+    def clear(self):
+        self.head = _Node(None, MAX_LEVELS)
+        self.head.next = [_END] * MAX_LEVELS
+        self.size = 0
+
+    def __len__(self):
+        return self.size
+
+    def _level(self):
+        levels = 1
+        random_ = self.rng.random
+        while levels < MAX_LEVELS and random_() < LEVEL_UP:
+            levels += 1
+        return levels
+
+    def insert(self, key):
+        chain = [None] * MAX_LEVELS
+        steps_at_level = [0] * MAX_LEVELS
+        node = self.head
+        for level in range(MAX_LEVELS - 1, -1, -1):
+            following = node.next[level]
+            while following.key < key:
+                steps_at_level[level] += node.width[level]
+                node = following
+                following = node.next[level]
+            chain[level] = node
+        levels = self._level()
+        new = _Node(key, levels)
+        steps = 0
+        for level in range(levels):
+            previous = chain[level]
+            new.next[level] = previous.next[level]
+            previous.next[level] = new
+            new.width[level] = previous.width[level] - steps
+            previous.width[level] = steps + 1
+            steps += steps_at_level[level]
+        for level in range(levels, MAX_LEVELS):
+            chain[level].width[level] += 1
+        self.size += 1
+
+    def remove(self, key):
+        chain = [None] * MAX_LEVELS
+        node = self.head
+        for level in range(MAX_LEVELS - 1, -1, -1):
+            following = node.next[level]
+            while following.key < key:
+                node = following
+                following = node.next[level]
+            chain[level] = node
+        found = chain[0].next[0]
+        if found.key != key:
+            raise KeyError(key)
+        for level in range(len(found.next)):
+            previous = chain[level]
+            previous.width[level] += found.width[level] - 1
+            previous.next[level] = found.next[level]
+        for level in range(len(found.next), MAX_LEVELS):
+            chain[level].width[level] -= 1
+        self.size -= 1
+
+    def index(self, key):
+        """Position of key, or None if it is not in the list."""
+        node = self.head
+        position = 0
+        for level in range(MAX_LEVELS - 1, -1, -1):
+            following = node.next[level]
+            while following.key < key:
+                position += node.width[level]
+                node = following
+                following = node.next[level]
+        if node.next[0].key != key:
+            return None
+        return position
+
+    def slice(self, start, count):
+        """Up to count keys from position start on."""
+        if start < 0 or start >= self.size or count <= 0:
+            return []
+        node = self.head
+        remaining = start + 1
+        for level in range(MAX_LEVELS - 1, -1, -1):
+            while node.width[level] <= remaining and node.next[level] is not _END:
+                remaining -= node.width[level]
+                node = node.next[level]
+        keys = []
+        while node is not _END and len(keys) < count:
+            keys.append(node.key)
+            node = node.next[0]
+        return keys
+
+    def extend_sorted(self, keys):
+        """Append keys that are sorted and all after the current last key, in O(n)."""
+        # last node and its position on every level
+        tails = [self.head] * MAX_LEVELS
+        positions = [0] * MAX_LEVELS
+        node = self.head
+        position = 0
+        for level in range(MAX_LEVELS - 1, -1, -1):
+            while node.next[level] is not _END:
+                position += node.width[level]
+                node = node.next[level]
+            tails[level] = node
+            positions[level] = position
+        # a million new nodes would set off full garbage collections over and over, none of which can free anything
+        collecting = gc.isenabled()
+        gc.disable()
+        try:
+            self._append(keys, tails, positions)
+        finally:
+            if collecting:
+                gc.enable()
+
+    def _append(self, keys, tails, positions):
+        size = self.size
+        random_ = self.rng.random
+        for key in keys:
+            size += 1
+            new = _Node(key, 1)
+            tail = tails[0]
+            tail.next[0] = new
+            new.next[0] = _END
+            tails[0] = new
+            positions[0] = size
+            level = 1
+            while level < MAX_LEVELS and random_() < LEVEL_UP:
+                tail = tails[level]
+                tail.next[level] = new
+                tail.width[level] = size - positions[level]
+                new.next.append(_END)
+                new.width.append(1)
+                tails[level] = new
+                positions[level] = size
+                level += 1
+        self.size = size
+        # the links into the end jump over whatever was appended after them
+        for level in range(MAX_LEVELS):
+            tails[level].width[level] = size + 1 - positions[level]
+
+
+class Leaderboard:
+    """Player scores ranked highest first, ties broken by name."""
+
+    def __init__(self, path=LEADERBOARD_DB, seed=None):
+        self.path = path
+        self.ranking = IndexableSkipList(seed)
+        # startup loads the leaderboard on a worker thread, the game uses it from the main one
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("CREATE TABLE IF NOT EXISTS scores (name TEXT PRIMARY KEY, score INTEGER NOT NULL)")
+        self.db.commit()
+        rows = self.db.execute("SELECT name, score FROM scores ORDER BY score DESC, name").fetchall()
+        self.scores = dict(rows)
+        self.ranking.extend_sorted([(-score, name) for name, score in rows])
+
+    def __len__(self):
+        return len(self.scores)
+
+    def _set(self, name, score):
+        old = self.scores.get(name)
+        if old == score:
+            return False
+        if old is not None:
+            self.ranking.remove((-old, name))
+        self.ranking.insert((-score, name))
+        self.scores[name] = score
+        return True
+
+    def update(self, name, score):
+        """Set a player's score, adding them if they are new."""
+        if self._set(name, score):
+            with self.db:
+                self.db.execute("INSERT OR REPLACE INTO scores VALUES (?, ?)", (name, score))
+
+    def update_many(self, items):
+        """Set many (name, score) pairs, saved in one transaction."""
+        items = list(items)
+        if len(items) > len(self.scores) // 8:
+            # a big batch is cheaper to apply as one sort and rebuild than as single updates
+            changed = [(name, score) for name, score in items if self.scores.get(name) != score]
+            self.scores.update(changed)
+            self.ranking.clear()
+            self.ranking.extend_sorted(sorted((-score, name) for name, score in self.scores.items()))
+        else:
+            changed = [(name, score) for name, score in items if self._set(name, score)]
+        with self.db:
+            self.db.executemany("INSERT OR REPLACE INTO scores VALUES (?, ?)", changed)
+
+    def score(self, name):
+        return self.scores.get(name)
+
+    def rank(self, name):
+        """1 for the top player, None for a player without a score."""
+        score = self.scores.get(name)
+        if score is None:
+            return None
+        return self.ranking.index((-score, name)) + 1
+
+    def top(self, count=PAGE_SIZE, start=0):
+        """[(rank, name, score)] for count players from position start (0 is the top)."""
+        return [(start + i + 1, name, -negated) for i, (negated, name) in enumerate(self.ranking.slice(start, count))]
+
+    def page(self, number, size=PAGE_SIZE):
+        """One page of the ranking, pages numbered from 0."""
+        return self.top(size, number * size)
+
+    def pages(self, size=PAGE_SIZE):
+        return max(1, -(-len(self.scores) // size))
+
+    def around(self, name, count=PAGE_SIZE):
+        """count players centred on name, fewer at the ends of the ranking; empty if name has no score."""
+        rank = self.rank(name)
+        if rank is None:
+            return []
+        start = max(0, min(rank - 1 - count // 2, len(self.scores) - count))
+        return self.top(count, start)
+
+    def close(self):
+        self.db.close()
+
+
+def bench(players, queries, seed=0):
+    """Time loading, updates and queries on players synthetic scores."""
+    import os
+    import tempfile
+
+    rng = random.Random(seed)
+    names = [f"player{i}" for i in range(players)]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, LEADERBOARD_DB)
+        board = Leaderboard(path, seed)
+        start = time.perf_counter()
+        board.update_many((name, rng.randrange(100000)) for name in names)
+        print(f"{'insert ' + str(players) + ' players':<32} {time.perf_counter() - start:8.2f} s")
+        board.close()
+
+        start = time.perf_counter()
+        board = Leaderboard(path, seed)
+        print(f"{'load from disk':<32} {time.perf_counter() - start:8.2f} s")
+        sample = [rng.choice(names) for _ in range(queries)]
+        for label, operation in (
+                ("score update", lambda name: board._set(name, board.scores[name] + rng.randrange(-6, 19))),
+                ("score update, saved", lambda name: board.update(name, board.scores[name] + rng.randrange(-6, 19))),
+                ("rank", board.rank),
+                ("10 around me", lambda name: board.around(name, 10)),
+                ("page of top 10", lambda name: board.page(rng.randrange(board.pages(10)), 10))):
+            start = time.perf_counter()
+            for name in sample:
+                operation(name)
+            elapsed = time.perf_counter() - start
+            print(f"{label:<32} {elapsed * 1e6 / queries:8.1f} us")
+        # the ranking must still agree with a plain sort
+        expected = sorted(board.scores.items(), key=lambda item: (-item[1], item[0]))
+        check = rng.randrange(players)
+        if board.top(1, check)[0][1:] != expected[check]:
+            raise SystemExit(f"ranking disagrees with a sort at position {check}")
+        board.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Leaderboard tools")
+    parser.add_argument("command", choices=["show", "bench"])
+    parser.add_argument("--db", default=LEADERBOARD_DB)
+    parser.add_argument("--page", type=int, default=0)
+    parser.add_argument("--players", type=int, default=1000000, help="synthetic players for bench")
+    parser.add_argument("--queries", type=int, default=10000)
+    args = parser.parse_args()
+
+    if args.command == "bench":
+        bench(args.players, args.queries)
+    else:
+        board = Leaderboard(args.db)
+        for rank, name, score in board.page(args.page):
+            print(f"{rank:>8}. {name}: {score}")
+        print(f"page {args.page + 1} of {board.pages()}, {len(board)} players")
+        board.close()
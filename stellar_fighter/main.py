@@ -1,52 +1,71 @@
+import sys
+import time
+# --startup-report times every import from here on, so the timer goes in before any of them
+if "--startup-report" in sys.argv:
+    from import_report import ImportTimer
+    import_timer = ImportTimer()
+    import_timer.install()
+else:
+    import_timer = None
 import pygame
-from fighter import Fighter
-import json
-import os
+import argparse
+from fighter import Fighter, read_input
+from simulation import Match, SCREEN_WIDTH, SCREEN_HEIGHT, FPS, WARRIOR_DATA, WIZARD_DATA, WARRIOR_ANIMATION_STEPS, WIZARD_ANIMATION_STEPS
 import datetime
-from stellar_sdk import Keypair
-from stellar_integration import load_or_create_player_data, update_player_coins, get_balance, initialize_game_stellar_setup, setup_smart_contract
+import logging
+# the Stellar SDK is imported on the first call into blockchain, not while the window opens
+from blockchain import load_or_create_player_data, update_player_coins, setup_smart_contract, keypair, latency_stats
+from balance_cache import BalanceCache
+from stellar_worker import StellarWorker, STELLAR_RESULT
 from guilds import load_guilds, save_guilds, load_guild_data, draw_checkbox
-
-# Initialize Stellar setup
-initialize_game_stellar_setup()
+from text_cache import render_text, cache_info
+from profiles import ProfileStore, DEFAULT_USERNAME
+from replay import ReplayRecorder, replay_path
+from netplay import UdpTransport, RollbackSession, parse_address, DEFAULT_PORT
+from match_server import RemoteMatch, DEFAULT_PORT as MATCH_SERVER_PORT
+from bots import BOTS, make_bot, load_policy_bot
+from leaderboard import PAGE_SIZE
+from startup import StartupPipeline
+
+# by default both players share the keyboard; with --peer the match is played online against another process
+parser = argparse.ArgumentParser(description="Stellar Fight")
+parser.add_argument("--peer", help="host:port of the other player for online matches")
+parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="local UDP port for online matches")
+parser.add_argument("--player", type=int, choices=[1, 2], default=1, help="which side this player fights on online")
+parser.add_argument("--latency", type=float, default=0.0, help="testing: seconds added to every packet sent")
+parser.add_argument("--loss", type=float, default=0.0, help="testing: fraction of sent packets dropped")
+parser.add_argument("--server", help="host:port of a match server (match_server.py) to play on instead")
+parser.add_argument("--room", default="", help="room to join on the match server, any waiting one if not given")
+parser.add_argument("--precise-hits", action="store_true", help="pixel accurate attacks in local matches (these are not recorded)")
+parser.add_argument("--bot", choices=sorted(BOTS), help="computer opponent for player 2 in local matches")
+parser.add_argument("--policy", help="trained computer opponent for player 2 in local matches, a policy file from env.py train")
+parser.add_argument("--offline", action="store_true", help="fights only: no Stellar account, coins or guilds, and the Stellar SDK is never loaded")
+parser.add_argument("--startup-report", action="store_true", help="print how long the window and main menu took to appear and the slowest imports, then quit")
+args = parser.parse_args()
 
 pygame.init()
 
 # create game window
-SCREEN_WIDTH = 1000
-SCREEN_HEIGHT = 600
-
 screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
 pygame.display.set_caption("Stellar Fight")
+if import_timer:
+    window_time = time.perf_counter() - import_timer.started
 
-# set framerate
+# set framerate, the fight itself advances in fixed ticks of 1000 / FPS ms
 clock = pygame.time.Clock()
-FPS = 60
+TICK_MS = 1000 / FPS
+MAX_TICKS_PER_FRAME = 5
+tick_time = 0
 
 # define colours
 RED = (255, 0, 0)
 WHITE = (255, 255, 255)
 BLACK = (0, 0, 0)
+YELLOW = (255, 255, 0)
 
-# define game variables
-intro_count = 3
-last_count_update = pygame.time.get_ticks()
-score = [0, 0]  # player scores. [P1, P2]
-round_over = False
-ROUND_OVER_COOLDOWN = 2000
-
-# define fighter variables
-WARRIOR_SIZE = 162
-WARRIOR_SCALE = 4
-WARRIOR_OFFSET = [72, 56]
-WARRIOR_DATA = [WARRIOR_SIZE, WARRIOR_SCALE, WARRIOR_OFFSET]
-WIZARD_SIZE = 250
-WIZARD_SCALE = 3
-WIZARD_OFFSET = [112, 107]
-WIZARD_DATA = [WIZARD_SIZE, WIZARD_SCALE, WIZARD_OFFSET]
-
-# load background image
+# load background image and scale it to the window once
 bg_image = pygame.image.load("assets/images/background/background.jpg").convert_alpha()
+scaled_bg = pygame.transform.scale(bg_image, (SCREEN_WIDTH, SCREEN_HEIGHT)).convert()
 
 # load spritesheets
 warrior_sheet = pygame.image.load("assets/images/warrior/Sprites/warrior.png").convert_alpha()
@@ -55,45 +74,82 @@ wizard_sheet = pygame.image.load("assets/images/wizard/Sprites/wizard.png").conv
 # load victory image
 victory_img = pygame.image.load("assets/images/icons/victory.png").convert_alpha()
 
-# define number of steps in each animation
-WARRIOR_ANIMATION_STEPS = [10, 8, 1, 7, 7, 3, 7]
-WIZARD_ANIMATION_STEPS = [8, 8, 1, 8, 8, 3, 7]
-
 # define font
 count_font = pygame.font.Font("assets/fonts/turok.ttf", 80)
 score_font = pygame.font.Font("assets/fonts/turok.ttf", 30)
 menu_font = pygame.font.Font("assets/fonts/turok.ttf", 40)
 
+# dirty rect rendering: while fighting, only the regions drawn this frame and last frame
+# are restored from the background and pushed to the display
+DIRTY_RECTS = True
+dirty_rects = []
+previous_dirty_rects = []
+last_drawn_state = None
+
 # function for drawing text
 def draw_text(text, font, text_col, x, y):
-    img = font.render(text, True, text_col)
-    screen.blit(img, (x, y))
+    img = render_text(font, text, text_col)
+    dirty_rects.append(screen.blit(img, (x, y)))
 
 # function for drawing background
 def draw_bg():
-    scaled_bg = pygame.transform.scale(bg_image, (SCREEN_WIDTH, SCREEN_HEIGHT))
     screen.blit(scaled_bg, (0, 0))
 
+# function for restoring the background under last frame's drawing
+def restore_bg(rects):
+    for rect in rects:
+        screen.blit(scaled_bg, rect, rect)
+
 # function for drawing fighter health bars
 def draw_health_bar(health, x, y):
     ratio = health / 100
-    pygame.draw.rect(screen, WHITE, (x - 2, y - 2, 404, 34))
+    dirty_rects.append(pygame.draw.rect(screen, WHITE, (x - 2, y - 2, 404, 34)))
     pygame.draw.rect(screen, BLACK, (x, y, 400, 30))
     pygame.draw.rect(screen, WHITE, (x, y, 400 * ratio, 30))
 
+# function for drawing the coin balance, flagged while a fresh one is being fetched
+def draw_coins(label, font, text_col, x, y):
+    if balance_cache.is_stale() or stellar_worker.is_pending():
+        label += " (refreshing...)"
+    draw_text(label, font, text_col, x, y)
+
 # function to draw button
 def draw_button(text, font, text_col, x, y, width, height):
     button_rect = pygame.Rect(x, y, width, height)
     pygame.draw.rect(screen, WHITE, button_rect)
     pygame.draw.rect(screen, BLACK, button_rect, 2)
-    text_img = font.render(text, True, text_col)
+    text_img = render_text(font, text, text_col)
     text_rect = text_img.get_rect(center=button_rect.center)
     screen.blit(text_img, text_rect)
     return button_rect
 
 # create two instances of fighters
-fighter_1 = Fighter(1, 200, 310, False, WARRIOR_DATA, warrior_sheet, WARRIOR_ANIMATION_STEPS)
-fighter_2 = Fighter(2, 700, 310, True, WIZARD_DATA, wizard_sheet, WIZARD_ANIMATION_STEPS)
+def make_fighters():
+    fighter_1 = Fighter(1, 200, 310, False, WARRIOR_DATA, warrior_sheet, WARRIOR_ANIMATION_STEPS)
+    fighter_2 = Fighter(2, 700, 310, True, WIZARD_DATA, wizard_sheet, WIZARD_ANIMATION_STEPS)
+    return fighter_1, fighter_2
+
+# the match runs on the same simulation core as headless matches
+match = Match(make_fighters)
+# precise hits depend on the sprites, which online play and replays do not have
+if args.precise_hits and not (args.peer or args.server):
+    Fighter.precise_hits = True
+    match.fighter_1.prepare_masks()
+    match.fighter_2.prepare_masks()
+# every match played is recorded to the replays folder
+recorder = None
+# a computer opponent can take player 2's side in local matches
+opponent = None
+if not (args.peer or args.server):
+    if args.policy:
+        opponent = load_policy_bot(args.policy)
+    elif args.bot:
+        opponent = make_bot(args.bot)
+
+# online matches run through a rollback session over one UDP socket for the whole game
+transport = UdpTransport(args.port, parse_address(args.peer), args.latency, loss=args.loss) if args.peer else None
+session = None
+online_matches = 0
 
 # game states
 MAIN_MENU = 0
@@ -105,14 +161,19 @@ GUILDS = 5
 GUILD_HOME = 6
 GUILD_SELECTION = 7
 GUILD_AGREEMENT = 8
+PROFILE_SELECT = 9
 
 current_state = MAIN_MENU
 
-# player data
-username = "warrior"
-
-# JSON file for persistent data
+# stats of every player on this install; the single player game_data.json is imported the first time
 JSON_FILE = "game_data.json"
+profiles = ProfileStore()
+legacy_data = profiles.migrate_json(JSON_FILE) if not profiles.migrated() else None
+# play as whoever played last
+recent_profiles = profiles.recent(1)
+username = recent_profiles[0] if recent_profiles else DEFAULT_USERNAME
+# longest name that fits the profile button
+MAX_NAME_LENGTH = 16
 
 # Load guilds
 guilds = load_guilds()
@@ -122,57 +183,87 @@ for guild, data in zip(guilds, guild_data):
     guild.total_collected = data["total_collected"]
     guild.last_collection_date = datetime.date.fromisoformat(data["last_collection_date"])
 
-# Load player data
-player_data = load_or_create_player_data(username)
-# Initialize player's guild
-player_guild = None
+# the player's Stellar account, provisioned by the startup pipeline before the main menu or on switching profile
+player_data = None
+# the player's guild is the one they are a member of
+player_guild = next((guild for guild in guilds if username in guild.members), None)
 agreement_checked = False
-
-# Load data from JSON file or create default data
-if os.path.exists(JSON_FILE):
-    with open(JSON_FILE, 'r') as f:
-        data = json.load(f)
-else:
-    data = {
-        "personal_score": 30,
-        "wins": 0,
-        "losses": 0,
-        "win_streak": 0,
-        "leaderboard": [("warrior", 30)]
-    }
-
-# Get data from loaded JSON
-personal_score = data["personal_score"]
-wins = data["wins"]
-losses = data["losses"]
-win_streak = data["win_streak"]
-coins = get_balance(player_data["public_key"])
-leaderboard = data["leaderboard"]
+# shown instead of the coins while a new profile's Stellar account is being set up
+account_status = None
+
+# Load the player's stats
+profile = profiles.load(username)
+personal_score = profile["personal_score"]
+wins = profile["wins"]
+losses = profile["losses"]
+win_streak = profile["win_streak"]
+# the balance is refreshed in the background, the game loop only reads the cached value
+balance_cache = None
+coins = 0
+
+# Stellar calls made by the game run on a worker pool and come back as STELLAR_RESULT events
+stellar_worker = StellarWorker()
+guild_join_pending = False
+# page of the leaderboard screen, or None to show the players around this one
+leaderboard_page = 0
 
 def save_data():
-    data["personal_score"] = personal_score
-    data["wins"] = wins
-    data["losses"] = losses
-    data["win_streak"] = win_streak
-    data["leaderboard"] = leaderboard
-    with open(JSON_FILE, 'w') as f:
-        json.dump(data, f)
+    profiles.save(username, {"personal_score": personal_score, "wins": wins, "losses": losses, "win_streak": win_streak})
+
+def switch_profile(name):
+    # the stats are there at once, the Stellar account of a new player is created on the worker
+    global username, personal_score, wins, losses, win_streak, player_guild, player_data, account_status
+    save_data()
+    username = name
+    profile = profiles.load(name)
+    personal_score = profile["personal_score"]
+    wins = profile["wins"]
+    losses = profile["losses"]
+    win_streak = profile["win_streak"]
+    player_guild = next((guild for guild in guilds if username in guild.members), None)
+    if leaderboard.score(username) is None:
+        leaderboard.update(username, personal_score)
+    if args.offline:
+        return
+    player_data = None
+    account_status = f"Setting up {name}..."
+    stellar_worker.submit("profile_account", load_or_create_player_data, name, tag=name)
+
+def use_account(account_data, balance=None):
+    global player_data, balance_cache, coins, account_status
+    player_data = account_data
+    account_status = None
+    if balance_cache:
+        balance_cache.stop()
+    balance_cache = BalanceCache(player_data["public_key"])
+    if balance is not None:
+        balance_cache.set(balance)
+    balance_cache.start()
+    coins = balance_cache.get()
 
 def reset_game():
-    global fighter_1, fighter_2, score, intro_count, round_over
-    fighter_1 = Fighter(1, 200, 310, False, WARRIOR_DATA, warrior_sheet, WARRIOR_ANIMATION_STEPS)
-    fighter_2 = Fighter(2, 700, 310, True, WIZARD_DATA, wizard_sheet, WIZARD_ANIMATION_STEPS)
-    score = [0, 0]
-    intro_count = 3
-    round_over = False
+    global match, tick_time, recorder, session, online_matches
+    tick_time = 0
+    if recorder:
+        recorder.close()
+        recorder = None
+    if args.server:
+        # the server runs the fight and records it, this client only draws its state
+        if isinstance(match, RemoteMatch):
+            match.close()
+        match = RemoteMatch(make_fighters, parse_address(args.server, MATCH_SERVER_PORT), args.room)
+        return
+    match = Match(make_fighters)
+    if not Fighter.precise_hits:
+        recorder = ReplayRecorder(replay_path())
+    if transport:
+        # both sides number their matches the same way, so stray packets from the last one are ignored
+        session = RollbackSession(match, args.player, transport, online_matches)
+        session.on_confirmed = recorder.record_tick
+        online_matches += 1
 
 def update_leaderboard():
-    global leaderboard
-    leaderboard = [entry for entry in leaderboard if entry[0] != username]
-    leaderboard.append((username, personal_score))
-    leaderboard = sorted(leaderboard, key=lambda x: x[1], reverse=True)
-    if len(leaderboard) > 10:
-        leaderboard = leaderboard[:10]
+    leaderboard.update(username, personal_score)
 
 def calculate_score_increase():
     return min(18, 12 + win_streak)
@@ -182,38 +273,152 @@ def calculate_coin_reward():
     streak_bonus = min(5, win_streak) * 2  # 2 extra coins per win streak, up to 5
     return base_reward + streak_bonus
 
+def settle_match():
+    # runs once when a match ends, the GAME_OVER screen only displays the outcome
+    global wins, losses, win_streak, personal_score, result_text
+    score = match.score
+    # the local player's rounds first, which is the right hand score when playing online as player 2
+    local_player = match.player if args.server else args.player if session else 1
+    mine, theirs = (score[1], score[0]) if local_player == 2 else (score[0], score[1])
+    if mine > theirs:
+        wins += 1
+        win_streak += 1
+        score_increase = calculate_score_increase()
+        personal_score += score_increase
+        coin_reward = calculate_coin_reward()
+        result_text = f"You Win! +{score_increase} points"
+        # Update Stellar balance in the background, offline there are no coins to win
+        if player_data:
+            stellar_worker.submit("match_reward", update_player_coins, player_data["public_key"], coin_reward, tag=username)
+            result_text += f", +{coin_reward} coins"
+    elif mine < theirs:
+        losses += 1
+        win_streak = 0
+        personal_score -= 6
+        result_text = "You Lose! -6 points"
+        # Update Stellar balance in the background
+        if player_data:
+            stellar_worker.submit("match_reward", update_player_coins, player_data["public_key"], -15, tag=username)
+            result_text += ", -15 coins"
+
+    update_leaderboard()
+    save_data()
+
+def join_guild(guild):
+    # runs on the Stellar worker, so it must not touch pygame
+    player_account = keypair(player_data["secret_key"])
+    if not setup_smart_contract(player_account, guild.account, 10):
+        return None
+    guild.add_member(username)
+    return update_player_coins(player_data["public_key"], -10)
+
+def handle_stellar_result(event):
+    global coins, player_guild, current_state, guild_join_pending, account_status
+    if event.job == "profile_account" and event.tag == username:
+        if event.result:
+            use_account(event.result)
+        else:
+            account_status = f"Could not set up {username}"
+    # a reward for a profile switched away from is not this account's balance
+    if event.job == "join_guild" or (event.job == "match_reward" and event.tag == username):
+        if event.result is not None:
+            coins = event.result
+            balance_cache.set(coins)
+        else:
+            # a failed payment may or may not have gone through, so ask Horizon
+            balance_cache.refresh()
+    # a collection takes the member's fee without returning the balance, fetch it now instead of after the TTL
+    if event.job == "daily_collection" and balance_cache:
+        balance_cache.refresh()
+    if event.job == "join_guild":
+        guild_join_pending = False
+        if event.result is not None:
+            player_guild = event.tag
+            if current_state == GUILD_AGREEMENT:
+                current_state = GUILD_HOME
+        else:
+            # Handle smart contract setup failure
+            print("Failed to set up smart contract. Please try again.")
+
+# provision what the main menu needs in the background, showing a loading screen until it is ready
+startup = StartupPipeline(username, guilds, offline=args.offline)
+while not startup.menu_ready():
+    clock.tick(FPS)
+    for event in pygame.event.get():
+        if event.type == pygame.QUIT:
+            startup.close()
+            profiles.close()
+            pygame.quit()
+            sys.exit()
+    draw_bg()
+    draw_text("Loading...", menu_font, WHITE, 420, 180)
+    for i, (step, state) in enumerate(startup.progress()):
+        draw_text(f"{step}: {state}", score_font, WHITE, 380, 250 + i * 40)
+    pygame.display.update()
+if args.offline:
+    account_status = "Offline: fights only"
+elif startup.player.result():
+    use_account(startup.player.result(), startup.balance.result())
+else:
+    account_status = f"Could not set up {username}"
+# scores of every player, ranked in leaderboard.db; the top ten game_data.json used to hold are imported once
+leaderboard = startup.leaderboard.result()
+if len(leaderboard) == 0 and legacy_data and legacy_data.get("leaderboard"):
+    leaderboard.update_many((name, score) for name, score in legacy_data["leaderboard"])
+if leaderboard.score(username) is None:
+    leaderboard.update(username, personal_score)
+
 # game loop
 run = True
 while run:
-    clock.tick(FPS)
+    frame_time = clock.tick(FPS)
 
-    # draw background
-    draw_bg()
+    # draw background, or only patch it up when the fight was already on screen last frame
+    frame_state = current_state
+    partial_redraw = DIRTY_RECTS and frame_state == PLAYING and last_drawn_state == PLAYING
+    if partial_redraw:
+        restore_bg(previous_dirty_rects)
+    else:
+        draw_bg()
+    dirty_rects.clear()
+
+    # pick up finished Stellar jobs before handling the current screen
+    for event in pygame.event.get(STELLAR_RESULT):
+        handle_stellar_result(event)
 
     if current_state == MAIN_MENU:
-        update_done = False
-        # Update coins display to use Stellar balance
-        coins = get_balance(player_data["public_key"])
+        # Update coins display to use the cached Stellar balance
         # draw menu options
-        draw_text(f"Coins: {coins}", menu_font, WHITE, 20, 20)
+        if player_data:
+            coins = balance_cache.get()
+            draw_coins(f"Coins: {coins}", menu_font, WHITE, 20, 20)
+        else:
+            draw_text(account_status, menu_font, WHITE, 20, 20)
+        profile_button = draw_button(username, score_font, BLACK, 700, 20, 280, 40)
         play_button = draw_button("Play", menu_font, BLACK, 400, 200, 200, 50)
         leaderboard_button = draw_button("Leaderboard", menu_font, BLACK, 350, 300, 300, 50)
         guilds_button = draw_button("Guilds", menu_font, BLACK, 400, 400, 200, 50)
         quit_button = draw_button("Quit", menu_font, BLACK, 400, 500, 200, 50)
 
-        for event in pygame.event.get():
+        for event in pygame.event.get(exclude=STELLAR_RESULT):
             if event.type == pygame.QUIT:
                 run = False
             if event.type == pygame.MOUSEBUTTONDOWN:
-                if play_button.collidepoint(event.pos):
-                    if coins >= 15:
+                if profile_button.collidepoint(event.pos):
+                    current_state = PROFILE_SELECT
+                    profile_choices = profiles.recent()
+                    new_name = ""
+                # playing and guilds wait until the profile's account is ready, offline matches are free
+                elif play_button.collidepoint(event.pos) and (player_data or args.offline):
+                    if args.offline or coins >= 15:
                         current_state = PLAYING
                         reset_game()
                     else:
                         current_state = NOT_ENOUGH_COINS
                 elif leaderboard_button.collidepoint(event.pos):
                     current_state = LEADERBOARD
-                elif guilds_button.collidepoint(event.pos):
+                    leaderboard_page = 0
+                elif guilds_button.collidepoint(event.pos) and player_data:
                     if player_guild:
                         current_state = GUILD_HOME
                     else:
@@ -224,100 +429,89 @@ while run:
 
     elif current_state == PLAYING:
         # show player stats
-        draw_health_bar(fighter_1.health, 20, 20)
-        draw_health_bar(fighter_2.health, 580, 20)
-        draw_text("P1: " + str(score[0]), score_font, RED, 20, 60)
-        draw_text("P2: " + str(score[1]), score_font, RED, 580, 60)
-
-        # update countdown
-        if intro_count <= 0:
-            # move fighters
-            fighter_1.move(SCREEN_WIDTH, SCREEN_HEIGHT, screen, fighter_2, round_over)
-            fighter_2.move(SCREEN_WIDTH, SCREEN_HEIGHT, screen, fighter_1, round_over)
-        else:
-            # display count timer
-            draw_text(str(intro_count), count_font, RED, SCREEN_WIDTH / 2, SCREEN_HEIGHT / 3)
-            # update count timer
-            if (pygame.time.get_ticks() - last_count_update) >= 1000:
-                intro_count -= 1
-                last_count_update = pygame.time.get_ticks()
-
-        # update fighters
-        fighter_1.update()
-        fighter_2.update()
+        draw_health_bar(match.fighter_1.health, 20, 20)
+        draw_health_bar(match.fighter_2.health, 580, 20)
+        draw_text("P1: " + str(match.score[0]), score_font, RED, 20, 60)
+        draw_text("P2: " + str(match.score[1]), score_font, RED, 580, 60)
+
+        # display count timer
+        if match.intro_count > 0:
+            draw_text(str(match.intro_count), count_font, RED, SCREEN_WIDTH / 2, SCREEN_HEIGHT / 3)
+
+        if (session and not session.connected) or (args.server and not match.started):
+            draw_text("Waiting for opponent...", menu_font, WHITE, 330, 450)
+
+        # advance the fight by as many fixed ticks as real time has passed
+        tick_time += frame_time
+        input_1 = read_input(1)
+        input_2 = read_input(2)
+        ticks = 0
+        if args.server:
+            # the server keeps the time, send what is held and show its newest state
+            match.update(input_1 | input_2)
+            tick_time = 0
+        while tick_time >= TICK_MS and ticks < MAX_TICKS_PER_FRAME:
+            if session:
+                # online either set of keys controls the local fighter
+                session.advance(input_1 | input_2)
+            else:
+                if opponent:
+                    input_2 = opponent(match, 2)
+                if recorder:
+                    recorder.record(match, input_1, input_2)
+                match.step(input_1, input_2)
+            tick_time -= TICK_MS
+            ticks += 1
+        if session:
+            session.poll()
+        if ticks == MAX_TICKS_PER_FRAME:
+            # too far behind to catch up, drop the backlog instead of spiralling
+            tick_time = 0
 
         # draw fighters
-        fighter_1.draw(screen)
-        fighter_2.draw(screen)
-
-        # check for player defeat
-        if round_over == False:
-            if fighter_1.alive == False:
-                score[1] += 1
-                round_over = True
-                round_over_time = pygame.time.get_ticks()
-            elif fighter_2.alive == False:
-                score[0] += 1
-                round_over = True
-                round_over_time = pygame.time.get_ticks()
-        else:
-            # display victory image
-            screen.blit(victory_img, (360, 150))
-            if pygame.time.get_ticks() - round_over_time > ROUND_OVER_COOLDOWN:
-                if score[0] == 3 or score[1] == 3:
-                    current_state = GAME_OVER
-                else:
-                    round_over = False
-                    intro_count = 3
-                    fighter_1 = Fighter(1, 200, 310, False, WARRIOR_DATA, warrior_sheet, WARRIOR_ANIMATION_STEPS)
-                    fighter_2 = Fighter(2, 700, 310, True, WIZARD_DATA, wizard_sheet, WIZARD_ANIMATION_STEPS)
+        dirty_rects.append(match.fighter_1.draw(screen))
+        dirty_rects.append(match.fighter_2.draw(screen))
+
+        # display victory image
+        if match.round_over:
+            dirty_rects.append(screen.blit(victory_img, (360, 150)))
+
+        if match.finished and (session is None or session.confirmed_finished()):
+            current_state = GAME_OVER
+            if recorder:
+                recorder.close()
+            settle_match()
+        elif (session and session.disconnected) or (args.server and match.disconnected):
+            logging.getLogger(__name__).warning("Lost the connection to the other player")
+            if recorder:
+                recorder.close()
+            current_state = MAIN_MENU
 
         # event handler
-        for event in pygame.event.get():
+        for event in pygame.event.get(exclude=STELLAR_RESULT):
             if event.type == pygame.QUIT:
                 run = False
 
     elif current_state == GAME_OVER:
+        # keep answering the other player until they have our last inputs too
+        if session:
+            session.poll()
+
         # display final score
         draw_text("Final Score", menu_font, WHITE, 400, 150)
-        draw_text(f"P1: {score[0]}  P2: {score[1]}", menu_font, WHITE, 400, 200)
-
-        # update personal score and stats
-        if score[0] > score[1] and update_done == False:
-            update_done = True
-            wins += 1
-            win_streak += 1
-            score_increase = calculate_score_increase()
-            personal_score += score_increase
-            coin_reward = calculate_coin_reward()
-            # Update Stellar balance
-            coins = update_player_coins(player_data["public_key"], coin_reward)
-            result_text = f"You Win! +{score_increase} points, +{coin_reward} coins"
-        elif score[0] < score[1] and update_done == False:
-            update_done = True
-            losses += 1
-            win_streak = 0
-            personal_score -= 6
-            # Update Stellar balance
-            coins = update_player_coins(player_data["public_key"], -15)
-            result_text = "You Lose! -6 points, -15 coins"
+        draw_text(f"P1: {match.score[0]}  P2: {match.score[1]}", menu_font, WHITE, 400, 200)
 
         draw_text(result_text, menu_font, WHITE, 400, 250)
         draw_text(f"Personal Score: {personal_score}", menu_font, WHITE, 400, 300)
         draw_text(f"Wins: {wins}, Losses: {losses}", menu_font, WHITE, 400, 350)
         draw_text(f"Win Streak: {win_streak}", menu_font, WHITE, 400, 400)
-        draw_text(f"Coins: {coins}", menu_font, WHITE, 400, 450)
-
-        # update leaderboard
-        update_leaderboard()
-
-        # save data
-        save_data()
+        if player_data:
+            draw_coins(f"Coins: {coins}", menu_font, WHITE, 400, 450)
 
         # draw back to menu button
         back_button = draw_button("Back to Menu", menu_font, BLACK, 400, 500, 300, 50)
 
-        for event in pygame.event.get():
+        for event in pygame.event.get(exclude=STELLAR_RESULT):
             if event.type == pygame.QUIT:
                 run = False
             if event.type == pygame.MOUSEBUTTONDOWN:
@@ -325,29 +519,75 @@ while run:
                     current_state = MAIN_MENU
 
     elif current_state == LEADERBOARD:
-        draw_text("Leaderboard", menu_font, WHITE, 400, 100)
-        for i, (name, score) in enumerate(leaderboard):
-            draw_text(f"{i+1}. {name}: {score}", score_font, WHITE, 400, 150 + i * 40)
+        draw_text("Leaderboard", menu_font, WHITE, 400, 60)
+        rank = leaderboard.rank(username)
+        draw_text(f"You: #{rank} of {len(leaderboard)}", score_font, WHITE, 700, 70)
+        if leaderboard_page is None:
+            entries = leaderboard.around(username)
+        else:
+            entries = leaderboard.page(leaderboard_page)
+        for i, (place, name, score) in enumerate(entries):
+            draw_text(f"{place}. {name}: {score}", score_font, YELLOW if name == username else WHITE, 400, 130 + i * 40)
 
-        back_button = draw_button("Back to Menu", menu_font, BLACK, 400, 500, 300, 50)
+        prev_button = draw_button("Prev", menu_font, BLACK, 100, 500, 150, 50)
+        back_button = draw_button("Back to Menu", menu_font, BLACK, 350, 500, 300, 50)
+        next_button = draw_button("Next", menu_font, BLACK, 750, 500, 150, 50)
+        me_button = draw_button("Me", menu_font, BLACK, 100, 430, 150, 50)
 
-        for event in pygame.event.get():
+        for event in pygame.event.get(exclude=STELLAR_RESULT):
             if event.type == pygame.QUIT:
                 run = False
             if event.type == pygame.MOUSEBUTTONDOWN:
                 if back_button.collidepoint(event.pos):
                     current_state = MAIN_MENU
+                elif me_button.collidepoint(event.pos):
+                    leaderboard_page = None
+                elif prev_button.collidepoint(event.pos) or next_button.collidepoint(event.pos):
+                    if leaderboard_page is None:
+                        # page through from wherever the players around this one are
+                        leaderboard_page = (entries[0][0] - 1) // PAGE_SIZE if entries else 0
+                    step = -1 if prev_button.collidepoint(event.pos) else 1
+                    leaderboard_page = max(0, min(leaderboard.pages() - 1, leaderboard_page + step))
+
+    elif current_state == PROFILE_SELECT:
+        draw_text("Select Profile", menu_font, WHITE, 380, 40)
+        profile_buttons = []
+        for i, name in enumerate(profile_choices):
+            profile_buttons.append((draw_button(name, score_font, BLACK, 350, 100 + i * 50, 300, 40), name))
+        draw_text(f"New player: {new_name}_", score_font, WHITE, 350, 420)
+        back_button = draw_button("Back to Menu", menu_font, BLACK, 350, 500, 300, 50)
+
+        for event in pygame.event.get(exclude=STELLAR_RESULT):
+            if event.type == pygame.QUIT:
+                run = False
+            if event.type == pygame.MOUSEBUTTONDOWN:
+                if back_button.collidepoint(event.pos):
+                    current_state = MAIN_MENU
+                for button, name in profile_buttons:
+                    if button.collidepoint(event.pos):
+                        if name != username:
+                            switch_profile(name)
+                        current_state = MAIN_MENU
+            if event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_RETURN and new_name.strip():
+                    if new_name.strip() != username:
+                        switch_profile(new_name.strip())
+                    current_state = MAIN_MENU
+                elif event.key == pygame.K_BACKSPACE:
+                    new_name = new_name[:-1]
+                elif event.unicode and (event.unicode.isalnum() or event.unicode in " _-") and len(new_name) < MAX_NAME_LENGTH:
+                    new_name += event.unicode
 
     elif current_state == NOT_ENOUGH_COINS:
-        # Update coins display to use Stellar balance
-        coins = get_balance(player_data["public_key"])
+        # Update coins display to use the cached Stellar balance
+        coins = balance_cache.get()
         draw_text("Not Enough Coins!", menu_font, RED, 400, 200)
         draw_text(f"You need at least 15 coins to play.", menu_font, WHITE, 400, 250)
-        draw_text(f"Current coins: {coins}", menu_font, WHITE, 400, 300)
+        draw_coins(f"Current coins: {coins}", menu_font, WHITE, 400, 300)
 
         back_button = draw_button("Back to Menu", menu_font, BLACK, 400, 400, 300, 50)
 
-        for event in pygame.event.get():
+        for event in pygame.event.get(exclude=STELLAR_RESULT):
             if event.type == pygame.QUIT:
                 run = False
             if event.type == pygame.MOUSEBUTTONDOWN:
@@ -361,7 +601,7 @@ while run:
         guild2_button = draw_button(guilds[1].name, menu_font, BLACK, 550, 200, 250, 50)
         back_button = draw_button("Back to Menu", menu_font, BLACK, 400, 500, 300, 50)
 
-        for event in pygame.event.get():
+        for event in pygame.event.get(exclude=STELLAR_RESULT):
             if event.type == pygame.QUIT:
                 run = False
             if event.type == pygame.MOUSEBUTTONDOWN:
@@ -385,27 +625,23 @@ while run:
         draw_checkbox(screen, 350, 300, agreement_checked)
         draw_text("I agree to the terms", menu_font, WHITE, 380, 300)
         
-        agree_button = draw_button("Join Guild", menu_font, BLACK, 400, 350, 200, 50)
+        if guild_join_pending:
+            agree_button = draw_button("Joining...", menu_font, BLACK, 400, 350, 200, 50)
+        else:
+            agree_button = draw_button("Join Guild", menu_font, BLACK, 400, 350, 200, 50)
         back_button = draw_button("Back", menu_font, BLACK, 400, 420, 300, 50)
 
-        for event in pygame.event.get():
+        for event in pygame.event.get(exclude=STELLAR_RESULT):
             if event.type == pygame.QUIT:
                 run = False
             if event.type == pygame.MOUSEBUTTONDOWN:
                 if pygame.Rect(350, 300, 20, 20).collidepoint(event.pos):
                     agreement_checked = not agreement_checked
-                elif agree_button.collidepoint(event.pos) and agreement_checked:
+                elif agree_button.collidepoint(event.pos) and agreement_checked and not guild_join_pending:
                     if coins >= 10:
-                        player_account = Keypair.from_secret(player_data["secret_key"])
-                        if setup_smart_contract(player_account, selected_guild.account, 10):
-                            selected_guild.add_member(username)
-                            update_player_coins(player_data["public_key"], -10)
-                            coins = get_balance(player_data["public_key"])
-                            player_guild = selected_guild
-                            current_state = GUILD_HOME
-                        else:
-                            # Handle smart contract setup failure
-                            print("Failed to set up smart contract. Please try again.")
+                        # the result arrives as a STELLAR_RESULT event, see handle_stellar_result
+                        guild_join_pending = True
+                        stellar_worker.submit("join_guild", join_guild, selected_guild, tag=selected_guild)
                     else:
                         current_state = NOT_ENOUGH_COINS
                 elif back_button.collidepoint(event.pos):
@@ -414,13 +650,14 @@ while run:
 
     elif current_state == GUILD_HOME:
         if player_guild:
-            player_guild.daily_collection()
+            if player_guild.collection_due() and not stellar_worker.is_pending("daily_collection"):
+                stellar_worker.submit("daily_collection", player_guild.daily_collection)
             player_guild.render(screen, menu_font)
             
             exit_guild_button = draw_button("Exit Guild", menu_font, BLACK, 300, 500, 200, 50)
             back_button = draw_button("Back to Menu", menu_font, BLACK, 550, 500, 300, 50)
 
-            for event in pygame.event.get():
+            for event in pygame.event.get(exclude=STELLAR_RESULT):
                 if event.type == pygame.QUIT:
                     run = False
                 if event.type == pygame.MOUSEBUTTONDOWN:
@@ -434,11 +671,36 @@ while run:
             current_state = GUILD_SELECTION
 
     # update display
-    pygame.display.update()
+    if partial_redraw:
+        pygame.display.update(previous_dirty_rects + dirty_rects)
+    else:
+        pygame.display.update()
+    previous_dirty_rects = dirty_rects.copy()
+    last_drawn_state = frame_state
+
+    if import_timer and frame_state == MAIN_MENU:
+        # the main menu is on screen, which is as far as the startup report goes
+        print(f"window after {window_time * 1000:.0f} ms, main menu after {(time.perf_counter() - import_timer.started) * 1000:.0f} ms")
+        print("\n".join(import_timer.report()))
+        run = False
 
 # save data before quitting
 save_data()
+profiles.close()
+leaderboard.close()
+if recorder:
+    recorder.close()
+if transport:
+    transport.close()
+if isinstance(match, RemoteMatch):
+    match.close()
+stellar_worker.shutdown()
 save_guilds(guilds)
+startup.close()
+if balance_cache:
+    balance_cache.stop()
+logging.getLogger(__name__).info(f"Text cache stats: {cache_info()}")
+logging.getLogger(__name__).info(f"Horizon latency: {latency_stats()}")
 
 # exit pygame
 pygame.quit()
\ No newline at end of file
@@ -0,0 +1,365 @@
+import argparse
+import asyncio
+import logging
+import os
+import socket
+import struct
+import time
+from collections import deque
+from simulation import Match, make_sim_fighters, unpack_state, FPS, INTRO_COUNT, STATE_SIZE
+from replay import ReplayRecorder
+
+logger = logging.getLogger(__name__)
+
+# Server authoritative matches. Clients only send the buttons they hold; the
+# server steps every room at a fixed tick and sends both players the packed
+# match state (Match.pack()). A state is normally sent as a delta
+# against the last state the client acknowledged: a bitmask of the bytes that
+# changed followed by those bytes. Every FULL_STATE_EVERY sends, and whenever
+# the acknowledged state is too old, the full state is sent instead.
+
+DEFAULT_PORT = 7300
+# send the state every this many ticks
+SEND_EVERY = 2
+# every this many sends the full state goes out, whatever the clients acknowledged
+FULL_STATE_EVERY = 30
+# states kept per room (and per client) as delta baselines
+HISTORY = 64
+CLIENT_TIMEOUT = 5.0
+# how long a finished room keeps sending its final state before it is removed
+FINISHED_LINGER = 3.0
+STATS_INTERVAL = 10.0
+
+# client to server: magic, room name follows
+JOIN = struct.Struct("<2s")
+# client to server: magic, room id, player, sequence, last state tick received, input bits
+INPUT = struct.Struct("<2sHBIiB")
+# server to client: magic, room id, player
+WELCOME = struct.Struct("<2sHB")
+# server to client: magic, room id, tick, baseline tick (NO_BASELINE for a full state), then the state or delta
+STATE = struct.Struct("<2sHIi")
+NO_BASELINE = -1
+MAX_ROOM_NAME = 32
+MASK_SIZE = (STATE_SIZE + 7) // 8
+
+
+def encode_delta(state, baseline):
+    """Bitmask of the bytes of state that differ from baseline, then those bytes."""
+    mask = bytearray(MASK_SIZE)
+    changed = bytearray()
+    for i, (new, old) in enumerate(zip(state, baseline)):
+        if new != old:
+            mask[i >> 3] |= 1 << (i & 7)
+            changed.append(new)
+    return bytes(mask) + bytes(changed)
+
+
+def apply_delta(baseline, delta):
+    state = bytearray(baseline)
+    position = MASK_SIZE
+    for i in range(len(state)):
+        if delta[i >> 3] & (1 << (i & 7)):
+            state[i] = delta[position]
+            position += 1
+    return bytes(state)
+
+
+class Room:
+    """One match on the server and the two clients playing it."""
+
+    def __init__(self, room_id, name, recorder=None):
+        self.room_id = room_id
+        self.name = name
+        self.match = Match(make_sim_fighters)
+        self.players = {}# player number: address
+        self.inputs = [0, 0]
+        self.sequences = [0, 0]
+        self.acks = [NO_BASELINE, NO_BASELINE]
+        self.last_heard = [time.monotonic(), time.monotonic()]
+        self.history = {}
+        self.finished_at = None
+        self.recorder = recorder
+        self.sends = 0
+        self.tick_times = deque(maxlen=FPS * 10)
+
+    def full(self):
+        return len(self.players) == 2
+
+    def step(self):
+        """Advance the match once both players are seated; returns the packed state, or None while waiting."""
+        if not self.full():
+            return None
+        if not self.match.finished:
+            if self.recorder:
+                self.recorder.record(self.match, self.inputs[0], self.inputs[1])
+            self.match.step(self.inputs[0], self.inputs[1])
+            if self.match.finished:
+                self.finished_at = time.monotonic()
+                if self.recorder:
+                    self.recorder.close()
+        state = self.match.pack()
+        self.history[self.match.tick] = state
+        self.history.pop(self.match.tick - HISTORY, None)
+        return state
+
+    def broadcast(self, transport, state):
+        """Send each player the state, as a delta against what they last acknowledged when possible."""
+        tick = self.match.tick
+        full = self.sends % FULL_STATE_EVERY == 0
+        self.sends += 1
+        # both players usually acknowledged the same state, so build each packet once
+        packets = {}
+        for player, address in self.players.items():
+            baseline = self.acks[player - 1]
+            if full or baseline == tick or baseline not in self.history:
+                baseline = NO_BASELINE
+            packet = packets.get(baseline)
+            if packet is None:
+                if baseline == NO_BASELINE:
+                    packet = STATE.pack(b"SS", self.room_id, tick, NO_BASELINE) + state
+                else:
+                    packet = STATE.pack(b"SS", self.room_id, tick, baseline) + encode_delta(state, self.history[baseline])
+                packets[baseline] = packet
+            transport.sendto(packet, address)
+
+    def stats(self):
+        times = sorted(self.tick_times)
+        if not times:
+            return {"ticks": 0}
+        return {
+            "ticks": self.match.tick,
+            "mean_ms": round(sum(times) / len(times) * 1000, 4),
+            "p99_ms": round(times[int(len(times) * 0.99)] * 1000, 4),
+            "max_ms": round(times[-1] * 1000, 4)
+        }
+
+
+class MatchServer(asyncio.DatagramProtocol):
+    """Runs every room in one process, stepping them all on a shared fixed tick."""
+
+    def __init__(self, tick_rate=FPS, send_every=SEND_EVERY, replay_dir=None):
+        self.tick_rate = tick_rate
+        self.send_every = send_every
+        self.replay_dir = replay_dir
+        self.rooms = {}
+        self.by_address = {}# address: (room, player)
+        self.next_room_id = 0
+        self.transport = None
+        self.ticks = 0
+        self.overruns = 0
+        self.tick_time = 0.0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        if data[:2] == b"SI" and len(data) >= INPUT.size:
+            _, room_id, player, sequence, ack, bits = INPUT.unpack_from(data)
+            room = self.rooms.get(room_id)
+            # only the address that joined as this player may steer it
+            if room is None or room.players.get(player) != address:
+                return
+            index = player - 1
+            room.last_heard[index] = time.monotonic()
+            if sequence > room.sequences[index]:
+                room.sequences[index] = sequence
+                room.inputs[index] = bits & 31
+                room.acks[index] = ack
+        elif data[:2] == b"SJ":
+            name = data[JOIN.size:JOIN.size + MAX_ROOM_NAME].decode("utf-8", "replace")
+            room, player = self.join(name, address)
+            self.transport.sendto(WELCOME.pack(b"SW", room.room_id, player), address)
+
+    def join(self, name, address):
+        """Seat a client in the named room, or any waiting room when no name is given."""
+        if address in self.by_address:
+            return self.by_address[address]
+        room = None
+        for candidate in self.rooms.values():
+            if not candidate.full() and candidate.match.tick == 0 and (candidate.name == name or not name):
+                room = candidate
+                break
+        if room is None:
+            while self.next_room_id in self.rooms:
+                self.next_room_id = (self.next_room_id + 1) % 65536
+            recorder = None
+            if self.replay_dir:
+                os.makedirs(self.replay_dir, exist_ok=True)
+                recorder = ReplayRecorder(os.path.join(self.replay_dir, f"{time.strftime('%Y%m%d-%H%M%S')}-room{self.next_room_id}.sfr"))
+            room = Room(self.next_room_id, name, recorder)
+            self.rooms[room.room_id] = room
+            self.next_room_id = (self.next_room_id + 1) % 65536
+        player = 1 if 1 not in room.players else 2
+        room.players[player] = address
+        room.last_heard[player - 1] = time.monotonic()
+        self.by_address[address] = (room, player)
+        logger.info(f"{address} joined room {room.room_id} ({room.name or 'quick match'}) as player {player}")
+        return room, player
+
+    def remove(self, room):
+        del self.rooms[room.room_id]
+        for address in room.players.values():
+            self.by_address.pop(address, None)
+        if room.recorder:
+            room.recorder.close()
+
+    def tick(self):
+        """Step every room once and send states on send ticks."""
+        start = time.perf_counter()
+        now = time.monotonic()
+        send = self.ticks % self.send_every == 0
+        for room in list(self.rooms.values()):
+            room_start = time.perf_counter()
+            if any(now - room.last_heard[player - 1] > CLIENT_TIMEOUT for player in room.players) or (room.finished_at and now - room.finished_at > FINISHED_LINGER):
+                self.remove(room)
+                continue
+            state = room.step()
+            if send and state is not None and self.transport:
+                room.broadcast(self.transport, state)
+            room.tick_times.append(time.perf_counter() - room_start)
+        self.ticks += 1
+        self.tick_time = time.perf_counter() - start
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        interval = 1 / self.tick_rate
+        next_tick = loop.time()
+        next_stats = loop.time() + STATS_INTERVAL
+        while True:
+            self.tick()
+            next_tick += interval
+            if loop.time() > next_stats:
+                next_stats += STATS_INTERVAL
+                logger.info(f"Server: {self.stats()}")
+            delay = next_tick - loop.time()
+            if delay < 0:
+                self.overruns += 1
+                # more than a few ticks behind, give up on catching up
+                if delay < -5 * interval:
+                    next_tick = loop.time()
+            await asyncio.sleep(max(0, delay))
+
+    def stats(self):
+        rooms = [room.stats() for room in self.rooms.values()]
+        busy = [room for room in rooms if room["ticks"]]
+        return {
+            "rooms": len(self.rooms),
+            "tick_ms": round(self.tick_time * 1000, 3),
+            "overruns": self.overruns,
+            "room_mean_ms": round(sum(room["mean_ms"] for room in busy) / len(busy), 4) if busy else 0,
+            "room_p99_ms": max((room["p99_ms"] for room in busy), default=0)
+        }
+
+
+class RemoteMatch:
+    """Client side of a server match, with the attributes of a Match for drawing.
+
+    update() sends the held buttons and shows the newest state the server sent;
+    the fighters are whatever make_fighters creates, so sprites work as usual.
+    """
+
+    def __init__(self, make_fighters, server, room=""):
+        # replies come from the numeric address, so a host name is resolved once up front
+        self.server = socket.getaddrinfo(*server, socket.AF_INET, socket.SOCK_DGRAM)[0][4]
+        self.room_name = room.encode("utf-8")[:MAX_ROOM_NAME]
+        self.fighter_1, self.fighter_2 = make_fighters()
+        self.score = [0, 0]
+        self.tick = 0
+        self.intro_count = INTRO_COUNT
+        self.intro_ticks = 0
+        self.round_over = False
+        self.round_over_ticks = 0
+        self.finished = False
+        self.room_id = None
+        self.player = None
+        self.state_tick = NO_BASELINE
+        self.history = {}
+        self.sequence = 0
+        self.last_join = 0
+        self.last_heard = time.monotonic()
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.setblocking(False)
+
+    @property
+    def started(self):
+        return self.state_tick != NO_BASELINE
+
+    @property
+    def disconnected(self):
+        return time.monotonic() - self.last_heard > CLIENT_TIMEOUT
+
+    def update(self, local_input):
+        now = time.monotonic()
+        newest = None
+        while True:
+            try:
+                data, address = self.sock.recvfrom(2048)
+            except OSError:
+                break
+            if address != self.server:
+                continue
+            if data[:2] == b"SW" and len(data) >= WELCOME.size:
+                _, self.room_id, self.player = WELCOME.unpack_from(data)
+                self.last_heard = now
+            elif data[:2] == b"SS" and len(data) >= STATE.size and self.room_id is not None:
+                _, room_id, tick, baseline = STATE.unpack_from(data)
+                if room_id != self.room_id or tick <= self.state_tick:
+                    continue
+                payload = data[STATE.size:]
+                if baseline == NO_BASELINE:
+                    state = payload
+                elif baseline in self.history:
+                    state = apply_delta(self.history[baseline], payload)
+                else:
+                    continue
+                self.history[tick] = state
+                self.history.pop(tick - HISTORY, None)
+                self.state_tick = tick
+                self.last_heard = now
+                newest = state
+        if newest is not None:
+            self.restore(unpack_state(newest))
+
+        if self.room_id is None:
+            # keep asking for a seat until the server answers
+            if now - self.last_join > 0.5:
+                self.last_join = now
+                self.sock.sendto(JOIN.pack(b"SJ") + self.room_name, self.server)
+        else:
+            self.sequence += 1
+            self.sock.sendto(INPUT.pack(b"SI", self.room_id, self.player, self.sequence, self.state_tick, local_input), self.server)
+
+    def restore(self, state):
+        (self.tick, score_1, score_2, self.intro_count, self.intro_ticks, self.round_over,
+         self.round_over_ticks, self.finished, fighter_1, fighter_2) = state
+        self.score = [score_1, score_2]
+        self.fighter_1.restore(fighter_1)
+        self.fighter_2.restore(fighter_2)
+
+    def close(self):
+        self.sock.close()
+
+
+async def serve(host, port, tick_rate=FPS, send_every=SEND_EVERY, replay_dir=None):
+    loop = asyncio.get_running_loop()
+    server = MatchServer(tick_rate, send_every, replay_dir)
+    transport, _ = await loop.create_datagram_endpoint(lambda: server, local_addr=(host, port))
+    logger.info(f"Match server listening on {host}:{port}")
+    try:
+        await server.run()
+    finally:
+        transport.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Dedicated Stellar Fighter match server")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--send-every", type=int, default=SEND_EVERY, help="ticks between state updates")
+    parser.add_argument("--replays", help="record every room to this directory")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO)
+    try:
+        asyncio.run(serve(args.host, args.port, send_every=args.send_every, replay_dir=args.replays))
+    except KeyboardInterrupt:
+        pass
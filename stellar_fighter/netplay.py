@@ -0,0 +1,307 @@
+import argparse
+import heapq
+import logging
+import random
+import socket
+import struct
+import time
+from simulation import Match, FPS
+
+logger = logging.getLogger(__name__)
+
+# Online versus with rollback. Each side sends its input bits for upcoming ticks
+# and simulates straight away, guessing that the remote player keeps pressing
+# what they pressed last. When the real remote input for a tick turns out to be
+# different, the match is restored from the snapshot taken before that tick and
+# the ticks since are simulated again with what is now known.
+
+DEFAULT_PORT = 7001
+# local inputs apply this many ticks after they are read, hiding some latency without any rollback
+INPUT_DELAY = 2
+# how far the simulation may run ahead of the last confirmed remote input before it waits
+MAX_ROLLBACK = 15
+# most inputs carried by one packet; every packet repeats all inputs the peer has not acknowledged
+MAX_INPUTS_PER_PACKET = 64
+DISCONNECT_TIMEOUT = 5.0
+
+# magic, match number, highest tick received contiguously from the peer, first tick in the packet, input count
+PACKET = struct.Struct("<2sBiiB")
+MAGIC = b"SF"
+
+
+def parse_address(address, default_port=DEFAULT_PORT):
+    """Split "host:port" (or just "host") into a socket address tuple."""
+    host, _, port = address.rpartition(":")
+    if not host:
+        return address, default_port
+    return host, int(port)
+
+
+class UdpTransport:
+    """Non-blocking UDP to a single peer, with optional artificial latency, jitter and loss.
+
+    The shim applies to packets this side sends, so giving both processes the
+    same settings models a symmetric link (round trip is twice the latency).
+    """
+
+    def __init__(self, port, peer, latency=0.0, jitter=0.0, loss=0.0, seed=None):
+        self.peer = peer
+        self.latency = latency
+        self.jitter = jitter
+        self.loss = loss
+        self.rng = random.Random(seed)
+        self.outgoing = []
+        self.sequence = 0
+        self.sent = 0
+        self.dropped = 0
+        self.sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        self.sock.bind(("", port))
+        self.sock.setblocking(False)
+
+    def send(self, data):
+        if self.loss and self.rng.random() < self.loss:
+            self.dropped += 1
+            return
+        delay = self.latency + (self.rng.uniform(0, self.jitter) if self.jitter else 0)
+        if delay <= 0:
+            self._send_now(data)
+        else:
+            self.sequence += 1
+            heapq.heappush(self.outgoing, (time.monotonic() + delay, self.sequence, data))
+
+    def receive(self):
+        """Send whatever the shim is done delaying and return the datagrams that arrived."""
+        now = time.monotonic()
+        while self.outgoing and self.outgoing[0][0] <= now:
+            self._send_now(heapq.heappop(self.outgoing)[2])
+        packets = []
+        while True:
+            try:
+                data, address = self.sock.recvfrom(2048)
+            except BlockingIOError:
+                break
+            except OSError as e:
+                # an ICMP error from a peer that is not up yet, keep trying
+                logger.debug(f"UDP receive failed: {str(e)}")
+                break
+            packets.append(data)
+        return packets
+
+    def _send_now(self, data):
+        try:
+            self.sock.sendto(data, self.peer)
+            self.sent += 1
+        except OSError as e:
+            logger.debug(f"UDP send failed: {str(e)}")
+
+    def close(self):
+        self.sock.close()
+
+
+class RollbackSession:
+    """Runs one Match against a remote peer, rolling back on mispredicted remote input.
+
+    on_confirmed, when set, is called as on_confirmed(tick, packed state, input 1, input 2)
+    for every tick once both inputs are final, in tick order, which is what
+    ReplayRecorder.record_tick expects.
+    """
+
+    def __init__(self, match, player, transport, match_number=0, input_delay=INPUT_DELAY, max_rollback=MAX_ROLLBACK):
+        self.match = match
+        self.player = player
+        self.transport = transport
+        self.match_number = match_number % 256
+        self.input_delay = input_delay
+        self.max_rollback = max_rollback
+        self.local_inputs = {tick: 0 for tick in range(input_delay)}
+        self.remote_inputs = {}
+        # every remote input up to and including this tick is known
+        self.remote_confirmed = -1
+        # remote inputs the simulation guessed, for ticks not yet confirmed
+        self.predicted = {}
+        # highest tick the peer has all our inputs up to
+        self.peer_ack = -1
+        # ring buffer of (tick, packed state before that tick)
+        self.states = [None] * (max_rollback + 2)
+        self.next_confirmed = 0
+        self.on_confirmed = None
+        self.connected = False
+        self.disconnected = False
+        self.last_heard = time.monotonic()
+        self.last_sent = 0
+        self.rollbacks = 0
+        self.rollback_ticks = 0
+        self.stalls = 0
+
+    def advance(self, local_input):
+        """Run the next tick with the local player's input; False if waiting on the peer."""
+        self.poll()
+        tick = self.match.tick
+        if not self.connected or self.match.finished:
+            return False
+        if tick - self.remote_confirmed > self.max_rollback:
+            # too far ahead of what the peer has told us, wait for it to catch up
+            self.stalls += 1
+            return False
+        self.local_inputs[tick + self.input_delay] = local_input
+        self._send()
+        self._simulate(tick)
+        return True
+
+    def poll(self):
+        """Handle packets from the peer and keep our unacknowledged inputs flowing."""
+        rollback_to = None
+        for data in self.transport.receive():
+            if len(data) < PACKET.size:
+                continue
+            magic, match_number, ack, start, count = PACKET.unpack_from(data)
+            if magic != MAGIC or match_number != self.match_number or len(data) < PACKET.size + count:
+                continue
+            self.connected = True
+            self.last_heard = time.monotonic()
+            self.peer_ack = max(self.peer_ack, ack)
+            for tick, bits in enumerate(data[PACKET.size:PACKET.size + count], start):
+                if tick <= self.remote_confirmed or tick in self.remote_inputs:
+                    continue
+                self.remote_inputs[tick] = bits
+                guess = self.predicted.pop(tick, None)
+                if guess is not None and guess != bits and (rollback_to is None or tick < rollback_to):
+                    rollback_to = tick
+        while self.remote_confirmed + 1 in self.remote_inputs:
+            self.remote_confirmed += 1
+
+        if rollback_to is not None:
+            self._rollback(rollback_to)
+        self._confirm()
+        self._prune()
+        now = time.monotonic()
+        if self.connected and now - self.last_heard > DISCONNECT_TIMEOUT:
+            self.disconnected = True
+        # advance() sends every tick, between ticks resend at most once per tick
+        if now - self.last_sent >= 1 / FPS:
+            self._send()
+
+    def confirmed_finished(self):
+        """The match is over and no late remote input can change that any more."""
+        return self.match.finished and self.remote_confirmed >= self.match.tick - 1
+
+    def inputs(self, tick):
+        local = self.local_inputs[tick]
+        remote = self.remote_inputs.get(tick)
+        if remote is None:
+            # predict the remote player keeps doing what they last did
+            remote = self.remote_inputs.get(self.remote_confirmed, 0)
+            self.predicted[tick] = remote
+        return (local, remote) if self.player == 1 else (remote, local)
+
+    def _simulate(self, tick):
+        self.states[tick % len(self.states)] = (tick, self.match.pack())
+        self.match.step(*self.inputs(tick))
+
+    def _rollback(self, tick):
+        saved_tick, state = self.states[tick % len(self.states)]
+        if saved_tick != tick:
+            raise RuntimeError(f"Rollback to tick {tick} is outside the snapshot buffer")
+        current = self.match.tick
+        self.match.unpack(state)
+        for resim in range(tick, current):
+            self.predicted.pop(resim, None)
+            self._simulate(resim)
+        self.rollbacks += 1
+        self.rollback_ticks += current - tick
+
+    def _confirm(self):
+        # the state before a tick is final once every input before it is
+        while self.next_confirmed <= self.remote_confirmed and self.next_confirmed < self.match.tick:
+            tick = self.next_confirmed
+            if self.on_confirmed:
+                input_1, input_2 = self.inputs(tick)
+                self.on_confirmed(tick, self.states[tick % len(self.states)][1], input_1, input_2)
+            self.next_confirmed += 1
+
+    def _prune(self):
+        # keep what a rollback or a resend could still need
+        oldest = self.match.tick - len(self.states)
+        for inputs, keep in ((self.local_inputs, min(oldest, self.peer_ack)), (self.remote_inputs, min(oldest, self.next_confirmed - 1, self.remote_confirmed))):
+            if len(inputs) > 2 * len(self.states) + MAX_INPUTS_PER_PACKET:
+                for tick in [tick for tick in inputs if tick < keep]:
+                    del inputs[tick]
+
+    def _send(self):
+        self.last_sent = time.monotonic()
+        start = self.peer_ack + 1
+        last = max(self.local_inputs)
+        count = max(0, min(last - start + 1, MAX_INPUTS_PER_PACKET))
+        bits = bytes(self.local_inputs[tick] for tick in range(start, start + count))
+        self.transport.send(PACKET.pack(MAGIC, self.match_number, self.remote_confirmed, start, count) + bits)
+
+    def stats(self):
+        return {
+            "tick": self.match.tick,
+            "remote_confirmed": self.remote_confirmed,
+            "rollbacks": self.rollbacks,
+            "rollback_ticks": self.rollback_ticks,
+            "stalls": self.stalls,
+            "sent": self.transport.sent,
+            "dropped": self.transport.dropped
+        }
+
+
+def play_headless(player, port, peer, bot, seed=0, latency=0.0, jitter=0.0, loss=0.0, replay=None, timeout=600.0):
+    """Play an online match with a bot at real time speed and return the session once it is over."""
+    from bots import make_bot
+    from replay import ReplayRecorder
+
+    transport = UdpTransport(port, peer, latency, jitter, loss, seed)
+    session = RollbackSession(Match(), player, transport)
+    policy = make_bot(bot, seed)
+    recorder = None
+    if replay:
+        recorder = ReplayRecorder(replay)
+        session.on_confirmed = recorder.record_tick
+    start = time.monotonic()
+    ticks_due = 0
+    try:
+        while not session.confirmed_finished() and not session.disconnected:
+            if time.monotonic() - start > timeout:
+                raise TimeoutError(f"Online match did not finish within {timeout} seconds")
+            now = time.monotonic()
+            if not session.connected:
+                session.poll()
+                start_ticks = now
+            elif now - start_ticks >= ticks_due / FPS:
+                ticks_due += 1
+                session.advance(policy(session.match, player))
+            else:
+                session.poll()
+            time.sleep(0.001)
+        # keep answering for a moment so a peer still missing our last inputs can finish too
+        linger = time.monotonic() + 1.0
+        while time.monotonic() < linger:
+            session.poll()
+            time.sleep(0.005)
+    finally:
+        if recorder:
+            recorder.close()
+        transport.close()
+    return session
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Headless online match between two processes, played by bots")
+    parser.add_argument("--player", type=int, choices=[1, 2], required=True)
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT, help="local UDP port")
+    parser.add_argument("--peer", required=True, help="host:port of the other process")
+    parser.add_argument("--bot", default="aggressive")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every packet sent")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random delay in seconds, reorders packets")
+    parser.add_argument("--loss", type=float, default=0.0, help="fraction of sent packets dropped")
+    parser.add_argument("--replay", help="record the confirmed match to this replay file")
+    args = parser.parse_args()
+
+    session = play_headless(args.player, args.port, parse_address(args.peer), args.bot, args.seed, args.latency, args.jitter, args.loss, args.replay)
+    match = session.match
+    # both processes print the same checksum when they agree on the final state
+    print(f"player {args.player}: score P1 {match.score[0]} - P2 {match.score[1]} at tick {match.tick}, state {match.checksum():08x}")
+    print(f"player {args.player}: {session.stats()}")
@@ -0,0 +1,146 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Stats of every player who has played on this install, one row per username
+# in SQLite. Saving a profile updates just its row, in a transaction of its
+# own, from a background thread so the game loop never waits on the disk.
+
+PROFILE_DB = "profiles.db"
+DEFAULT_USERNAME = "warrior"
+DEFAULT_STATS = {
+    "personal_score": 30,
+    "wins": 0,
+    "losses": 0,
+    "win_streak": 0
+}
+STAT_NAMES = tuple(DEFAULT_STATS)
+# how long a save waits for newer stats of the same player before it is committed
+WRITE_DELAY = 0.5
+
+
+class ProfileStore:
+    """Per-username stats with write-behind saves; reads come from memory once a profile has been loaded."""
+
+    def __init__(self, path=PROFILE_DB, delay=WRITE_DELAY):
+        self.path = path
+        self.delay = delay
+        self.cache = {}
+        self.pending = {}
+        self.writes = 0
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        # a commit is on disk before it returns, so a crash loses at most the saves still waiting
+        self.db.execute("PRAGMA synchronous=FULL")
+        self.db.execute("""CREATE TABLE IF NOT EXISTS profiles (
+            username TEXT PRIMARY KEY,
+            personal_score INTEGER NOT NULL,
+            wins INTEGER NOT NULL,
+            losses INTEGER NOT NULL,
+            win_streak INTEGER NOT NULL,
+            last_played REAL NOT NULL)""")
+        self.db.execute("CREATE INDEX IF NOT EXISTS profiles_last_played ON profiles (last_played)")
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        self.db.commit()
+        self._wake = threading.Event()
+        self._running = True
+        self._thread = threading.Thread(target=self._run, name="profile-writer", daemon=True)
+        self._thread.start()
+
+    def load(self, username):
+        """The player's stats, a fresh profile if they have never played; marks them as the latest player."""
+        with self._lock:
+            stats = self.cache.get(username)
+        if stats is None:
+            with self._db_lock:
+                row = self.db.execute(f"SELECT {', '.join(STAT_NAMES)} FROM profiles WHERE username = ?", (username,)).fetchone()
+            stats = dict(zip(STAT_NAMES, row)) if row else dict(DEFAULT_STATS)
+        self.save(username, stats)
+        return dict(stats)
+
+    def save(self, username, stats):
+        """Queue the player's stats to be written; later saves before the write replace earlier ones."""
+        stats = {name: stats[name] for name in STAT_NAMES}
+        with self._lock:
+            self.cache[username] = stats
+            self.pending[username] = (username, *stats.values(), time.time())
+        self._wake.set()
+
+    def recent(self, limit=6):
+        """Usernames, the most recently played first."""
+        self.flush()
+        with self._db_lock:
+            rows = self.db.execute("SELECT username FROM profiles ORDER BY last_played DESC LIMIT ?", (limit,)).fetchall()
+        return [row[0] for row in rows]
+
+    def count(self):
+        self.flush()
+        with self._db_lock:
+            return self.db.execute("SELECT COUNT(*) FROM profiles").fetchone()[0]
+
+    def flush(self):
+        """Commit every pending save on the calling thread, in one transaction."""
+        # the saves are taken and committed under the one database lock, so when the writer
+        # thread and the game thread both flush, older stats can never be committed over newer ones
+        with self._db_lock:
+            with self._lock:
+                rows = list(self.pending.values())
+                self.pending = {}
+            if not rows:
+                return
+            try:
+                with self.db:
+                    self.db.executemany("INSERT OR REPLACE INTO profiles VALUES (?, ?, ?, ?, ?, ?)", rows)
+                self.writes += 1
+            except sqlite3.Error as e:
+                logger.error(f"Failed to save profiles: {str(e)}")
+
+    def migrated(self):
+        with self._db_lock:
+            return self.db.execute("SELECT value FROM meta WHERE key = 'json_migrated'").fetchone() is not None
+
+    def migrate_json(self, path, username=DEFAULT_USERNAME):
+        """Import the single player game_data.json as username's profile, once; returns the document, or None."""
+        document = None
+        if os.path.exists(path):
+            try:
+                with open(path, "r") as f:
+                    document = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"Could not import {path}: {str(e)}")
+        if document is not None:
+            stats = {name: document.get(name, default) for name, default in DEFAULT_STATS.items()}
+            with self._db_lock, self.db:
+                # a profile already in the store is newer than the file
+                self.db.execute("INSERT OR IGNORE INTO profiles VALUES (?, ?, ?, ?, ?, ?)", (username, *stats.values(), time.time()))
+        with self._db_lock, self.db:
+            self.db.execute("INSERT OR REPLACE INTO meta VALUES ('json_migrated', ?)", (time.strftime("%Y-%m-%d %H:%M:%S"),))
+        if document is not None:
+            logger.info(f"Imported {path} as the profile of {username}")
+        return document
+
+    def close(self):
+        """Stop the writer thread and commit whatever is still pending."""
+        self._running = False
+        self._wake.set()
+        self._thread.join()
+        self.flush()
+        with self._db_lock:
+            self.db.close()
+
+    def _run(self):
+        while self._running:
+            self._wake.wait()
+            self._wake.clear()
+            if not self._running:
+                break
+            # give further saves a moment to land so they are coalesced into one commit
+            time.sleep(self.delay)
+            self.flush()
@@ -0,0 +1,237 @@
+import argparse
+import os
+import struct
+import time
+from simulation import Match, make_sim_fighters, STATE_SIZE, SCREEN_WIDTH, SCREEN_HEIGHT, FPS, INTRO_COUNT, WARRIOR_DATA, WIZARD_DATA, WARRIOR_ANIMATION_STEPS, WIZARD_ANIMATION_STEPS
+
+# Binary replays of a match. The simulation only depends on the input bits of
+# each tick, so a replay is the input byte of both players for every tick plus
+# a full state keyframe every KEYFRAME_INTERVAL ticks. The file is a header
+# followed by fixed size blocks:
+#   keyframe (state with match.tick == block * interval), then interval ticks of inputs
+# so the block holding any tick is found by arithmetic and seeking replays at
+# most one interval of ticks from the keyframe before it.
+
+MAGIC = b"SFRP"
+VERSION = 1
+KEYFRAME_INTERVAL = 2 * FPS
+REPLAY_DIR = "replays"
+# the game records every match, so only the newest ones are kept
+MAX_REPLAYS = 50
+
+# magic, version, ticks per second, keyframe interval, intro countdown
+HEADER = struct.Struct("<4sBHHB")
+# a keyframe is the packed state of Match.pack()
+KEYFRAME_SIZE = STATE_SIZE
+
+
+def replay_path(directory=REPLAY_DIR, keep=MAX_REPLAYS):
+    """A new timestamped file name in the replay directory, deleting old replays so keep remain with it."""
+    os.makedirs(directory, exist_ok=True)
+    prune_replays(directory, keep - 1)
+    return os.path.join(directory, time.strftime("%Y%m%d-%H%M%S") + ".sfr")
+
+
+def prune_replays(directory=REPLAY_DIR, keep=MAX_REPLAYS):
+    """Delete all but the newest keep replays; the timestamped names sort oldest first."""
+    replays = sorted(name for name in os.listdir(directory) if name.endswith(".sfr"))
+    for name in replays[:max(0, len(replays) - keep)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+
+
+class ReplayRecorder:
+    """Writes the inputs of a match, tick by tick, to a replay file."""
+
+    def __init__(self, path, keyframe_interval=KEYFRAME_INTERVAL, intro_count=INTRO_COUNT):
+        self.path = path
+        self.keyframe_interval = keyframe_interval
+        self.ticks = 0
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, FPS, keyframe_interval, intro_count))
+
+    def record(self, match, input_1, input_2):
+        """Record the inputs for the next match.step(); call it before stepping."""
+        if match.finished:
+            return
+        keyframe = match.pack() if match.tick % self.keyframe_interval == 0 else None
+        self.record_tick(match.tick, keyframe, input_1, input_2)
+
+    def record_tick(self, tick, keyframe, input_1, input_2):
+        """Record one tick from its packed starting state, which is only used on keyframe ticks."""
+        if self.file is None:
+            return
+        if tick != self.ticks:
+            raise ValueError(f"Replay expected tick {self.ticks} but got tick {tick}")
+        if tick % self.keyframe_interval == 0:
+            self.file.write(keyframe)
+        self.file.write(bytes((input_1, input_2)))
+        self.ticks += 1
+
+    def close(self):
+        if self.file is not None:
+            self.file.close()
+            self.file = None
+
+
+class ReplayPlayer:
+    """Re-simulates a replay file, with or without sprites depending on make_fighters."""
+
+    def __init__(self, path, make_fighters=make_sim_fighters):
+        with open(path, "rb") as f:
+            self.data = f.read()
+        if len(self.data) < HEADER.size:
+            raise ValueError(f"{path} is too short to be a replay")
+        magic, version, self.fps, self.keyframe_interval, self.intro_count = HEADER.unpack_from(self.data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} replay")
+        self.block_size = KEYFRAME_SIZE + 2 * self.keyframe_interval
+        # a recording cut short (a crash, a quit mid match) simply ends at its last whole tick
+        blocks, rest = divmod(len(self.data) - HEADER.size, self.block_size)
+        self.ticks = blocks * self.keyframe_interval + max(0, rest - KEYFRAME_SIZE) // 2
+        self.keyframes = blocks + (1 if rest >= KEYFRAME_SIZE else 0)
+        self.match = Match(make_fighters, intro_count=self.intro_count)
+
+    def inputs(self, tick):
+        """Input bits of both players for the step from tick to tick + 1."""
+        block, offset = divmod(tick, self.keyframe_interval)
+        position = HEADER.size + block * self.block_size + KEYFRAME_SIZE + 2 * offset
+        return self.data[position], self.data[position + 1]
+
+    def keyframe(self, index):
+        """Packed state of keyframe index."""
+        position = HEADER.size + index * self.block_size
+        return self.data[position:position + KEYFRAME_SIZE]
+
+    def step(self):
+        """Advance one tick; False once the end of the recording is reached."""
+        if self.match.tick >= self.ticks:
+            return False
+        self.match.step(*self.inputs(self.match.tick))
+        return True
+
+    def fast_forward(self, ticks):
+        for _ in range(ticks):
+            if not self.step():
+                break
+
+    def seek(self, tick):
+        """Jump to any tick: restore the keyframe at or before it and replay the rest of the interval."""
+        tick = max(0, min(tick, self.ticks))
+        index = min(tick // self.keyframe_interval, self.keyframes - 1)
+        if index < 0:
+            return
+        # skip the restore when stepping forward from where we are is no more work
+        if not (self.match.tick <= tick and self.match.tick >= index * self.keyframe_interval):
+            self.match.unpack(self.keyframe(index))
+        self.fast_forward(tick - self.match.tick)
+
+    def verify(self):
+        """Re-simulate from the start and compare against every keyframe.
+
+        Returns the first tick whose keyframe differs from the simulation, or None
+        if the replay plays back exactly as it was recorded.
+        """
+        self.match.unpack(self.keyframe(0))
+        for index in range(self.keyframes):
+            self.fast_forward(index * self.keyframe_interval - self.match.tick)
+            if self.match.pack() != self.keyframe(index):
+                return index * self.keyframe_interval
+        return None
+
+
+def record_match(path, policy_1, policy_2, max_ticks=60 * 60 * FPS, keyframe_interval=KEYFRAME_INTERVAL):
+    """Play a headless match between two policies and save it as a replay."""
+    match = Match(make_sim_fighters)
+    recorder = ReplayRecorder(path, keyframe_interval)
+    try:
+        while not match.finished and match.tick < max_ticks:
+            input_1 = policy_1(match, 1)
+            input_2 = policy_2(match, 2)
+            recorder.record(match, input_1, input_2)
+            match.step(input_1, input_2)
+    finally:
+        recorder.close()
+    return match
+
+
+def watch(path, speed=1):
+    """Play a replay back in a window. Space pauses, left/right seek 5 seconds, up/down change speed."""
+    import pygame
+    from fighter import Fighter
+
+    pygame.init()
+    screen = pygame.display.set_mode((SCREEN_WIDTH, SCREEN_HEIGHT))
+    pygame.display.set_caption("Stellar Fighter replay")
+    bg_image = pygame.image.load("assets/images/background/background.jpg").convert_alpha()
+    bg_image = pygame.transform.scale(bg_image, (SCREEN_WIDTH, SCREEN_HEIGHT))
+    warrior_sheet = pygame.image.load("assets/images/warrior/Sprites/warrior.png").convert_alpha()
+    wizard_sheet = pygame.image.load("assets/images/wizard/Sprites/wizard.png").convert_alpha()
+    font = pygame.font.Font("assets/fonts/turok.ttf", 30)
+
+    def make_fighters():
+        fighter_1 = Fighter(1, 200, 310, False, WARRIOR_DATA, warrior_sheet, WARRIOR_ANIMATION_STEPS)
+        fighter_2 = Fighter(2, 700, 310, True, WIZARD_DATA, wizard_sheet, WIZARD_ANIMATION_STEPS)
+        return fighter_1, fighter_2
+
+    player = ReplayPlayer(path, make_fighters)
+    clock = pygame.time.Clock()
+    paused = False
+    run = True
+    while run:
+        clock.tick(player.fps)
+        for event in pygame.event.get():
+            if event.type == pygame.QUIT:
+                run = False
+            elif event.type == pygame.KEYDOWN:
+                if event.key == pygame.K_SPACE:
+                    paused = not paused
+                elif event.key == pygame.K_RIGHT:
+                    player.seek(player.match.tick + 5 * player.fps)
+                elif event.key == pygame.K_LEFT:
+                    player.seek(player.match.tick - 5 * player.fps)
+                elif event.key == pygame.K_UP:
+                    speed = min(speed * 2, 16)
+                elif event.key == pygame.K_DOWN:
+                    speed = max(speed // 2, 1)
+                elif event.key == pygame.K_ESCAPE:
+                    run = False
+        if not paused:
+            player.fast_forward(speed)
+
+        match = player.match
+        screen.blit(bg_image, (0, 0))
+        for fighter, x in ((match.fighter_1, 20), (match.fighter_2, 580)):
+            pygame.draw.rect(screen, (255, 255, 255), (x - 2, 18, 404, 34))
+            pygame.draw.rect(screen, (255, 0, 0), (x, 20, 400, 30))
+            pygame.draw.rect(screen, (255, 255, 0), (x, 20, 400 * fighter.health / 100, 30))
+        screen.blit(font.render(f"P1: {match.score[0]}   P2: {match.score[1]}", True, (255, 0, 0)), (20, 60))
+        status = "paused" if paused else f"x{speed}"
+        screen.blit(font.render(f"{match.tick / player.fps:6.1f} / {player.ticks / player.fps:.1f} s  {status}", True, (255, 255, 255)), (580, 60))
+        match.fighter_1.draw(screen)
+        match.fighter_2.draw(screen)
+        pygame.display.update()
+    pygame.quit()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Inspect, check and watch Stellar Fighter replays")
+    parser.add_argument("command", choices=["info", "verify", "watch"])
+    parser.add_argument("replay")
+    parser.add_argument("--speed", type=int, default=1, help="ticks per frame when watching")
+    args = parser.parse_args()
+
+    if args.command == "watch":
+        watch(args.replay, args.speed)
+    else:
+        player = ReplayPlayer(args.replay)
+        print(f"{args.replay}: {player.ticks} ticks ({player.ticks / player.fps:.1f} s), {player.keyframes} keyframes every {player.keyframe_interval} ticks")
+        if args.command == "verify":
+            desync = player.verify()
+            player.seek(player.ticks)
+            if desync is None:
+                print(f"plays back exactly, final score P1 {player.match.score[0]} - P2 {player.match.score[1]}")
+            else:
+                print(f"simulation differs from the recording at tick {desync}")
@@ -0,0 +1,384 @@
+import pygame
+import struct
+import zlib
+
+#headless fighting core: fighters advance one fixed tick at a time from an input bitmask,
+#so matches run the same with or without a window and as fast as the CPU allows
+
+SCREEN_WIDTH = 1000
+SCREEN_HEIGHT = 600
+FPS = 60
+
+#define fighter variables
+WARRIOR_SIZE = 162
+WARRIOR_SCALE = 4
+WARRIOR_OFFSET = [72, 56]
+WARRIOR_DATA = [WARRIOR_SIZE, WARRIOR_SCALE, WARRIOR_OFFSET]
+WIZARD_SIZE = 250
+WIZARD_SCALE = 3
+WIZARD_OFFSET = [112, 107]
+WIZARD_DATA = [WIZARD_SIZE, WIZARD_SCALE, WIZARD_OFFSET]
+
+#define number of steps in each animation
+WARRIOR_ANIMATION_STEPS = [10, 8, 1, 7, 7, 3, 7]
+WIZARD_ANIMATION_STEPS = [8, 8, 1, 8, 8, 3, 7]
+
+#input bits for one tick
+INPUT_LEFT = 1
+INPUT_RIGHT = 2
+INPUT_JUMP = 4
+INPUT_ATTACK1 = 8
+INPUT_ATTACK2 = 16
+
+#timings in ticks
+ANIMATION_TICKS = 4#first tick more than 50 ms after the last frame change at 60 FPS
+INTRO_TICKS = FPS#one second per countdown step
+ROUND_OVER_TICKS = 2 * FPS#pause after a knockout before the next round
+INTRO_COUNT = 3
+ROUNDS_TO_WIN = 3
+
+#rules of the fight, defaults that balance sweeps can override per fighter
+SPEED = 10
+GRAVITY = 2
+JUMP_VELOCITY = -30
+ATTACK_DAMAGE = 10
+ATTACK_COOLDOWN_TICKS = 20
+
+#packed state, cheap to copy, hash, store and send (replay keyframes, rollback, the match server)
+#tick, score P1, score P2, intro count, intro ticks, round over, round over ticks, finished
+MATCH_STATE = struct.Struct("<IBBbH?H?")
+#in the order of FighterSim.snapshot
+FIGHTER_STATE = struct.Struct("<hhh????BH?h?BBBII")
+STATE_SIZE = MATCH_STATE.size + 2 * FIGHTER_STATE.size
+
+
+class FighterSim():
+  #fixed attributes keep fighters small and attribute access fast; the sprite
+  #data of Fighter lives in the subclass, outside the simulation state
+  __slots__ = ("player", "size", "image_scale", "offset", "animation_steps",
+               "speed", "gravity", "jump_velocity", "attack_damage", "attack_cooldown_ticks",
+               "rect", "vel_y", "flip", "running", "jump", "attacking", "attack_type", "attack_cooldown",
+               "hit", "health", "alive", "action", "frame_index", "display_frame", "ticks", "update_tick")
+
+  def __init__(self, player, x, y, flip, data, animation_steps):
+    self.player = player
+    self.speed = SPEED
+    self.gravity = GRAVITY
+    self.jump_velocity = JUMP_VELOCITY
+    self.attack_damage = ATTACK_DAMAGE
+    self.attack_cooldown_ticks = ATTACK_COOLDOWN_TICKS
+    self.size = data[0]
+    self.image_scale = data[1]
+    self.offset = data[2]
+    self.flip = flip
+    self.animation_steps = animation_steps
+    self.action = 0#0:idle #1:run #2:jump #3:attack1 #4: attack2 #5:hit #6:death
+    self.frame_index = 0
+    self.display_frame = 0
+    self.ticks = 0
+    self.update_tick = 0
+    self.rect = pygame.Rect((x, y, 80, 180))
+    self.vel_y = 0
+    self.running = False
+    self.jump = False
+    self.attacking = False
+    self.attack_type = 0
+    self.attack_cooldown = 0
+    self.hit = False
+    self.health = 100
+    self.alive = True
+
+
+  def step(self, inputs, screen_width, screen_height, target, round_over):
+    SPEED = self.speed
+    GRAVITY = self.gravity
+    dx = 0
+    dy = 0
+    self.running = False
+    self.attack_type = 0
+
+    #can only perform other actions if not currently attacking
+    if self.attacking == False and self.alive == True and round_over == False:
+      #movement
+      if inputs & INPUT_LEFT:
+        dx = -SPEED
+        self.running = True
+      if inputs & INPUT_RIGHT:
+        dx = SPEED
+        self.running = True
+      #jump
+      if inputs & INPUT_JUMP and self.jump == False:
+        self.vel_y = self.jump_velocity
+        self.jump = True
+      #attack
+      if inputs & (INPUT_ATTACK1 | INPUT_ATTACK2):
+        #determine which attack type was used
+        if inputs & INPUT_ATTACK1:
+          self.attack_type = 1
+        if inputs & INPUT_ATTACK2:
+          self.attack_type = 2
+        self.attack(target)
+
+    #apply gravity
+    self.vel_y += GRAVITY
+    dy += self.vel_y
+
+    #ensure player stays on screen
+    if self.rect.left + dx < 0:
+      dx = -self.rect.left
+    if self.rect.right + dx > screen_width:
+      dx = screen_width - self.rect.right
+    if self.rect.bottom + dy > screen_height - 110:
+      self.vel_y = 0
+      self.jump = False
+      dy = screen_height - 110 - self.rect.bottom
+
+    #ensure players face each other
+    if target.rect.centerx > self.rect.centerx:
+      self.flip = False
+    else:
+      self.flip = True
+
+    #apply attack cooldown
+    if self.attack_cooldown > 0:
+      self.attack_cooldown -= 1
+
+    #update player position
+    self.rect.x += dx
+    self.rect.y += dy
+
+
+  #handle animation updates, one call per tick
+  def update(self):
+    self.ticks += 1
+    #check what action the player is performing
+    if self.health <= 0:
+      self.health = 0
+      self.alive = False
+      self.update_action(6)#6:death
+    elif self.hit == True:
+      self.update_action(5)#5:hit
+    elif self.attacking == True:
+      if self.attack_type == 1:
+        self.update_action(3)#3:attack1
+      elif self.attack_type == 2:
+        self.update_action(4)#4:attack2
+    elif self.jump == True:
+      self.update_action(2)#2:jump
+    elif self.running == True:
+      self.update_action(1)#1:run
+    else:
+      self.update_action(0)#0:idle
+
+    #frame to show for this tick
+    self.display_frame = self.frame_index
+    #check if enough time has passed since the last update
+    if self.ticks - self.update_tick >= ANIMATION_TICKS:
+      self.frame_index += 1
+      self.update_tick = self.ticks
+    #check if the animation has finished
+    if self.frame_index >= self.animation_steps[self.action]:
+      #if the player is dead then end the animation
+      if self.alive == False:
+        self.frame_index = self.animation_steps[self.action] - 1
+      else:
+        self.frame_index = 0
+        #check if an attack was executed
+        if self.action == 3 or self.action == 4:
+          self.attacking = False
+          self.attack_cooldown = self.attack_cooldown_ticks
+        #check if damage was taken
+        if self.action == 5:
+          self.hit = False
+          #if the player was in the middle of an attack, then the attack is stopped
+          self.attacking = False
+          self.attack_cooldown = self.attack_cooldown_ticks
+
+
+  def attack(self, target):
+    if self.attack_cooldown == 0:
+      #execute attack
+      self.attacking = True
+      if self.attack_rect().colliderect(target.rect):
+        target.health -= self.attack_damage
+        target.hit = True
+
+
+  def attack_rect(self):
+    #the area an attack started now would hit, in front of the fighter
+    return pygame.Rect(self.rect.centerx - (2 * self.rect.width * self.flip), self.rect.y, 2 * self.rect.width, self.rect.height)
+
+
+  def update_action(self, new_action):
+    #check if the new action is different to the previous one
+    if new_action != self.action:
+      self.action = new_action
+      #update the animation settings
+      self.frame_index = 0
+      self.update_tick = self.ticks
+
+
+  #full simulation state in a fixed order, for keyframes and rollback
+  def snapshot(self):
+    return (self.rect.x, self.rect.y, self.vel_y, self.flip, self.running, self.jump, self.attacking, self.attack_type,
+            self.attack_cooldown, self.hit, self.health, self.alive, self.action, self.frame_index, self.display_frame,
+            self.ticks, self.update_tick)
+
+
+  def restore(self, state):
+    (self.rect.x, self.rect.y, self.vel_y, self.flip, self.running, self.jump, self.attacking, self.attack_type,
+     self.attack_cooldown, self.hit, self.health, self.alive, self.action, self.frame_index, self.display_frame,
+     self.ticks, self.update_tick) = state
+
+
+  def pack(self):
+    return FIGHTER_STATE.pack(self.rect.x, self.rect.y, self.vel_y, self.flip, self.running, self.jump, self.attacking, self.attack_type,
+                              self.attack_cooldown, self.hit, self.health, self.alive, self.action, self.frame_index, self.display_frame,
+                              self.ticks, self.update_tick)
+
+
+  def unpack(self, data, offset=0):
+    self.restore(FIGHTER_STATE.unpack_from(data, offset))
+
+
+  def copy(self):
+    #same rules and state without running __init__; the rect is the only mutable part that needs its own copy
+    other = type(self).__new__(type(self))
+    for name in FighterSim.__slots__:
+      setattr(other, name, getattr(self, name))
+    #sprite data of subclasses is shared, not copied
+    if hasattr(self, "__dict__"):
+      other.__dict__.update(self.__dict__)
+    other.rect = self.rect.copy()
+    return other
+
+
+def pack_state(state):
+  #pack a Match.snapshot() tuple
+  return MATCH_STATE.pack(*state[:8]) + FIGHTER_STATE.pack(*state[8]) + FIGHTER_STATE.pack(*state[9])
+
+
+def unpack_state(data, offset=0):
+  #packed state back to a tuple Match.restore() accepts
+  fighter_offset = offset + MATCH_STATE.size
+  return MATCH_STATE.unpack_from(data, offset) + (FIGHTER_STATE.unpack_from(data, fighter_offset), FIGHTER_STATE.unpack_from(data, fighter_offset + FIGHTER_STATE.size))
+
+
+def make_sim_fighters(data_1=WARRIOR_DATA, data_2=WIZARD_DATA):
+  #the default warrior vs wizard line up without any sprites
+  fighter_1 = FighterSim(1, 200, 310, False, data_1, WARRIOR_ANIMATION_STEPS)
+  fighter_2 = FighterSim(2, 700, 310, True, data_2, WIZARD_ANIMATION_STEPS)
+  return fighter_1, fighter_2
+
+
+class Match():
+  #first to ROUNDS_TO_WIN rounds, with the countdown and knockout pause counted in ticks
+  def __init__(self, make_fighters=make_sim_fighters, screen_width=SCREEN_WIDTH, screen_height=SCREEN_HEIGHT, intro_count=INTRO_COUNT):
+    self.make_fighters = make_fighters
+    self.screen_width = screen_width
+    self.screen_height = screen_height
+    self.start_count = intro_count
+    self.score = [0, 0]#player scores. [P1, P2]
+    self.tick = 0
+    self.finished = False
+    self.new_round()
+
+
+  def new_round(self):
+    self.fighter_1, self.fighter_2 = self.make_fighters()
+    self.intro_count = self.start_count
+    self.intro_ticks = 0
+    self.round_over = False
+    self.round_over_ticks = 0
+
+
+  def step(self, input_1, input_2):
+    if self.finished:
+      return
+    self.tick += 1
+    #update countdown
+    if self.intro_count <= 0:
+      #move fighters
+      self.fighter_1.step(input_1, self.screen_width, self.screen_height, self.fighter_2, self.round_over)
+      self.fighter_2.step(input_2, self.screen_width, self.screen_height, self.fighter_1, self.round_over)
+    else:
+      self.intro_ticks += 1
+      if self.intro_ticks >= INTRO_TICKS:
+        self.intro_count -= 1
+        self.intro_ticks = 0
+
+    #update fighters
+    self.fighter_1.update()
+    self.fighter_2.update()
+
+    #check for player defeat
+    if self.round_over == False:
+      if self.fighter_1.alive == False:
+        self.score[1] += 1
+        self.round_over = True
+      elif self.fighter_2.alive == False:
+        self.score[0] += 1
+        self.round_over = True
+    else:
+      self.round_over_ticks += 1
+      if self.round_over_ticks > ROUND_OVER_TICKS:
+        if self.score[0] == ROUNDS_TO_WIN or self.score[1] == ROUNDS_TO_WIN:
+          self.finished = True
+        else:
+          self.new_round()
+
+
+  def snapshot(self):
+    return (self.tick, self.score[0], self.score[1], self.intro_count, self.intro_ticks, self.round_over,
+            self.round_over_ticks, self.finished, self.fighter_1.snapshot(), self.fighter_2.snapshot())
+
+
+  def restore(self, state):
+    (self.tick, score_1, score_2, self.intro_count, self.intro_ticks, self.round_over,
+     self.round_over_ticks, self.finished, fighter_1, fighter_2) = state
+    self.score = [score_1, score_2]
+    self.fighter_1.restore(fighter_1)
+    self.fighter_2.restore(fighter_2)
+
+
+  def pack(self):
+    return (MATCH_STATE.pack(self.tick, self.score[0], self.score[1], self.intro_count, self.intro_ticks, self.round_over,
+                             self.round_over_ticks, self.finished) + self.fighter_1.pack() + self.fighter_2.pack())
+
+
+  def unpack(self, data, offset=0):
+    (self.tick, score_1, score_2, self.intro_count, self.intro_ticks, self.round_over,
+     self.round_over_ticks, self.finished) = MATCH_STATE.unpack_from(data, offset)
+    self.score = [score_1, score_2]
+    offset += MATCH_STATE.size
+    self.fighter_1.unpack(data, offset)
+    self.fighter_2.unpack(data, offset + FIGHTER_STATE.size)
+
+
+  def checksum(self):
+    #equal on two machines exactly when their simulations agree, for desync detection
+    return zlib.crc32(self.pack())
+
+
+  def copy(self):
+    other = Match.__new__(Match)
+    other.__dict__.update(self.__dict__)
+    other.score = list(self.score)
+    other.fighter_1 = self.fighter_1.copy()
+    other.fighter_2 = self.fighter_2.copy()
+    return other
+
+
+  def winner(self):
+    #1 or 2 once the match is finished, otherwise None
+    if not self.finished:
+      return None
+    return 1 if self.score[0] > self.score[1] else 2
+
+
+def run_match(policy_1, policy_2, make_fighters=make_sim_fighters, max_ticks=60 * 60 * FPS, intro_count=INTRO_COUNT):
+  #play a whole match headless; a policy is called as policy(match, player) and returns the input bits for that tick
+  match = Match(make_fighters, intro_count=intro_count)
+  while not match.finished and match.tick < max_ticks:
+    match.step(policy_1(match, 1), policy_2(match, 2))
+  return match
@@ -0,0 +1,112 @@
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from blockchain import initialize_game_stellar_setup, set_channel_pool, load_channel_pool, create_and_fund_account, initialize_player_account, get_balance
+from account_store import get_store, PLAYER
+from leaderboard import Leaderboard
+
+logger = logging.getLogger(__name__)
+
+# Everything the game provisions at launch, run on threads while main.py draws
+# a loading screen. Steps start as soon as what they depend on is ready: on a
+# fresh install the player's account is funded by Friendbot while the issuer
+# and distributor are still being set up, and only its trustline and first
+# coins wait for the issuer. The guilds' accounts are not needed for the main
+# menu and are provisioned after it is up. Offline, only the leaderboard is
+# loaded and the Stellar SDK is never imported.
+
+
+class StartupPipeline:
+    """Starts provisioning on creation; the main menu can be shown once menu_ready() is True."""
+
+    def __init__(self, username, guilds, max_workers=6, offline=False):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="startup")
+        self.started = time.perf_counter()
+        self.timings = {}
+        self.deferred = []
+        if offline:
+            self.stellar = self.player = self.balance = None
+            self.leaderboard = self._submit("Leaderboard", Leaderboard)
+            self.steps = [("Leaderboard", self.leaderboard)]
+            return
+        self.stellar = self._submit("Stellar setup", self._setup_stellar)
+        self.player = self._submit("Player account", self._player_account, username)
+        self.balance = self._submit("Balance", self._balance)
+        self.leaderboard = self._submit("Leaderboard", Leaderboard)
+        self.steps = [("Stellar setup", self.stellar), ("Player account", self.player),
+                      ("Balance", self.balance), ("Leaderboard", self.leaderboard)]
+        # guild accounts need the issuer for their trustlines, and nothing needs them yet
+        self.stellar.add_done_callback(lambda future: self._defer_guilds(guilds))
+
+    def _submit(self, name, fn, *args):
+        def timed():
+            start = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                self.timings[name] = time.perf_counter() - start
+        return self.executor.submit(timed)
+
+    def _setup_stellar(self):
+        initialize_game_stellar_setup()
+        # spread reward issuance over channel accounts when they have been provisioned (see channels.py)
+        set_channel_pool(load_channel_pool())
+
+    def _player_account(self, username):
+        player_data = get_store().get(PLAYER, username)
+        if player_data:
+            return player_data
+        try:
+            account = create_and_fund_account()
+            if not account:
+                return None
+            self.stellar.result()
+            player_data = initialize_player_account(username, account)
+        except Exception as e:
+            logger.error(f"Failed to set up the account of {username}: {str(e)}")
+            return None
+        if player_data:
+            get_store().put(PLAYER, player_data)
+        return player_data
+
+    def _balance(self):
+        player_data = self.player.result()
+        if not player_data:
+            return None
+        try:
+            return get_balance(player_data["public_key"])
+        except Exception as e:
+            logger.error(f"Failed to fetch the starting balance: {str(e)}")
+            return None
+
+    def _defer_guilds(self, guilds):
+        for guild in guilds:
+            try:
+                self.deferred.append(self._submit(f"Guild {guild.name}", lambda guild=guild: guild.account))
+            except RuntimeError:
+                # the game closed before the issuer was ready
+                return
+
+    def menu_ready(self):
+        if all(future.done() for _, future in self.steps):
+            if "menu" not in self.timings:
+                self.timings["menu"] = time.perf_counter() - self.started
+                logger.info("Startup: " + ", ".join(f"{name} {seconds:.2f} s" for name, seconds in self.timings.items()))
+            return True
+        return False
+
+    def progress(self):
+        """(step name, state) for the loading screen."""
+        states = []
+        for name, future in self.steps:
+            if not future.done():
+                states.append((name, "..."))
+            elif future.exception() or future.result() is None and future is not self.stellar:
+                states.append((name, "failed"))
+            else:
+                states.append((name, "done"))
+        return states
+
+    def close(self):
+        """Drop whatever has not started yet; steps already running are left to finish."""
+        self.executor.shutdown(wait=False, cancel_futures=True)
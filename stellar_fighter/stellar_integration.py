@@ -1,9 +1,13 @@
 import json
-import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from stellar_sdk import Server, Keypair, Asset, TransactionBuilder, Network
+from stellar_sdk.client.requests_client import RequestsClient
 from stellar_sdk.exceptions import NotFoundError, BadResponseError, BadRequestError
 import requests
 import logging
+from account_store import get_store, PLAYER, GUILD
 
 # Set up logging
 logging.basicConfig(level=logging.INFO)
@@ -16,7 +20,134 @@ STELLAR_CONFIG = {
     "asset_code": "StellarToken"
 }
 
-server = Server(horizon_url=STELLAR_CONFIG["horizon_url"])
+# Stellar allows at most 100 operations but only 20 signatures in one transaction, and
+# every player in a batched collection signs for their own payment
+MAX_SIGNERS_PER_TRANSACTION = 20
+
+class HorizonClient:
+    """Shared Horizon client with keep-alive sessions, a cached base fee and locally tracked sequence numbers.
+
+    Once an account's sequence number is known, building and submitting a
+    transaction from it costs a single round trip to Horizon.
+    """
+
+    def __init__(self, horizon_url, pool_size=10, fee_ttl=30.0):
+        self.horizon_url = horizon_url
+        self.pool_size = pool_size
+        self._server = None
+        self.fee_ttl = fee_ttl
+        self._base_fee = None
+        self._base_fee_time = 0.0
+        self._accounts = {}
+        self._source_locks = {}
+        self._lock = threading.Lock()
+        self._stats = {}
+
+    @property
+    def server(self):
+        # the HTTP session is opened on the first call to Horizon, not when the module is imported
+        with self._lock:
+            if self._server is None:
+                self._server = Server(horizon_url=self.horizon_url, client=RequestsClient(pool_size=self.pool_size))
+            return self._server
+
+    def _timed(self, name, fn, *args):
+        start = time.perf_counter()
+        failed = False
+        try:
+            return fn(*args)
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stat = self._stats.setdefault(name, {"calls": 0, "errors": 0, "total": 0.0, "max": 0.0})
+                stat["calls"] += 1
+                stat["errors"] += failed
+                stat["total"] += elapsed
+                stat["max"] = max(stat["max"], elapsed)
+
+    def latency_stats(self):
+        """Per-call counters: number of calls, errors, and average/max latency in milliseconds."""
+        with self._lock:
+            return {
+                name: {
+                    "calls": stat["calls"],
+                    "errors": stat["errors"],
+                    "avg_ms": stat["total"] * 1000 / stat["calls"],
+                    "max_ms": stat["max"] * 1000
+                }
+                for name, stat in self._stats.items()
+            }
+
+    def account_info(self, account_id):
+        return self._timed("account_info", lambda: self.server.accounts().account_id(account_id).call())
+
+    def base_fee(self):
+        """Return the network base fee, fetched at most once per fee_ttl seconds."""
+        with self._lock:
+            if self._base_fee is not None and time.monotonic() - self._base_fee_time < self.fee_ttl:
+                return self._base_fee
+        fee = self._timed("fetch_base_fee", self.server.fetch_base_fee)
+        with self._lock:
+            self._base_fee = fee
+            self._base_fee_time = time.monotonic()
+        return fee
+
+    def source_lock(self, public_key):
+        """Lock that serializes transactions from one source account."""
+        with self._lock:
+            return self._source_locks.setdefault(public_key, threading.Lock())
+
+    def load_account(self, public_key):
+        """Return the account with its locally tracked sequence number, loading it on first use."""
+        with self._lock:
+            account = self._accounts.get(public_key)
+        if account is None:
+            account = self._timed("load_account", self.server.load_account, public_key)
+            with self._lock:
+                self._accounts[public_key] = account
+        return account
+
+    def forget_account(self, public_key):
+        """Drop the tracked sequence number so the next transaction reloads it from Horizon."""
+        with self._lock:
+            self._accounts.pop(public_key, None)
+
+    def submit(self, source, build_operations, signers=()):
+        """Build a transaction from source, let build_operations add its operations, sign and submit it.
+
+        Sequence numbers are advanced locally; if submission fails the account is
+        reloaded on its next use, since Horizon may or may not have consumed it.
+        """
+        with self.source_lock(source.public_key):
+            account = self.load_account(source.public_key)
+            builder = TransactionBuilder(
+                source_account=account,
+                network_passphrase=STELLAR_CONFIG["network"],
+                base_fee=self.base_fee(),
+            )
+            build_operations(builder)
+            transaction = builder.set_timeout(30).build()
+            transaction.sign(source)
+            for signer in signers:
+                transaction.sign(signer)
+            try:
+                return self._timed("submit_transaction", self.server.submit_transaction, transaction)
+            except Exception:
+                self.forget_account(source.public_key)
+                raise
+
+horizon = HorizonClient(STELLAR_CONFIG["horizon_url"])
+
+# optional channels.ChannelPool used as transaction sources for issuance
+channel_pool = None
+
+def set_channel_pool(pool):
+    """Route issuance through the given channel accounts, or straight from the issuer if pool is None."""
+    global channel_pool
+    channel_pool = pool
 
 def create_and_fund_account():
     """Create a new Stellar account and fund it using Friendbot."""
@@ -36,12 +167,15 @@ def create_and_fund_account():
 
 def setup_stellar_accounts():
     """Set up Stellar accounts with custom asset for the game."""
-    issuer = create_and_fund_account()
+    # the two Friendbot requests do not depend on each other
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        issuer_future = executor.submit(create_and_fund_account)
+        distributor_future = executor.submit(create_and_fund_account)
+        issuer, distributor = issuer_future.result(), distributor_future.result()
     if not issuer:
         logger.error("Failed to create issuer account. Aborting setup.")
         return None, None
 
-    distributor = create_and_fund_account()
     if not distributor:
         logger.error("Failed to create distributor account. Aborting setup.")
         return None, None
@@ -107,9 +241,9 @@ def initialize_game_stellar_setup():
     STELLAR_CONFIG["distribution_account_secret"] = distributor.secret
     logger.info("Stellar setup initialized successfully!")
 
-def create_guild_account(guild_name):
-    """Create a new Stellar account for a guild and fund it using Friendbot."""
-    account = create_and_fund_account()
+def create_guild_account(guild_name, account=None):
+    """Create a new Stellar account for a guild and fund it using Friendbot, unless a funded account is given."""
+    account = account or create_and_fund_account()
     if not account:
         logger.error(f"Failed to create and fund account for guild {guild_name}.")
         return None
@@ -128,25 +262,21 @@ def create_guild_account(guild_name):
         "public_key": account.public_key,
         "secret_key": account.secret
     }
-    with open(f"{guild_name}_stellar_data.json", 'w') as f:
-        json.dump(guild_data, f)
+    get_store().put(GUILD, guild_data)
     return account
 
 def load_or_create_guild_account(guild_name):
     """Load existing guild account or create a new one if it doesn't exist."""
-    guild_file = f"{guild_name}_stellar_data.json"
-    if os.path.exists(guild_file):
-        with open(guild_file, 'r') as f:
-            guild_data = json.load(f)
+    guild_data = get_store().get(GUILD, guild_name)
+    if guild_data:
         return Keypair.from_secret(guild_data["secret_key"])
     else:
         return create_guild_account(guild_name)
 
 def check_and_create_trustline(account, asset):
     """Check if the account has a trustline for the asset, and create one if it doesn't."""
-    server = Server(horizon_url=STELLAR_CONFIG["horizon_url"])
     try:
-        account_info = server.accounts().account_id(account.public_key).call()
+        account_info = horizon.account_info(account.public_key)
         for balance in account_info['balances']:
             if balance['asset_type'] != 'native' and balance['asset_code'] == asset.code and balance['asset_issuer'] == asset.issuer:
                 logger.info(f"Trustline already exists for account {account.public_key}")
@@ -172,29 +302,13 @@ def setup_smart_contract(player_account, guild_account, daily_amount):
         logger.error(f"Failed to set up trustline for guild account {guild_account.public_key}")
         return None
 
-    server = Server(horizon_url=STELLAR_CONFIG["horizon_url"])
-    player_stellar_account = server.load_account(player_account.public_key)
-
-    transaction = (
-        TransactionBuilder(
-            source_account=player_stellar_account,
-            network_passphrase=STELLAR_CONFIG["network"],
-            base_fee=server.fetch_base_fee(),
-        )
-        .append_payment_op(
+    try:
+        response = horizon.submit(player_account, lambda builder: builder.append_payment_op(
             destination=guild_account.public_key,
             asset=asset,
             amount=str(daily_amount),
             source=player_account.public_key,
-        )
-        .set_timeout(30)
-        .build()
-    )
-
-    transaction.sign(player_account)
-    
-    try:
-        response = server.submit_transaction(transaction)
+        ))
         logger.info(f"Smart contract set up successfully for daily transfer of {daily_amount} tokens.")
         return response
     except (NotFoundError, BadResponseError, BadRequestError) as e:
@@ -206,49 +320,71 @@ def execute_daily_transfer(player_account, guild_account, daily_amount):
     issuer = Keypair.from_secret(STELLAR_CONFIG["issuer_secret"])
     asset = Asset(STELLAR_CONFIG["asset_code"], issuer.public_key)
 
-    server = Server(horizon_url=STELLAR_CONFIG["horizon_url"])
-    player_stellar_account = server.load_account(player_account.public_key)
-
-    transaction = (
-        TransactionBuilder(
-            source_account=player_stellar_account,
-            network_passphrase=STELLAR_CONFIG["network"],
-            base_fee=server.fetch_base_fee(),
-        )
-        .append_payment_op(
+    try:
+        response = horizon.submit(player_account, lambda builder: builder.append_payment_op(
             destination=guild_account.public_key,
             asset=asset,
             amount=str(daily_amount),
             source=player_account.public_key,
-        )
-        .set_timeout(30)
-        .build()
-    )
-
-    transaction.sign(player_account)
-    
-    try:
-        response = server.submit_transaction(transaction)
+        ))
         logger.info(f"Daily transfer of {daily_amount} tokens executed successfully.")
         return response
     except (NotFoundError, BadResponseError, BadRequestError) as e:
         logger.error(f"Error executing daily transfer: {str(e)}")
         return None
 
+def execute_batch_transfer(player_accounts, guild_account, daily_amount):
+    """Execute the daily transfer for several players in a single multi-signed transaction.
+
+    The first player is the transaction source and every player signs for their own
+    payment operation, so batches for different players can be submitted in parallel.
+    """
+    issuer = Keypair.from_secret(STELLAR_CONFIG["issuer_secret"])
+    asset = Asset(STELLAR_CONFIG["asset_code"], issuer.public_key)
+
+    def add_payments(builder):
+        for player_account in player_accounts:
+            builder.append_payment_op(
+                destination=guild_account.public_key,
+                asset=asset,
+                amount=str(daily_amount),
+                source=player_account.public_key,
+            )
+
+    try:
+        response = horizon.submit(player_accounts[0], add_payments, signers=player_accounts[1:])
+        logger.info(f"Batched daily transfer of {daily_amount} tokens from {len(player_accounts)} players executed successfully.")
+        return response
+    except Exception as e:
+        # anything else, such as a transaction that cannot be built, only fails this batch and not the whole collection
+        logger.error(f"Error executing batched daily transfer: {str(e)}")
+        return None
+
+def _collect_batch(player_accounts, guild_account, daily_amount):
+    # a failed transaction fails every payment in it, so split the batch until the failing players are isolated
+    if execute_batch_transfer(player_accounts, guild_account, daily_amount):
+        return [True] * len(player_accounts)
+    if len(player_accounts) == 1:
+        return [False]
+    middle = len(player_accounts) // 2
+    return (_collect_batch(player_accounts[:middle], guild_account, daily_amount)
+            + _collect_batch(player_accounts[middle:], guild_account, daily_amount))
+
+def collect_daily_transfers(player_accounts, guild_account, daily_amount, max_workers=8):
+    """Collect the daily amount from every player, up to 20 payments per transaction, batches in parallel.
+
+    Returns one success flag per player account, in the order given.
+    """
+    batches = [player_accounts[i:i + MAX_SIGNERS_PER_TRANSACTION] for i in range(0, len(player_accounts), MAX_SIGNERS_PER_TRANSACTION)]
+    if not batches:
+        return []
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(batches))) as executor:
+        results = executor.map(lambda batch: _collect_batch(batch, guild_account, daily_amount), batches)
+        return [ok for batch_results in results for ok in batch_results]
+
 def create_trustline(account, asset):
     try:
-        transaction = (
-            TransactionBuilder(
-                source_account=server.load_account(account.public_key),
-                network_passphrase=STELLAR_CONFIG["network"],
-                base_fee=server.fetch_base_fee(),
-            )
-            .append_change_trust_op(asset=asset)
-            .set_timeout(30)
-            .build()
-        )
-        transaction.sign(account)
-        response = server.submit_transaction(transaction)
+        response = horizon.submit(account, lambda builder: builder.append_change_trust_op(asset=asset))
         logger.info(f"Trustline created successfully for account {account.public_key}")
         return response
     except (NotFoundError, BadResponseError, BadRequestError) as e:
@@ -259,18 +395,12 @@ def issue_asset(amount, destination, issuer):
     asset = Asset(STELLAR_CONFIG["asset_code"], issuer.public_key)
 
     try:
-        transaction = (
-            TransactionBuilder(
-                source_account=server.load_account(issuer.public_key),
-                network_passphrase=STELLAR_CONFIG["network"],
-                base_fee=server.fetch_base_fee(),
-            )
-            .append_payment_op(destination=destination, asset=asset, amount=str(amount))
-            .set_timeout(30)
-            .build()
-        )
-        transaction.sign(issuer)
-        response = server.submit_transaction(transaction)
+        if channel_pool:
+            # the channel is the transaction source, the issuer only signs the payment operation
+            with channel_pool.channel() as channel:
+                response = horizon.submit(channel, lambda builder: builder.append_payment_op(destination=destination, asset=asset, amount=str(amount), source=issuer.public_key), signers=[issuer])
+        else:
+            response = horizon.submit(issuer, lambda builder: builder.append_payment_op(destination=destination, asset=asset, amount=str(amount)))
         logger.info(f"Asset issued successfully: {amount} to {destination}")
         return response
     except (NotFoundError, BadResponseError, BadRequestError) as e:
@@ -279,7 +409,7 @@ def issue_asset(amount, destination, issuer):
 
 def get_balance(account_id):
     try:
-        account = server.accounts().account_id(account_id).call()
+        account = horizon.account_info(account_id)
         for balance in account['balances']:
             if balance['asset_type'] != 'native' and balance['asset_code'] == STELLAR_CONFIG["asset_code"]:
                 return float(balance['balance'])
@@ -288,8 +418,9 @@ def get_balance(account_id):
         logger.error(f"Account {account_id} not found when fetching balance.")
         return 0
 
-def initialize_player_account(username):
-    account = create_and_fund_account()
+def initialize_player_account(username, account=None):
+    # a funded account can be passed in when it was created ahead of the issuer being ready
+    account = account or create_and_fund_account()
     if not account:
         logger.error(f"Failed to initialize account for player {username}")
         return None
@@ -329,22 +460,22 @@ def update_player_coins(public_key, amount):
     return get_balance(public_key)
 
 def load_or_create_player_data(username):
-    player_file = f"{username}_stellar_data.json"
-    if os.path.exists(player_file):
-        with open(player_file, 'r') as f:
-            return json.load(f)
+    player_data = get_store().get(PLAYER, username)
+    if player_data:
+        return player_data
     else:
         player_data = initialize_player_account(username)
         if player_data:
-            with open(player_file, 'w') as f:
-                json.dump(player_data, f)
+            get_store().put(PLAYER, player_data)
             return player_data
         else:
             logger.error(f"Failed to initialize player data for {username}")
             return None
 
+def load_players(usernames):
+    """Stored data of many players in one bulk lookup, as {username: data}; players without an account are left out."""
+    return get_store().get_many(PLAYER, usernames)
+
 def save_player_data(player_data):
-    player_file = f"{player_data['username']}_stellar_data.json"
-    with open(player_file, 'w') as f:
-        json.dump(player_data, f)
+    get_store().put(PLAYER, player_data)
     logger.info(f"Player data saved for {player_data['username']}")
\ No newline at end of file
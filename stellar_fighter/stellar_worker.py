@@ -0,0 +1,54 @@
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+import pygame
+
+logger = logging.getLogger(__name__)
+
+# event posted to the pygame queue when a background Stellar job finishes
+STELLAR_RESULT = pygame.event.custom_type()
+
+
+class StellarWorker:
+    """Runs stellar_integration calls on a thread pool and reports back through pygame events.
+
+    Each finished job posts a STELLAR_RESULT event with the attributes
+    job (the name it was submitted under), tag, result and error.
+    """
+
+    def __init__(self, max_workers=4):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="stellar")
+        self.pending = {}
+        self._lock = threading.Lock()
+
+    def submit(self, job, fn, *args, tag=None):
+        """Queue fn(*args) to run off the main thread under the given job name."""
+        with self._lock:
+            self.pending[job] = self.pending.get(job, 0) + 1
+        future = self.executor.submit(fn, *args)
+        future.add_done_callback(lambda f: self._deliver(job, tag, f))
+        return future
+
+    def is_pending(self, job=None):
+        """True while a job with this name (or any job, if no name is given) is in flight."""
+        with self._lock:
+            if job is None:
+                return bool(self.pending)
+            return job in self.pending
+
+    def shutdown(self, wait=True):
+        """Stop accepting jobs; by default waits for payments already in flight."""
+        self.executor.shutdown(wait=wait)
+
+    def _deliver(self, job, tag, future):
+        error = future.exception()
+        result = None if error else future.result()
+        if error:
+            logger.error(f"Stellar job {job} failed: {str(error)}")
+        with self._lock:
+            self.pending[job] -= 1
+            if self.pending[job] == 0:
+                del self.pending[job]
+        # pygame.event.post is safe to call from other threads
+        if pygame.display.get_init():
+            pygame.event.post(pygame.event.Event(STELLAR_RESULT, job=job, tag=tag, result=result, error=error))
@@ -0,0 +1,64 @@
+from collections import OrderedDict
+
+# most labels never change, so rendered text is kept around between frames
+DEFAULT_MAX_ENTRIES = 256
+
+
+class TextCache:
+    """Bounded LRU cache of rendered text surfaces keyed by (font, text, colour, antialias)."""
+
+    def __init__(self, max_entries=DEFAULT_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def render(self, font, text, colour, antialias=True):
+        """Return the rendered surface for the text, rendering it only on a cache miss."""
+        key = (font, text, tuple(colour), antialias)
+        surface = self.entries.get(key)
+        if surface is not None:
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return surface
+
+        self.misses += 1
+        surface = font.render(text, antialias, colour)
+        self.entries[key] = surface
+        if len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+        return surface
+
+    def resize(self, max_entries):
+        """Change the cache size, evicting the least recently used entries if needed."""
+        self.max_entries = max_entries
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def info(self):
+        """Return hit/miss counters and the current size, for sizing the cache."""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "size": len(self.entries),
+            "max_entries": self.max_entries
+        }
+
+
+text_cache = TextCache()
+
+
+def render_text(font, text, colour, antialias=True):
+    """Render text through the shared cache."""
+    return text_cache.render(font, text, colour, antialias)
+
+
+def cache_info():
+    return text_cache.info()
@@ -0,0 +1,168 @@
+import argparse
+import json
+import os
+import random
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from simulation import FighterSim, run_match, WARRIOR_DATA, WIZARD_DATA, WARRIOR_ANIMATION_STEPS, WIZARD_ANIMATION_STEPS
+from bots import make_bot, BOTS
+
+# headless first-to-three matches between bots, spread over a process pool.
+# Results are appended to a tab separated file, one finished match per line:
+#   match id, player 1 entrant, player 2 entrant, player 1 rounds, player 2 rounds, ticks
+# so an interrupted tournament resumes by skipping the ids already in the file.
+
+RESULTS_FILE = "tournament_results.tsv"
+
+# an entrant is a bot plus optional fighter data and rule overrides for its fighter
+DEFAULT_ENTRANTS = [
+    {"name": "random", "bot": "random"},
+    {"name": "aggressive", "bot": "aggressive"},
+    {"name": "counter", "bot": "counter"},
+    {"name": "aggressive-fast", "bot": "aggressive", "rules": {"speed": 12}},
+    {"name": "counter-heavy", "bot": "counter", "rules": {"attack_damage": 12, "attack_cooldown_ticks": 26}}
+]
+
+RULES = ("speed", "gravity", "jump_velocity", "attack_damage", "attack_cooldown_ticks")
+# match ids are entrant names joined with this, so names may not contain it
+ID_SEPARATOR = ":"
+
+
+def check_entrants(entrants):
+    """Raise ValueError unless every name is unique and fits into match ids and the results file."""
+    names = set()
+    for entrant in entrants:
+        name = entrant["name"]
+        if any(character in name for character in (ID_SEPARATOR, "\t", "\n")):
+            raise ValueError(f"Entrant name {name!r} may not contain {ID_SEPARATOR!r}, tabs or newlines")
+        if name in names:
+            raise ValueError(f"Entrant name {name!r} is used more than once")
+        names.add(name)
+
+
+def make_fighter(entrant, player):
+    if player == 1:
+        fighter = FighterSim(1, 200, 310, False, entrant.get("data", WARRIOR_DATA), WARRIOR_ANIMATION_STEPS)
+    else:
+        fighter = FighterSim(2, 700, 310, True, entrant.get("data", WIZARD_DATA), WIZARD_ANIMATION_STEPS)
+    for rule, value in entrant.get("rules", {}).items():
+        if rule not in RULES:
+            raise ValueError(f"Unknown rule {rule} for entrant {entrant['name']}")
+        setattr(fighter, rule, value)
+    return fighter
+
+
+def play(job):
+    """Play one match in a worker process; job is (match id, entrant 1, entrant 2, seed)."""
+    match_id, entrant_1, entrant_2, seed = job
+    bot_1 = make_bot(entrant_1["bot"], seed)
+    bot_2 = make_bot(entrant_2["bot"], seed + 1)
+    match = run_match(bot_1, bot_2, lambda: (make_fighter(entrant_1, 1), make_fighter(entrant_2, 2)))
+    return match_id, entrant_1["name"], entrant_2["name"], match.score[0], match.score[1], match.tick
+
+
+def load_results(path):
+    """Return the finished matches in the results file, keyed by match id."""
+    results = {}
+    if not os.path.exists(path):
+        return results
+    with open(path, "r") as f:
+        for line in f:
+            fields = line.rstrip("\n").split("\t")
+            # a crash can leave a half written last line, which is simply played again
+            if not line.endswith("\n") or len(fields) != 6:
+                continue
+            match_id, name_1, name_2, score_1, score_2, ticks = fields
+            results[match_id] = (match_id, name_1, name_2, int(score_1), int(score_2), int(ticks))
+    return results
+
+
+def run_jobs(jobs, path, workers=None):
+    """Play every job not yet in the results file, appending results as matches finish."""
+    results = load_results(path)
+    todo = [job for job in jobs if job[0] not in results]
+    if todo:
+        # drop a torn last line so new results start on a line of their own
+        if os.path.exists(path):
+            with open(path, "rb+") as f:
+                data = f.read()
+                if data and not data.endswith(b"\n"):
+                    f.truncate(data.rfind(b"\n") + 1)
+        with open(path, "a") as f, ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(play, job) for job in todo]
+            for future in as_completed(futures):
+                result = future.result()
+                f.write("\t".join(str(field) for field in result) + "\n")
+                f.flush()
+                results[result[0]] = result
+    return [results[job[0]] for job in jobs]
+
+
+def round_robin(entrants, games, path=RESULTS_FILE, workers=None, seed=0):
+    """Every entrant plays every other one games times on each side."""
+    check_entrants(entrants)
+    rng = random.Random(seed)
+    jobs = []
+    for i, entrant_1 in enumerate(entrants):
+        for j, entrant_2 in enumerate(entrants):
+            if i == j:
+                continue
+            for game in range(games):
+                match_id = ID_SEPARATOR.join(("rr", entrant_1["name"], entrant_2["name"], str(game)))
+                jobs.append((match_id, entrant_1, entrant_2, rng.getrandbits(31)))
+    return run_jobs(jobs, path, workers)
+
+
+def bracket(entrants, path=RESULTS_FILE, workers=None, seed=0):
+    """Single elimination in seeding order; odd entrants get a bye. Returns the champion's name."""
+    check_entrants(entrants)
+    rng = random.Random(seed)
+    alive = list(entrants)
+    round_number = 0
+    while len(alive) > 1:
+        round_number += 1
+        pairs = [(alive[i], alive[i + 1]) for i in range(0, len(alive) - 1, 2)]
+        jobs = [(ID_SEPARATOR.join(("br", str(round_number), str(k), a["name"], b["name"])), a, b, rng.getrandbits(31)) for k, (a, b) in enumerate(pairs)]
+        winners = []
+        for (a, b), result in zip(pairs, run_jobs(jobs, path, workers)):
+            winners.append(a if result[3] > result[4] else b)
+        if len(alive) % 2:
+            winners.append(alive[-1])
+        alive = winners
+    return alive[0]["name"] if alive else None
+
+
+def standings(results):
+    """Wins, losses and rounds won per entrant, best first."""
+    table = {}
+    for _, name_1, name_2, score_1, score_2, _ in results:
+        for name, won, rounds in ((name_1, score_1 > score_2, score_1), (name_2, score_2 > score_1, score_2)):
+            row = table.setdefault(name, {"wins": 0, "losses": 0, "rounds": 0})
+            row["wins" if won else "losses"] += 1
+            row["rounds"] += rounds
+    return sorted(table.items(), key=lambda item: (item[1]["wins"], item[1]["rounds"]), reverse=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run bot tournaments on the headless simulation")
+    parser.add_argument("format", choices=["round-robin", "bracket"])
+    parser.add_argument("--entrants", help="JSON file with a list of entrants (default: built in line up)")
+    parser.add_argument("--games", type=int, default=2, help="round robin games per pairing and side")
+    parser.add_argument("--results", default=RESULTS_FILE)
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: one per core)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    entrants = DEFAULT_ENTRANTS
+    if args.entrants:
+        with open(args.entrants, "r") as f:
+            entrants = json.load(f)
+    for entrant in entrants:
+        if entrant["bot"] not in BOTS:
+            parser.error(f"unknown bot {entrant['bot']}, choose from {', '.join(BOTS)}")
+
+    if args.format == "round-robin":
+        results = round_robin(entrants, args.games, args.results, args.workers, args.seed)
+        for name, row in standings(results):
+            print(f"{name:<20} {row['wins']:4} W {row['losses']:4} L {row['rounds']:5} rounds")
+    else:
+        print(f"Champion: {bracket(entrants, args.results, args.workers, args.seed)}")